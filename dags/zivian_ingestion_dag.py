@@ -1,21 +1,41 @@
 from airflow import DAG
-from airflow.operators.python import PythonOperator
+from airflow.decorators import task, task_group
+from airflow.operators.python import PythonOperator, get_current_context
 from datetime import datetime, timedelta
+from itertools import product
 import sys
 import os
 
 # Add project root to path so we can import our services
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from services.extract.extract_encounters import generate_encounters, save_to_bronze
+from services.db.engine import get_engine
+from services.extract.extract_encounters import (
+    TENANT, EHR_SOURCE, generate_encounters, partition_name_for, save_to_bronze
+)
 from services.transform.transform_encounters import (
-    get_db_engine, create_silver_table,
-    read_latest_bronze_file, transform_data, load_to_silver
+    TRANSFORM_ENGINE, create_silver_table, create_watermark_table,
+    create_processed_partitions_table, load_partition_to_silver
 )
+from services.transform.elt_encounters import load_to_silver_in_database
 from services.sampling.sampling_encounters import (
-    create_gold_table, read_from_silver,
-    deterministic_sampling, load_to_gold
+    SAMPLE_RATE, create_gold_table, create_gold_summary_table, sample_to_gold
 )
+from services.pipeline.streaming_pipeline import stream_to_gold
+from services.metrics.stage_metrics import metrics_context
+
+# Tenants × EHR sources to ingest (comma-separated); every pair gets its
+# own extract → transform → sample chain, mapped at run time
+PIPELINE_TENANTS = [t.strip() for t in os.getenv("PIPELINE_TENANTS", TENANT).split(",") if t.strip()]
+PIPELINE_EHR_SOURCES = [
+    s.strip() for s in os.getenv("PIPELINE_EHR_SOURCES", EHR_SOURCE).split(",") if s.strip()
+]
+# Sources processed at once per stage (the LocalExecutor's parallelism caps the total)
+PIPELINE_MAX_PARALLEL = int(os.getenv("PIPELINE_MAX_PARALLEL", "4"))
+EXTRACT_RECORDS = int(os.getenv("EXTRACT_RECORDS", "1000"))
+# staged    = extract → transform → sample tasks, handing off through bronze and silver
+# streaming = one task per source pipes records straight through to gold
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "staged")
 
 # -------------------------------------------------------
 # DAG Default Arguments
@@ -29,36 +49,104 @@ default_args = {
     "retry_delay": timedelta(minutes=2),
 }
 
+
+def task_metrics_context(**tags):
+    """metrics_context tagged with the DAG run the current task executes for."""
+    return metrics_context(run_id=get_current_context()["run_id"], **tags)
+
+
+def pipeline_sources():
+    """One {"tenant", "ehr_source"} dict per configured pair."""
+    return [
+        {"tenant": tenant, "ehr_source": ehr_source}
+        for tenant, ehr_source in product(PIPELINE_TENANTS, PIPELINE_EHR_SOURCES)
+    ]
+
 # -------------------------------------------------------
 # Task Functions
 # -------------------------------------------------------
-def run_extraction():
-    print("[DAG] Starting Encounter Extraction...")
-    encounters = generate_encounters(num_records=1000)
-    save_to_bronze(encounters)
+def prepare_tables():
+    # Once, before the fan-out, so mapped tasks never race on DDL
+    print("[DAG] Preparing pipeline tables...")
+    engine = get_engine()
+    create_silver_table(engine)
+    create_watermark_table(engine)
+    create_processed_partitions_table(engine)
+    create_gold_table(engine)
+    create_gold_summary_table(engine)
+
+
+@task(task_id="extract_encounters", max_active_tis_per_dagrun=PIPELINE_MAX_PARALLEL)
+def run_extraction(source, data_interval_start=None):
+    # The bronze folder is named after the run's data interval, so a retry
+    # (or a cleared rerun) rewrites the same partition instead of adding one
+    print(f"[DAG] Starting Encounter Extraction for {source['tenant']}/{source['ehr_source']}...")
+    with task_metrics_context(**source):
+        encounters = generate_encounters(
+            num_records=EXTRACT_RECORDS, ehr_source=source["ehr_source"]
+        )
+        file_path = save_to_bronze(
+            encounters, tenant=source["tenant"], ehr_source=source["ehr_source"],
+            partition=partition_name_for(data_interval_start)
+        )
     print("[DAG] Extraction complete!")
+    # Handed to the transform through XCom — it never guesses the "latest" folder
+    return dict(source, partition_path=os.path.dirname(file_path))
 
 
-def run_transformation():
-    print("[DAG] Starting Silver Layer Transformation...")
-    engine = get_db_engine()
-    create_silver_table(engine)
-    df_raw = read_latest_bronze_file()
-    df_clean = transform_data(df_raw)
-    load_to_silver(df_clean, engine)
+@task(task_id="transform_to_silver", max_active_tis_per_dagrun=PIPELINE_MAX_PARALLEL)
+def run_transformation(bronze):
+    print(f"[DAG] Starting Silver Layer Transformation of {bronze['partition_path']}...")
+    engine = get_engine()
+    with task_metrics_context(tenant=bronze["tenant"], ehr_source=bronze["ehr_source"]):
+        if TRANSFORM_ENGINE == "postgres":
+            load_to_silver_in_database(
+                engine, [os.path.basename(bronze["partition_path"])], mode="incremental",
+                tenant=bronze["tenant"], ehr_source=bronze["ehr_source"]
+            )
+        else:
+            load_partition_to_silver(
+                engine, bronze["partition_path"], bronze["tenant"], bronze["ehr_source"]
+            )
     print("[DAG] Transformation complete!")
+    return {"tenant": bronze["tenant"], "ehr_source": bronze["ehr_source"]}
 
 
-def run_sampling():
-    print("[DAG] Starting Gold Layer Sampling...")
-    engine = get_db_engine()
-    create_gold_table(engine)
-    df_silver = read_from_silver(engine)
-    df_sampled = deterministic_sampling(df_silver, sample_rate=0.10)
-    load_to_gold(df_sampled, engine)
+@task(task_id="sample_to_gold", max_active_tis_per_dagrun=PIPELINE_MAX_PARALLEL)
+def run_sampling(source):
+    print(f"[DAG] Starting Gold Layer Sampling for {source['tenant']}/{source['ehr_source']}...")
+    with task_metrics_context(**source):
+        sample_to_gold(
+            get_engine(), sample_rate=SAMPLE_RATE,
+            tenant=source["tenant"], ehr_source=source["ehr_source"]
+        )
     print("[DAG] Sampling complete!")
 
 
+@task(task_id="stream_to_gold", max_active_tis_per_dagrun=PIPELINE_MAX_PARALLEL)
+def run_streaming(source, data_interval_start=None):
+    # Same bronze partition, silver and gold rows as the three staged tasks;
+    # a retry redoes the whole source, which the partition name makes safe
+    print(f"[DAG] Streaming {source['tenant']}/{source['ehr_source']} through to Gold...")
+    with task_metrics_context(**source):
+        stream_to_gold(
+            get_engine(), num_records=EXTRACT_RECORDS,
+            tenant=source["tenant"], ehr_source=source["ehr_source"],
+            partition=partition_name_for(data_interval_start)
+        )
+    print("[DAG] Streaming complete!")
+
+
+@task_group(group_id="ingest_source")
+def ingest_source(source):
+    # Mapped per source: each chain only waits on its own upstream task, so
+    # a slow or failed source holds up (or fails) nothing but itself
+    if PIPELINE_MODE == "streaming":
+        run_streaming(source)
+    else:
+        run_sampling(run_transformation(run_extraction(source)))
+
+
 # -------------------------------------------------------
 # DAG Definition
 # -------------------------------------------------------
@@ -72,23 +160,14 @@ with DAG(
     tags=["zivian", "etl", "healthcare"],
 ) as dag:
 
-    # Task 1: Extract
-    extract_task = PythonOperator(
-        task_id="extract_encounters",
-        python_callable=run_extraction,
-    )
-
-    # Task 2: Transform
-    transform_task = PythonOperator(
-        task_id="transform_to_silver",
-        python_callable=run_transformation,
+    # Task 0: Create / repair the pipeline tables
+    prepare_task = PythonOperator(
+        task_id="prepare_tables",
+        python_callable=prepare_tables,
     )
 
-    # Task 3: Sample
-    sampling_task = PythonOperator(
-        task_id="sample_to_gold",
-        python_callable=run_sampling,
-    )
+    # Tasks 1-3: Extract → Transform → Sample (or one streaming task),
+    # once per tenant × EHR source
+    ingest_tasks = ingest_source.expand(source=pipeline_sources())
 
-    # Define order: Extract → Transform → Sample
-    extract_task >> transform_task >> sampling_task
\ No newline at end of file
+    prepare_task >> ingest_tasks
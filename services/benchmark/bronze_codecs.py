@@ -0,0 +1,78 @@
+import os
+import sys
+import tempfile
+import time
+from dotenv import load_dotenv
+
+# Add project root to path so the benchmark can also run as a plain script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from services.bronze.bronze_files import iter_bronze_file, write_bronze_file
+from services.extract.extract_encounters import generate_encounters
+from services.transform.transform_encounters import (
+    BRONZE_CHUNK_SIZE, clean_encounters
+)
+
+load_dotenv()
+
+BENCH_RECORDS = int(os.getenv("BENCH_RECORDS", "100000"))
+
+# (format, compression) pairs to compare
+BRONZE_CODECS = [
+    ("ndjson", "none"),
+    ("ndjson", "gzip"),
+    ("ndjson", "zstd"),
+    ("parquet", "none"),    # snappy
+    ("parquet", "zstd"),
+]
+
+
+def benchmark_codec(encounters, work_dir, fmt, compression, level=None):
+    """Write one bronze file and time the read + transform pass over it."""
+    bronze_path = os.path.join(work_dir, f"{fmt}-{compression}")
+    os.makedirs(bronze_path)
+
+    started = time.perf_counter()
+    file_path, _ = write_bronze_file(encounters, bronze_path, fmt, compression, level)
+    write_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    seen_ids = set()
+    clean_rows = 0
+    for df in iter_bronze_file(file_path, BRONZE_CHUNK_SIZE):
+        df_clean, _ = clean_encounters(df, seen_ids)
+        clean_rows += len(df_clean)
+    transform_seconds = time.perf_counter() - started
+
+    return {
+        "codec": f"{fmt}/{compression}",
+        "bytes": os.path.getsize(file_path),
+        "write_seconds": round(write_seconds, 3),
+        "transform_seconds": round(transform_seconds, 3),
+        "clean_rows": clean_rows,
+    }
+
+
+def run_codec_benchmark(num_records=BENCH_RECORDS, level=None):
+    """Compare bytes on disk and read + transform time for every bronze codec."""
+    encounters = generate_encounters(num_records=num_records)
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for fmt, compression in BRONZE_CODECS:
+            results.append(benchmark_codec(encounters, work_dir, fmt, compression, level))
+
+    baseline = results[0]
+    print(f"\n{'codec':<16}{'bytes':>14}{'ratio':>8}{'write s':>10}{'transform s':>13}")
+    print("-" * 61)
+    for r in results:
+        ratio = round(baseline["bytes"] / r["bytes"], 1)
+        print(f"{r['codec']:<16}{r['bytes']:>14,}{ratio:>7}x"
+              f"{r['write_seconds']:>10}{r['transform_seconds']:>13}")
+    return results
+
+
+if __name__ == "__main__":
+    print("=" * 61)
+    print("BRONZE CODEC BENCHMARK")
+    print("=" * 61)
+    run_codec_benchmark()
@@ -0,0 +1,261 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+
+# Add project root to path so the benchmark can also run as a plain script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+load_dotenv()
+
+# Bronze goes to a scratch folder so benchmark partitions never mix with real
+# ones; this must be set before the stage modules read their settings
+BENCH_BRONZE_PATH = os.getenv("BENCH_BRONZE_PATH") or tempfile.mkdtemp(prefix="zivian-bench-")
+os.environ["BRONZE_BASE_PATH"] = BENCH_BRONZE_PATH
+
+# Every run rebuilds silver and gold, so the stages run against a separate
+# database — created on first use — never the pipeline's own
+PIPELINE_DB_NAME = os.getenv("DB_NAME", "zivian_db")
+BENCH_DB_NAME = os.getenv("BENCH_DB_NAME", "zivian_bench")
+os.environ["DB_NAME"] = BENCH_DB_NAME
+
+from services.extract.extract_encounters import generate_encounters, save_to_bronze
+from services.extract.synthetic_encounters import generate_to_bronze
+from services.transform.transform_encounters import (
+    TRANSFORM_ENGINE, BRONZE_CHUNK_SIZE, create_silver_table,
+    iter_latest_bronze_chunks, transform_chunks, load_to_silver
+)
+from services.transform.elt_encounters import run_in_database_transform
+from services.sampling.sampling_encounters import (
+    SAMPLE_RATE, SAMPLING_ENGINE, create_gold_table, create_gold_summary_table,
+    sample_to_gold
+)
+from services.bronze.bronze_files import BRONZE_FORMAT, BRONZE_COMPRESSION
+from services.db.bulk_load import LOAD_METHOD, COPY_FORMAT
+from services.db.engine import DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, get_engine
+
+BENCH_SIZES = [int(n) for n in os.getenv("BENCH_SIZES", "1000,100000,1000000,10000000").split(",")]
+# Above this size extraction uses the sharded generator instead of
+# generate_encounters, which holds every record in memory
+BENCH_SHARDED_ABOVE = int(os.getenv("BENCH_SHARDED_ABOVE", "1000000"))
+BENCH_REPORT_DIR = os.getenv("BENCH_REPORT_DIR", "./bench_results")
+# A stage more than this much slower than the baseline counts as a regression
+BENCH_TOLERANCE = float(os.getenv("BENCH_TOLERANCE", "0.10"))
+
+RSS_SAMPLE_SECONDS = 0.05
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss_bytes():
+    """Resident set size of this process (Linux /proc, else lifetime peak)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        # ru_maxrss is KiB on Linux, bytes on macOS — and a lifetime peak
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+@contextmanager
+def measure_stage(results, stage, rows=None):
+    """
+    Time a pipeline stage and sample its peak RSS from a background thread.
+    Yields a dict the stage can fill in (e.g. "rows" once it is known);
+    the finished measurement is appended to results.
+    """
+    record = {"stage": stage, "rows": rows}
+    peak = [current_rss_bytes()]
+    done = threading.Event()
+
+    def sample_rss():
+        while not done.wait(RSS_SAMPLE_SECONDS):
+            peak[0] = max(peak[0], current_rss_bytes())
+
+    sampler = threading.Thread(target=sample_rss, daemon=True)
+    sampler.start()
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        seconds = time.perf_counter() - started
+        done.set()
+        sampler.join()
+        peak[0] = max(peak[0], current_rss_bytes())
+        rows = record["rows"] or 0
+        record.update({
+            "seconds": round(seconds, 3),
+            "rows_per_sec": int(rows / seconds) if seconds > 0 else 0,
+            "peak_rss_mb": round(peak[0] / (1024 * 1024), 1),
+        })
+        results.append(record)
+        print(f"[BENCH] {stage:<16} {rows:>10} rows  {record['seconds']:>9}s  "
+              f"{record['rows_per_sec']:>9} rows/sec  {record['peak_rss_mb']:>8} MB peak RSS")
+
+
+def ensure_bench_database():
+    """Create BENCH_DB_NAME if it is missing; refuse to use the pipeline's database."""
+    if BENCH_DB_NAME == PIPELINE_DB_NAME:
+        raise ValueError(
+            f"BENCH_DB_NAME is the pipeline database ({PIPELINE_DB_NAME}) — "
+            "the benchmark wipes silver and gold, point it at another database"
+        )
+    # CREATE DATABASE can't run in a transaction, or from the database itself
+    maintenance = create_engine(
+        f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/postgres",
+        isolation_level="AUTOCOMMIT",
+    )
+    try:
+        with maintenance.connect() as conn:
+            exists = conn.execute(
+                text("SELECT 1 FROM pg_database WHERE datname = :name"),
+                {"name": BENCH_DB_NAME}
+            ).scalar()
+            if not exists:
+                conn.execute(text(f'CREATE DATABASE "{BENCH_DB_NAME}"'))
+                print(f"[BENCH] Created database {BENCH_DB_NAME}")
+    finally:
+        maintenance.dispose()
+
+
+def run_size(engine, size):
+    """Run extract → transform → sample once for size records."""
+    print(f"\n[BENCH] ---- {size} encounters ----")
+    shutil.rmtree(BENCH_BRONZE_PATH, ignore_errors=True)
+    stages = []
+
+    with measure_stage(stages, "extract", rows=size):
+        if size > BENCH_SHARDED_ABOVE:
+            generate_to_bronze(num_records=size)
+        else:
+            save_to_bronze(generate_encounters(num_records=size))
+
+    with measure_stage(stages, "transform+load") as record:
+        if TRANSFORM_ENGINE == "postgres":
+            record["rows"] = run_in_database_transform(engine, mode="replace")
+        else:
+            stats = load_to_silver(transform_chunks(iter_latest_bronze_chunks()), engine)
+            record["rows"] = stats["rows"]
+
+    # Silver is streamed into gold, so read, sampling and load are one stage
+    with measure_stage(stages, "sample_to_gold") as record:
+        record["rows"] = sample_to_gold(engine, sample_rate=SAMPLE_RATE)["rows"]
+
+    return {"size": size, "stages": stages}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_benchmark(sizes=None):
+    """Benchmark every size and return the report dict."""
+    sizes = sizes or BENCH_SIZES
+    ensure_bench_database()
+    engine = get_engine()
+    print(f"[BENCH] Using database {BENCH_DB_NAME}")
+    create_silver_table(engine)
+    create_gold_table(engine)
+    create_gold_summary_table(engine)
+
+    try:
+        results = [run_size(engine, size) for size in sizes]
+    finally:
+        if not os.getenv("BENCH_BRONZE_PATH"):
+            shutil.rmtree(BENCH_BRONZE_PATH, ignore_errors=True)
+
+    return {
+        "commit": git_commit(),
+        "created_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "settings": {
+            "TRANSFORM_ENGINE": TRANSFORM_ENGINE,
+            "LOAD_METHOD": LOAD_METHOD,
+            "COPY_FORMAT": COPY_FORMAT,
+            "BRONZE_FORMAT": BRONZE_FORMAT,
+            "BRONZE_COMPRESSION": BRONZE_COMPRESSION,
+            "BRONZE_CHUNK_SIZE": BRONZE_CHUNK_SIZE,
+            "SAMPLE_RATE": SAMPLE_RATE,
+            "SAMPLING_ENGINE": SAMPLING_ENGINE,
+        },
+        "results": results,
+    }
+
+
+def write_report(report, report_dir=BENCH_REPORT_DIR):
+    os.makedirs(report_dir, exist_ok=True)
+    stamp = datetime.utcnow().strftime("%Y-%m-%dT%H-%M-%S")
+    path = os.path.join(report_dir, f"pipeline-{report['commit']}-{stamp}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n[BENCH] Report written to {path}")
+    return path
+
+
+def compare_reports(baseline, current, tolerance=BENCH_TOLERANCE):
+    """
+    Compare rows/sec per (size, stage) against a baseline report.
+    Returns the list of regressions slower than the tolerance.
+    """
+    baseline_rates = {
+        (r["size"], s["stage"]): s["rows_per_sec"]
+        for r in baseline["results"] for s in r["stages"]
+    }
+    regressions = []
+    print(f"\n[BENCH] Compared with {baseline['commit']} (tolerance {tolerance:.0%}):")
+    for result in current["results"]:
+        for stage in result["stages"]:
+            key = (result["size"], stage["stage"])
+            before = baseline_rates.get(key)
+            if not before:
+                continue
+            change = stage["rows_per_sec"] / before - 1
+            flag = ""
+            if change < -tolerance:
+                flag = "  << REGRESSION"
+                regressions.append({"size": key[0], "stage": key[1], "change": round(change, 3)})
+            print(f"[BENCH] {key[0]:>10} {key[1]:<16} {before:>9} → "
+                  f"{stage['rows_per_sec']:>9} rows/sec ({change:+.1%}){flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end pipeline benchmark")
+    parser.add_argument("--sizes", help="comma-separated record counts, e.g. 1000,100000")
+    parser.add_argument("--compare", help="baseline report JSON to compare against")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("PIPELINE BENCHMARK STARTED")
+    print("=" * 60)
+
+    sizes = [int(n) for n in args.sizes.split(",")] if args.sizes else None
+    report = run_benchmark(sizes)
+    write_report(report)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_reports(json.load(f), report)
+        if regressions:
+            print(f"\n[BENCH] {len(regressions)} stage(s) regressed")
+            sys.exit(1)
+
+    print("\n" + "=" * 60)
+    print("PIPELINE BENCHMARK COMPLETED")
+    print("=" * 60)
@@ -0,0 +1,320 @@
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+from contextlib import closing
+from datetime import datetime
+from dotenv import load_dotenv
+
+# Add project root to path so the catalog can also be rebuilt as a plain script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from services.bronze.bronze_files import find_bronze_files, iter_bronze_file
+
+load_dotenv()
+
+BRONZE_BASE_PATH = os.getenv("BRONZE_BASE_PATH", "./bronze")
+ENVIRONMENT = os.getenv("ENVIRONMENT", "dev")
+# SQLite manifest of every bronze partition: the transform picks its work
+# here instead of listing (and opening) partition folders
+BRONZE_CATALOG_PATH = os.getenv(
+    "BRONZE_CATALOG_PATH", os.path.join(BRONZE_BASE_PATH, "_catalog.sqlite")
+)
+# Seconds a writer waits for another process's catalog write to finish
+BRONZE_CATALOG_TIMEOUT = float(os.getenv("BRONZE_CATALOG_TIMEOUT", "30"))
+
+STATUS_REGISTERED = "registered"
+STATUS_PROCESSED = "processed"
+
+CATALOG_DDL = """
+    CREATE TABLE IF NOT EXISTS bronze_partitions (
+        tenant                  TEXT NOT NULL,
+        environment             TEXT NOT NULL,
+        ehr_source              TEXT NOT NULL,
+        partition               TEXT NOT NULL,
+        path                    TEXT NOT NULL,
+        files                   TEXT NOT NULL,
+        record_count            INTEGER NOT NULL,
+        byte_size               INTEGER NOT NULL,
+        checksum                TEXT NOT NULL,
+        min_date_of_service     TEXT,
+        max_date_of_service     TEXT,
+        min_ingestion_timestamp TEXT,
+        max_ingestion_timestamp TEXT,
+        bad_lines               INTEGER NOT NULL DEFAULT 0,
+        status                  TEXT NOT NULL DEFAULT 'registered',
+        registered_at           TEXT NOT NULL,
+        processed_at            TEXT,
+        PRIMARY KEY (tenant, environment, ehr_source, partition)
+    );
+    -- Sources whose pre-existing folders have been synced into the catalog
+    CREATE TABLE IF NOT EXISTS bronze_synced_sources (
+        tenant      TEXT NOT NULL,
+        environment TEXT NOT NULL,
+        ehr_source  TEXT NOT NULL,
+        synced_at   TEXT NOT NULL,
+        PRIMARY KEY (tenant, environment, ehr_source)
+    );
+"""
+
+# Stats columns filled while records are written (or scanned)
+STATS_FIELDS = [
+    "record_count", "min_date_of_service", "max_date_of_service",
+    "min_ingestion_timestamp", "max_ingestion_timestamp", "bad_lines"
+]
+# Columns added after the first catalogs were created: (name, definition)
+ADDED_COLUMNS = [
+    ("bad_lines", "INTEGER NOT NULL DEFAULT 0"),
+]
+
+
+def open_catalog(path=None):
+    """Connection to the catalog database, created on first use."""
+    path = path or BRONZE_CATALOG_PATH
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=BRONZE_CATALOG_TIMEOUT)
+    conn.row_factory = sqlite3.Row
+    # WAL: readers never block the (one at a time) writers
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(CATALOG_DDL)
+    existing = {row["name"] for row in conn.execute("PRAGMA table_info(bronze_partitions)")}
+    for name, definition in ADDED_COLUMNS:
+        if name not in existing:
+            conn.execute(f"ALTER TABLE bronze_partitions ADD COLUMN {name} {definition}")
+    return conn
+
+
+def new_partition_stats():
+    return dict(dict.fromkeys(STATS_FIELDS), record_count=0, bad_lines=0)
+
+
+def _widen(stats, field, value):
+    """Fold value into the min_/max_ pair of field (ISO strings sort as dates)."""
+    if value is None:
+        return
+    value = str(value)
+    low, high = f"min_{field}", f"max_{field}"
+    if stats[low] is None or value < stats[low]:
+        stats[low] = value
+    if stats[high] is None or value > stats[high]:
+        stats[high] = value
+
+
+def track_records(records, stats):
+    """
+    Pass records through unchanged while counting them and widening the
+    date_of_service / ingestion_timestamp ranges in stats, so a writer
+    gets the catalog entry's stats without a second pass over the file.
+    """
+    for record in records:
+        stats["record_count"] += 1
+        _widen(stats, "date_of_service", record.get("date_of_service"))
+        _widen(stats, "ingestion_timestamp", record.get("ingestion_timestamp"))
+        yield record
+
+
+def merge_partition_stats(stats_list):
+    """Combine the stats of several part files into one partition's stats."""
+    merged = new_partition_stats()
+    for stats in stats_list:
+        merged["record_count"] += stats["record_count"]
+        merged["bad_lines"] += stats.get("bad_lines", 0)
+        for field in ("date_of_service", "ingestion_timestamp"):
+            _widen(merged, field, stats[f"min_{field}"])
+            _widen(merged, field, stats[f"max_{field}"])
+    return merged
+
+
+def scan_partition_stats(partition_path):
+    """Stats of an already-written partition — reads every record."""
+    stats = new_partition_stats()
+    columns = ["date_of_service", "ingestion_timestamp"]
+    for file_path in find_bronze_files(partition_path):
+        for chunk in iter_bronze_file(file_path, 50000, columns=columns, bad_lines=stats):
+            stats["record_count"] += len(chunk)
+            for field in columns:
+                values = chunk[field].dropna().astype(str)
+                if not values.empty:
+                    _widen(stats, field, values.min())
+                    _widen(stats, field, values.max())
+    return stats
+
+
+def file_checksum(file_paths):
+    """(sha256 over the files' bytes in order, total byte size)."""
+    digest = hashlib.sha256()
+    byte_size = 0
+    for file_path in file_paths:
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+                byte_size += len(block)
+    return digest.hexdigest(), byte_size
+
+
+def register_partition(partition_path, tenant, ehr_source, stats, environment=None):
+    """
+    Record a freshly written bronze partition. Re-registering a partition
+    (a rerun rewrote its folder) replaces the entry and resets it to
+    'registered', so the new content gets processed again.
+    """
+    file_paths = find_bronze_files(partition_path)
+    checksum, byte_size = file_checksum(file_paths)
+    entry = dict(
+        stats,
+        tenant=tenant,
+        environment=environment or ENVIRONMENT,
+        ehr_source=ehr_source,
+        partition=os.path.basename(os.path.normpath(partition_path)),
+        path=partition_path,
+        files=json.dumps([os.path.basename(p) for p in file_paths]),
+        byte_size=byte_size,
+        checksum=checksum,
+        status=STATUS_REGISTERED,
+        registered_at=datetime.utcnow().isoformat(),
+    )
+    columns = list(entry)
+    with closing(open_catalog()) as conn, conn:
+        conn.execute(
+            f"INSERT OR REPLACE INTO bronze_partitions ({', '.join(columns)}) "
+            f"VALUES ({', '.join(':' + c for c in columns)})",
+            entry
+        )
+    print(f"[BRONZE] Catalogued {entry['partition']}: {stats['record_count']} records, "
+          f"{byte_size} bytes, date_of_service {stats['min_date_of_service']} → "
+          f"{stats['max_date_of_service']}")
+    return entry
+
+
+def set_partition_status(tenant, ehr_source, partitions, status=STATUS_PROCESSED,
+                         environment=None):
+    """Mark catalogued partitions, e.g. once their silver load has committed."""
+    processed_at = datetime.utcnow().isoformat() if status == STATUS_PROCESSED else None
+    with closing(open_catalog()) as conn, conn:
+        conn.executemany("""
+            UPDATE bronze_partitions SET status = ?, processed_at = ?
+            WHERE tenant = ? AND environment = ? AND ehr_source = ? AND partition = ?
+        """, [
+            (status, processed_at, tenant, environment or ENVIRONMENT, ehr_source, p)
+            for p in partitions
+        ])
+
+
+def record_bad_lines(partition_path, bad_lines):
+    """
+    Record the malformed lines a read of the partition at partition_path
+    skipped (within BRONZE_MAX_BAD_LINES), so the loss shows in the catalog.
+    """
+    tenant, environment, ehr_source, _, partition = \
+        os.path.normpath(partition_path).split(os.sep)[-5:]
+    with closing(open_catalog()) as conn, conn:
+        conn.execute("""
+            UPDATE bronze_partitions SET bad_lines = ?
+            WHERE tenant = ? AND environment = ? AND ehr_source = ? AND partition = ?
+        """, (bad_lines, tenant, environment, ehr_source, partition))
+
+
+def source_partitions_path(tenant, ehr_source, environment=None):
+    return os.path.join(
+        BRONZE_BASE_PATH, tenant, environment or ENVIRONMENT, ehr_source, "encounters"
+    )
+
+
+def sync_catalog(tenant, ehr_source, environment=None):
+    """
+    Register partition folders of one source that have no catalog entry —
+    bronze written before the catalog existed, or copied in by hand. The
+    only place that lists (and reads) bronze folders. Returns the number
+    of partitions added.
+    """
+    environment = environment or ENVIRONMENT
+    folder = source_partitions_path(tenant, ehr_source, environment)
+    partitions = sorted(os.listdir(folder)) if os.path.isdir(folder) else []
+    with closing(open_catalog()) as conn:
+        known = {row["partition"] for row in conn.execute("""
+            SELECT partition FROM bronze_partitions
+            WHERE tenant = ? AND environment = ? AND ehr_source = ?
+        """, (tenant, environment, ehr_source))}
+    added = 0
+    for partition in partitions:
+        partition_path = os.path.join(folder, partition)
+        if partition in known or not os.path.isdir(partition_path):
+            continue
+        try:
+            stats = scan_partition_stats(partition_path)
+        except FileNotFoundError:
+            continue  # no bronze file (yet) — e.g. a write still in progress
+        register_partition(partition_path, tenant, ehr_source, stats, environment)
+        added += 1
+    with closing(open_catalog()) as conn, conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO bronze_synced_sources (tenant, environment, ehr_source, synced_at)
+            VALUES (?, ?, ?, ?)
+        """, (tenant, environment, ehr_source, datetime.utcnow().isoformat()))
+    return added
+
+
+def catalog_partitions(tenant, ehr_source, environment=None, after=None, statuses=None,
+                       non_empty=False, service_from=None, service_to=None):
+    """
+    Catalog entries (dicts) of one source, oldest partition first, pruned
+    on the recorded metadata alone — no folder is listed or opened:
+
+    - after: only partitions named after this one (e.g. the watermark)
+    - statuses: only entries in these statuses
+    - non_empty: skip partitions without records
+    - service_from / service_to: only partitions whose date_of_service
+      range overlaps [service_from, service_to] (ISO dates, inclusive)
+
+    A source the catalog has never seen is synced from disk once first,
+    so partitions written before the catalog existed are not lost.
+    """
+    environment = environment or ENVIRONMENT
+    clauses = ["tenant = ?", "environment = ?", "ehr_source = ?"]
+    params = [tenant, environment, ehr_source]
+    if after:
+        clauses.append("partition > ?")
+        params.append(after)
+    if statuses:
+        clauses.append(f"status IN ({', '.join('?' for _ in statuses)})")
+        params.extend(statuses)
+    if non_empty:
+        clauses.append("record_count > 0")
+    if service_from:
+        clauses.append("max_date_of_service >= ?")
+        params.append(str(service_from))
+    if service_to:
+        clauses.append("min_date_of_service <= ?")
+        params.append(str(service_to))
+    sql = f"SELECT * FROM bronze_partitions WHERE {' AND '.join(clauses)} ORDER BY partition"
+
+    with closing(open_catalog()) as conn:
+        synced = conn.execute("""
+            SELECT 1 FROM bronze_synced_sources
+            WHERE tenant = ? AND environment = ? AND ehr_source = ?
+        """, params[:3]).fetchone()
+    if not synced and sync_catalog(tenant, ehr_source, environment):
+        print(f"[BRONZE] Catalogued existing partitions of {tenant}/{ehr_source}")
+    with closing(open_catalog()) as conn:
+        return [dict(row) for row in conn.execute(sql, params)]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Register bronze partitions in the catalog")
+    parser.add_argument("--tenant", default=os.getenv("TENANT", "zivian"))
+    parser.add_argument("--ehr-source", default=os.getenv("EHR_SOURCE", "athenahealth"))
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("BRONZE CATALOG SYNC STARTED")
+    print("=" * 60)
+
+    added = sync_catalog(args.tenant, args.ehr_source)
+    print(f"[BRONZE] Registered {added} uncatalogued partition(s) in {BRONZE_CATALOG_PATH}")
+
+    print("\n" + "=" * 60)
+    print("BRONZE CATALOG SYNC COMPLETED SUCCESSFULLY!")
+    print("=" * 60)
@@ -0,0 +1,297 @@
+import gzip
+import io
+import json
+import os
+import pandas as pd
+from dotenv import load_dotenv
+
+from services.metrics.stage_metrics import count_bad_lines
+
+load_dotenv()
+
+# Bronze file format settings
+BRONZE_FORMAT = os.getenv("BRONZE_FORMAT", "ndjson")          # ndjson | parquet
+PARQUET_ROW_GROUP_SIZE = int(os.getenv("PARQUET_ROW_GROUP_SIZE", "100000"))
+BRONZE_COMPRESSION = os.getenv("BRONZE_COMPRESSION", "none")  # none | gzip | zstd
+BRONZE_COMPRESSION_LEVEL = os.getenv("BRONZE_COMPRESSION_LEVEL")  # codec default if unset
+# Malformed NDJSON lines (e.g. truncated by an interrupted write) a
+# partition may contain before reading it fails; 0 = fail on the first one
+BRONZE_MAX_BAD_LINES = int(os.getenv("BRONZE_MAX_BAD_LINES", "0"))
+
+BRONZE_FILE_STEM = "encounters_raw"
+FORMAT_EXTENSIONS = {
+    "ndjson": ".ndjson",
+    "parquet": ".parquet",
+}
+# Compressed NDJSON gets a codec suffix; Parquet compresses internally
+COMPRESSION_EXTENSIONS = {
+    "none": "",
+    "gzip": ".gz",
+    "zstd": ".zst",
+}
+DEFAULT_COMPRESSION_LEVELS = {
+    "gzip": 6,
+    "zstd": 3,
+}
+
+# Low-cardinality columns worth dictionary-encoding in Parquet
+PARQUET_DICTIONARY_COLUMNS = [
+    "patient_id", "app_id", "physician_id", "state", "status"
+]
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError(
+            "BRONZE_FORMAT=parquet needs pyarrow — pip install pyarrow"
+        )
+    return pyarrow, pyarrow.parquet
+
+
+def _require_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(
+            "BRONZE_COMPRESSION=zstd needs zstandard — pip install zstandard"
+        )
+    return zstandard
+
+
+def _compression_level(compression, level):
+    if level is None:
+        level = BRONZE_COMPRESSION_LEVEL
+    if level is None:
+        return DEFAULT_COMPRESSION_LEVELS.get(compression)
+    return int(level)
+
+
+def _encounter_schema(pa):
+    """Bronze keeps source values as-is, so everything stays a string."""
+    return pa.schema([
+        ("encounter_id", pa.string()),
+        ("patient_id", pa.string()),
+        ("app_id", pa.string()),
+        ("physician_id", pa.string()),
+        ("date_of_service", pa.string()),
+        ("state", pa.string()),
+        ("status", pa.string()),
+        ("medications", pa.list_(pa.string())),
+        ("clinical_notes", pa.string()),
+        ("ingestion_timestamp", pa.string()),
+    ])
+
+
+def bronze_file_name(fmt=None, compression=None, part=None):
+    """
+    File name of a bronze partition for the given format and codec.
+    Multi-part partitions (one file per writer) number their parts:
+    encounters_raw-part-00003.ndjson.gz
+    """
+    fmt = fmt or BRONZE_FORMAT
+    compression = compression or BRONZE_COMPRESSION
+    if fmt not in FORMAT_EXTENSIONS:
+        raise ValueError(f"Unknown bronze format: {fmt}")
+    if compression not in COMPRESSION_EXTENSIONS:
+        raise ValueError(f"Unknown bronze compression: {compression}")
+    name = BRONZE_FILE_STEM
+    if part is not None:
+        name += f"-part-{part:05d}"
+    name += FORMAT_EXTENSIONS[fmt]
+    if fmt == "ndjson":
+        name += COMPRESSION_EXTENSIONS[compression]
+    return name
+
+
+def _is_bronze_file_name(name):
+    if not name.startswith(BRONZE_FILE_STEM):
+        return False
+    return any(
+        name.endswith(FORMAT_EXTENSIONS["ndjson"] + ext)
+        for ext in COMPRESSION_EXTENSIONS.values()
+    ) or name.endswith(FORMAT_EXTENSIONS["parquet"])
+
+
+def open_ndjson_writer(file_path, compression="none", level=None):
+    """Open a text stream that compresses on the fly while it is written."""
+    if compression == "gzip":
+        return gzip.open(file_path, "wt", compresslevel=level)
+    if compression == "zstd":
+        zstandard = _require_zstandard()
+        raw = open(file_path, "wb")
+        writer = zstandard.ZstdCompressor(level=level).stream_writer(raw)
+        return io.TextIOWrapper(writer, encoding="utf-8")
+    return open(file_path, "w")
+
+
+def open_ndjson_reader(file_path):
+    """Open an NDJSON file as text, decompressing on the fly by extension."""
+    if file_path.endswith(COMPRESSION_EXTENSIONS["gzip"]):
+        return gzip.open(file_path, "rt")
+    if file_path.endswith(COMPRESSION_EXTENSIONS["zstd"]):
+        zstandard = _require_zstandard()
+        raw = open(file_path, "rb")
+        reader = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        return io.TextIOWrapper(reader, encoding="utf-8")
+    return open(file_path, "r")
+
+
+def _write_ndjson(records, file_path, compression, level):
+    count = 0
+    with open_ndjson_writer(file_path, compression, level) as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+            count += 1
+    return count
+
+
+def _write_parquet(records, file_path, compression, level):
+    pa, pq = _require_pyarrow()
+    schema = _encounter_schema(pa)
+    count = 0
+    batch = []
+    options = {"compression": "snappy" if compression == "none" else compression}
+    # snappy has no levels — pyarrow rejects compression_level for it
+    if compression in DEFAULT_COMPRESSION_LEVELS:
+        options["compression_level"] = level
+    with pq.ParquetWriter(
+        file_path, schema,
+        use_dictionary=PARQUET_DICTIONARY_COLUMNS,
+        **options
+    ) as writer:
+        for record in records:
+            batch.append(record)
+            if len(batch) >= PARQUET_ROW_GROUP_SIZE:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                count += len(batch)
+                batch = []
+        if batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            count += len(batch)
+    return count
+
+
+def write_bronze_file(records, bronze_path, fmt=None, compression=None, level=None,
+                      part=None):
+    """
+    Write encounter records into a bronze partition folder.
+    records can be any iterable — it is consumed once, in order, and
+    compressed as it is written, so a generator is never materialized.
+    Pass part to write one numbered file of a multi-part partition.
+    Returns (file_path, record_count).
+    """
+    fmt = fmt or BRONZE_FORMAT
+    compression = compression or BRONZE_COMPRESSION
+    level = _compression_level(compression, level)
+    file_path = os.path.join(bronze_path, bronze_file_name(fmt, compression, part))
+    if fmt == "parquet":
+        count = _write_parquet(records, file_path, compression, level)
+    else:
+        count = _write_ndjson(records, file_path, compression, level)
+    return file_path, count
+
+
+def find_bronze_files(partition_path):
+    """
+    Locate the data file(s) inside a bronze partition folder.
+    A partition holds either one encounters_raw file or numbered part files;
+    parts are returned in part order. Parquet wins when a single-file
+    partition was written in several formats.
+    """
+    names = sorted(n for n in os.listdir(partition_path) if _is_bronze_file_name(n))
+    parts = [n for n in names if n.startswith(BRONZE_FILE_STEM + "-part-")]
+    if parts:
+        return [os.path.join(partition_path, n) for n in parts]
+
+    candidates = [bronze_file_name("parquet")] + [
+        bronze_file_name("ndjson", codec) for codec in ("zstd", "gzip", "none")
+    ]
+    for name in candidates:
+        if name in names:
+            return [os.path.join(partition_path, name)]
+    raise FileNotFoundError(f"No bronze file found in {partition_path}")
+
+
+def _reject_constant(name):
+    # json.loads takes NaN / Infinity, Postgres JSONB does not
+    raise ValueError(f"invalid JSON constant {name}")
+
+
+def parse_ndjson_line(line, file_path, line_no, bad_lines):
+    """
+    Parse one NDJSON bronze line into a record. A malformed line — not a
+    JSON object — is counted in bad_lines["bad_lines"] and None returned;
+    once a partition has more than BRONZE_MAX_BAD_LINES the read fails
+    with ValueError, before its watermark can move past the lost records.
+    """
+    try:
+        record = json.loads(line, parse_constant=_reject_constant)
+    except ValueError:
+        record = None
+    if isinstance(record, dict):
+        return record
+    bad_lines["bad_lines"] = bad_lines.get("bad_lines", 0) + 1
+    count_bad_lines(1)
+    if bad_lines["bad_lines"] > BRONZE_MAX_BAD_LINES:
+        raise ValueError(
+            f"Malformed NDJSON line {line_no} in {file_path} "
+            f"({bad_lines['bad_lines']} bad line(s), BRONZE_MAX_BAD_LINES={BRONZE_MAX_BAD_LINES})"
+        )
+    print(f"[BRONZE] WARNING: skipped malformed line {line_no} in {file_path}")
+    return None
+
+
+def _iter_ndjson_chunks(file_path, chunk_size, columns, bad_lines):
+    records = []
+    with open_ndjson_reader(file_path) as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = parse_ndjson_line(line, file_path, line_no, bad_lines)
+            if record is None:
+                continue
+            if columns:
+                record = {c: record.get(c) for c in columns}
+            records.append(record)
+            if len(records) >= chunk_size:
+                yield pd.DataFrame(records)
+                records = []
+
+    if records:
+        yield pd.DataFrame(records)
+
+
+def _iter_parquet_chunks(file_path, chunk_size, columns):
+    _, pq = _require_pyarrow()
+    parquet_file = pq.ParquetFile(file_path)
+    if columns:
+        # Column projection: unread columns (e.g. clinical_notes) cost no I/O
+        available = set(parquet_file.schema_arrow.names)
+        columns = [c for c in columns if c in available]
+    for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+        df = batch.to_pandas()
+        if "medications" in df.columns:
+            # Arrow lists come back as numpy arrays; silver expects Python lists
+            df["medications"] = df["medications"].map(
+                lambda x: list(x) if x is not None else None
+            )
+        yield df
+
+
+def iter_bronze_file(file_path, chunk_size, columns=None, bad_lines=None):
+    """
+    Stream a bronze file as DataFrame chunks of at most chunk_size rows.
+    The format is detected from the file name. When columns is given only
+    those columns are returned — for Parquet, only those are read from disk.
+    Pass the same bad_lines dict for every file of a partition to apply
+    BRONZE_MAX_BAD_LINES per partition and read the count back afterwards.
+    """
+    if file_path.endswith(FORMAT_EXTENSIONS["parquet"]):
+        return _iter_parquet_chunks(file_path, chunk_size, columns)
+    if bad_lines is None:
+        bad_lines = {}
+    return _iter_ndjson_chunks(file_path, chunk_size, columns, bad_lines)
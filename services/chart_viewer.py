@@ -1,63 +1,103 @@
 import os
+import sys
 import pandas as pd
-from sqlalchemy import create_engine
 from dotenv import load_dotenv
 
+# Add project root to path so the report can run as a plain script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import text
+from services.db.engine import get_engine
+from services.sampling.sampling_encounters import read_gold_summary
+
 load_dotenv()
 
-DB_HOST = os.getenv("DB_HOST", "localhost")
-DB_PORT = os.getenv("DB_PORT", "5432")
-DB_NAME = os.getenv("DB_NAME", "zivian_db")
-DB_USER = os.getenv("DB_USER", "postgres")
-DB_PASSWORD = os.getenv("DB_PASSWORD", "postgres123")
+# The five most recent sampled charts — served by the sampled-charts index
+CHARTS_SQL = """
+    SELECT
+        encounter_id,
+        patient_id,
+        physician_id,
+        date_of_service,
+        state,
+        medications,
+        clinical_notes,
+        sampling_reason
+    FROM gold_encounters
+    WHERE is_sampled = TRUE
+    ORDER BY date_of_service DESC, encounter_id DESC, tenant DESC, ehr_source DESC
+    LIMIT 5
+"""
 
-def get_db_engine():
-    conn_str = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-    return create_engine(conn_str)
+# Same report for one NDC code — served by the sampled-medications GIN index
+MEDICATION_FILTER = "medications @> CAST(ARRAY[:medication] AS TEXT[])"
+CHARTS_BY_MEDICATION_SQL = CHARTS_SQL.replace(
+    "WHERE is_sampled = TRUE", f"WHERE is_sampled = TRUE AND {MEDICATION_FILTER}"
+)
+COUNT_BY_MEDICATION_SQL = f"""
+    SELECT COUNT(*) FROM gold_encounters WHERE is_sampled = TRUE AND {MEDICATION_FILTER}
+"""
 
-def show_chart_review_report():
-    engine = get_db_engine()
+def show_chart_review_report(medication=None):
+    engine = get_engine()
 
     print("=" * 70)
     print("ELEVATE CHART REVIEW REPORT — SELECTED PATIENT CHARTS")
     print("=" * 70)
 
-    # Get sampled charts
-    df = pd.read_sql("""
-        SELECT 
-            encounter_id,
-            patient_id,
-            physician_id,
-            date_of_service,
-            state,
-            medications,
-            clinical_notes,
-            sampling_reason
-        FROM gold_encounters
-        WHERE is_sampled = TRUE
-        ORDER BY date_of_service DESC
-    """, engine)
-
-    print(f"\nTotal Charts Selected for Review: {len(df)}")
+    # Counts come from the precomputed gold summary, not a scan of gold
+    with engine.connect() as conn:
+        run_summary = read_gold_summary(conn)
+        state_summary = read_gold_summary(conn, "state")
+    if medication:
+        with engine.connect() as conn:
+            total_selected = conn.execute(
+                text(COUNT_BY_MEDICATION_SQL), {"medication": medication}
+            ).scalar()
+    elif run_summary:
+        total_selected = run_summary[0]["sampled"]
+    else:
+        total_selected = int(pd.read_sql(
+            "SELECT COUNT(*) AS c FROM gold_encounters WHERE is_sampled = TRUE", engine
+        ).iloc[0]["c"])
+
+    # Only the charts shown below are fetched
+    if medication:
+        df = pd.read_sql(text(CHARTS_BY_MEDICATION_SQL), engine, params={"medication": medication})
+    else:
+        df = pd.read_sql(CHARTS_SQL, engine)
+
+    print(f"\nTotal Charts Selected for Review: {total_selected}"
+          + (f" (with {medication})" if medication else ""))
     print(f"Sampling Method: Deterministic 10%")
+    if state_summary and not medication:
+        print("Selected by State: " + ", ".join(
+            f"{s['dimension_value']} {s['sampled']}" for s in state_summary if s["sampled"]
+        ))
     print("\n" + "-" * 70)
 
     # Show each chart
-    for i, row in df.head(5).iterrows():
+    for i, row in df.iterrows():
         print(f"\n📋 CHART #{i+1}")
         print(f"   Encounter ID  : {row['encounter_id']}")
         print(f"   Patient ID    : {row['patient_id']}")
         print(f"   Physician ID  : {row['physician_id']}")
         print(f"   Date of Service: {row['date_of_service']}")
         print(f"   State         : {row['state']}")
-        print(f"   Medications   : {row['medications']}")
+        print(f"   Medications   : {', '.join(row['medications'] or [])}")
         print(f"   Clinical Notes: {row['clinical_notes']}")
         print(f"   Selected By   : {row['sampling_reason']}")
         print("-" * 70)
 
-    print(f"\n... and {len(df) - 5} more charts ready for review")
+    print(f"\n... and {max(total_selected - len(df), 0)} more charts ready for review")
     print("\n✅ All charts are ready to be loaded into Elevate platform!")
     print("=" * 70)
 
 if __name__ == "__main__":
-    show_chart_review_report()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Chart review report of the sampled encounters")
+    parser.add_argument("--medication", help="only charts listing this NDC code, e.g. NDC-0069-0003")
+    args = parser.parse_args()
+
+    show_chart_review_report(medication=args.medication)
\ No newline at end of file
@@ -1,21 +1,104 @@
-from flask import Flask, render_template_string
-import pandas as pd
-from sqlalchemy import create_engine
+from flask import Flask, jsonify, render_template_string, request
 import os
+import psycopg2
+import select
+import sys
+import threading
+import time
+from datetime import date
+from sqlalchemy import text
 from dotenv import load_dotenv
 
+# Add project root to path so the dashboard can run as a plain script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from services.db.engine import database_url, get_engine, set_statement_timeout
+from services.db.schema import NOTES_SEARCH_CONFIG
+from services.sampling.sampling_encounters import GOLD_LOADED_CHANNEL, read_gold_summary
+
 load_dotenv()
 
-DB_HOST = os.getenv("DB_HOST", "localhost")
-DB_PORT = os.getenv("DB_PORT", "5432")
-DB_NAME = os.getenv("DB_NAME", "zivian_db")
-DB_USER = os.getenv("DB_USER", "postgres")
-DB_PASSWORD = os.getenv("DB_PASSWORD", "postgres123")
+# A page request gives up on a query after this long (ms) instead of
+# holding a pooled connection
+DASHBOARD_STATEMENT_TIMEOUT_MS = int(os.getenv("DASHBOARD_STATEMENT_TIMEOUT_MS", "5000"))
+# Seconds stats/charts are served from memory; a gold load clears them sooner
+DASHBOARD_CACHE_TTL = float(os.getenv("DASHBOARD_CACHE_TTL", "60"))
+DASHBOARD_CACHE_MAX_ENTRIES = int(os.getenv("DASHBOARD_CACHE_MAX_ENTRIES", "256"))
+
+# /api/charts page sizes
+CHARTS_PAGE_SIZE = int(os.getenv("CHARTS_PAGE_SIZE", "50"))
+CHARTS_MAX_PAGE_SIZE = int(os.getenv("CHARTS_MAX_PAGE_SIZE", "500"))
+# Longest /api/charts/search query accepted
+SEARCH_MAX_QUERY_LENGTH = 200
 
 app = Flask(__name__)
 
-def get_engine():
-    return create_engine(f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}")
+_cache = {}
+_cache_lock = threading.Lock()
+_listener_lock = threading.Lock()
+_listener_started = False
+
+
+def cached(key, loader, ttl=None):
+    """Return the cached value for key, calling loader() when missing or expired."""
+    ttl = DASHBOARD_CACHE_TTL if ttl is None else ttl
+    now = time.monotonic()
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit and hit[0] > now:
+            return hit[1]
+    value = loader()
+    with _cache_lock:
+        if len(_cache) >= DASHBOARD_CACHE_MAX_ENTRIES:
+            for stale in [k for k, (expires, _) in _cache.items() if expires <= now]:
+                del _cache[stale]
+            if len(_cache) >= DASHBOARD_CACHE_MAX_ENTRIES:
+                _cache.clear()
+        _cache[key] = (now + ttl, value)
+    return value
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+def _listen_for_gold_loads():
+    """
+    Clear the cache whenever the sampling stage announces a gold load.
+    LISTEN holds its connection for good, so it gets its own instead of
+    one taken from the request pool.
+    """
+    while True:
+        try:
+            conn = psycopg2.connect(database_url(), application_name="zivian-dashboard-listener")
+            try:
+                conn.autocommit = True          # required for LISTEN
+                cursor = conn.cursor()
+                cursor.execute(f"LISTEN {GOLD_LOADED_CHANNEL}")
+                while True:
+                    if select.select([conn], [], [], DASHBOARD_CACHE_TTL) == ([], [], []):
+                        continue
+                    conn.poll()
+                    if conn.notifies:
+                        conn.notifies.clear()
+                        clear_cache()
+                        print("[DASHBOARD] Gold load detected — cache cleared")
+            finally:
+                conn.close()
+        except Exception as e:
+            # Postgres away — the TTL still bounds staleness; retry later
+            print(f"[DASHBOARD] Gold load listener error: {e}")
+            time.sleep(DASHBOARD_CACHE_TTL)
+
+
+def start_gold_load_listener():
+    global _listener_started
+    with _listener_lock:
+        if not _listener_started:
+            _listener_started = True
+            threading.Thread(target=_listen_for_gold_loads, daemon=True).start()
+
 
 HTML = """
 <!DOCTYPE html>
@@ -315,6 +398,31 @@ HTML = """
 
   .notes { color: var(--muted); font-size: 0.7rem; max-width: 220px; white-space: nowrap; overflow: hidden; text-overflow: ellipsis; }
 
+  .filters {
+    display: flex;
+    flex-wrap: wrap;
+    gap: 0.6rem;
+    margin-bottom: 1.2rem;
+  }
+
+  .filters input, .filters button, .load-more {
+    background: var(--surface2);
+    border: 1px solid var(--border);
+    border-radius: 8px;
+    color: var(--text);
+    font-family: 'DM Mono', monospace;
+    font-size: 0.7rem;
+    padding: 0.45rem 0.7rem;
+  }
+
+  .filters button, .load-more { cursor: pointer; color: var(--accent); }
+  .filters button:hover, .load-more:hover { border-color: var(--accent); }
+
+  .load-more { display: block; margin: 1.2rem auto 0; }
+  .load-more[hidden] { display: none; }
+
+  .table-status { text-align: center; color: var(--muted); font-size: 0.7rem; padding: 1rem 0 0; }
+
   /* FOOTER */
   footer {
     text-align: center;
@@ -410,6 +518,15 @@ HTML = """
       <div class="section-title" style="margin:0">Selected Patient Charts — Ready for Physician Review</div>
       <div class="ready-badge">⭐ {{ stats.sampled }} CHARTS READY</div>
     </div>
+    <form class="filters" id="chart-filters">
+      <input name="state" placeholder="State (e.g. CA)" maxlength="5"/>
+      <input name="physician_id" placeholder="Physician ID"/>
+      <input name="date_from" type="date" title="Date of service from"/>
+      <input name="date_to" type="date" title="Date of service to"/>
+      <input name="medication" placeholder="Medication (NDC)"/>
+      <input name="q" placeholder="Search clinical notes" maxlength="200"/>
+      <button type="submit">Filter</button>
+    </form>
     <div class="table-wrap">
       <table>
         <thead>
@@ -424,26 +541,11 @@ HTML = """
             <th>Status</th>
           </tr>
         </thead>
-        <tbody>
-          {% for row in charts %}
-          <tr style="animation-delay: {{ loop.index0 * 0.03 }}s">
-            <td><span class="enc-id">{{ row.encounter_id }}</span></td>
-            <td><span class="patient-id">{{ row.patient_id }}</span></td>
-            <td>{{ row.physician_id }}</td>
-            <td>{{ row.date_of_service }}</td>
-            <td><span class="state-badge">{{ row.state }}</span></td>
-            <td>
-              {% for med in row.medications.split(',') %}
-                <span class="med-tag">{{ med.strip() }}</span>
-              {% endfor %}
-            </td>
-            <td><span class="notes" title="{{ row.clinical_notes }}">{{ row.clinical_notes }}</span></td>
-            <td><span class="sampled-badge">✓ SELECTED</span></td>
-          </tr>
-          {% endfor %}
-        </tbody>
+        <tbody id="charts-body"></tbody>
       </table>
     </div>
+    <div class="table-status" id="charts-status">Loading charts…</div>
+    <button class="load-more" id="load-more" hidden>Load more</button>
   </div>
 
   <footer>
@@ -451,36 +553,354 @@ HTML = """
   </footer>
 
 </div>
+<script>
+  // Charts arrive a page at a time from /api/charts (keyset pagination),
+  // or ranked by relevance from /api/charts/search when notes are searched
+  const body = document.getElementById("charts-body");
+  const statusLine = document.getElementById("charts-status");
+  const loadMore = document.getElementById("load-more");
+  const filters = document.getElementById("chart-filters");
+  let cursor = null;
+  let loading = false;
+
+  function cell(text, className) {
+    const td = document.createElement("td");
+    if (className) {
+      const span = document.createElement("span");
+      span.className = className;
+      span.textContent = text;
+      if (className === "notes") span.title = text;
+      td.appendChild(span);
+    } else {
+      td.textContent = text;
+    }
+    return td;
+  }
+
+  function chartRow(chart) {
+    const tr = document.createElement("tr");
+    tr.appendChild(cell(chart.encounter_id, "enc-id"));
+    tr.appendChild(cell(chart.patient_id, "patient-id"));
+    tr.appendChild(cell(chart.physician_id || ""));
+    tr.appendChild(cell(chart.date_of_service || ""));
+    tr.appendChild(cell(chart.state || "", "state-badge"));
+    const meds = document.createElement("td");
+    for (const med of chart.medications || []) {
+      const tag = document.createElement("span");
+      tag.className = "med-tag";
+      tag.textContent = med;
+      meds.appendChild(tag);
+    }
+    tr.appendChild(meds);
+    tr.appendChild(cell(chart.clinical_notes || "", "notes"));
+    tr.appendChild(cell("✓ SELECTED", "sampled-badge"));
+    return tr;
+  }
+
+  async function loadPage(reset) {
+    if (loading) return;
+    loading = true;
+    if (reset) { body.replaceChildren(); cursor = null; }
+    const params = new URLSearchParams();
+    for (const [key, value] of new FormData(filters)) {
+      if (value) params.set(key, value);
+    }
+    if (cursor) params.set("cursor", cursor);
+    statusLine.textContent = "Loading charts…";
+    try {
+      const endpoint = params.has("q") ? "/api/charts/search?" : "/api/charts?";
+      const response = await fetch(endpoint + params);
+      const page = await response.json();
+      if (!response.ok) throw new Error(page.error || response.statusText);
+      for (const chart of page.charts) body.appendChild(chartRow(chart));
+      cursor = page.next_cursor;
+      loadMore.hidden = !cursor;
+      statusLine.textContent = body.children.length ? "" : "No charts match these filters";
+    } catch (err) {
+      statusLine.textContent = "Could not load charts: " + err.message;
+    } finally {
+      loading = false;
+    }
+  }
+
+  filters.addEventListener("submit", (event) => { event.preventDefault(); loadPage(true); });
+  loadMore.addEventListener("click", () => loadPage(false));
+  // Fetch the next page as the button scrolls into view
+  new IntersectionObserver((entries) => {
+    if (entries[0].isIntersecting && cursor) loadPage(false);
+  }).observe(loadMore);
+  loadPage(true);
+</script>
 </body>
 </html>
 """
 
-@app.route("/")
-def index():
-    engine = get_engine()
-    
-    total = pd.read_sql("SELECT COUNT(*) as c FROM gold_encounters", engine).iloc[0]['c']
-    silver = pd.read_sql("SELECT COUNT(*) as c FROM silver_encounters", engine).iloc[0]['c']
-    sampled = pd.read_sql("SELECT COUNT(*) as c FROM gold_encounters WHERE is_sampled = TRUE", engine).iloc[0]['c']
-    excluded = total - silver
-
-    charts_df = pd.read_sql("""
-        SELECT encounter_id, patient_id, physician_id, 
-               date_of_service, state, medications, clinical_notes
-        FROM gold_encounters 
-        WHERE is_sampled = TRUE 
-        ORDER BY date_of_service DESC
-    """, engine)
-
-    charts = charts_df.to_dict('records')
-    stats = {
+STATS_SQL = """
+    SELECT
+        COUNT(*)                                  AS total,
+        COUNT(*) FILTER (WHERE is_sampled)        AS sampled,
+        (SELECT COUNT(*) FROM silver_encounters)  AS silver
+    FROM gold_encounters
+"""
+
+CHART_COLUMNS = """
+    tenant, ehr_source, encounter_id, patient_id, physician_id,
+    date_of_service, state, medications, clinical_notes
+"""
+
+CHART_FILTERS = {
+    "state":        "state = :state",
+    "physician_id": "physician_id = :physician_id",
+    "date_from":    "date_of_service >= :date_from",
+    "date_to":      "date_of_service <= :date_to",
+    "medication":   "medications @> CAST(ARRAY[:medication] AS TEXT[])",
+}
+
+
+def load_stats():
+    """
+    Headline numbers from the latest gold_summary run row; falls back to
+    one aggregate query over the fact tables before the first summarized load
+    (or when the latest run predates the summary's silver count).
+    """
+    with get_engine().connect() as conn:
+        set_statement_timeout(conn, DASHBOARD_STATEMENT_TIMEOUT_MS)
+        summary = read_gold_summary(conn)
+        if summary and summary[0]["silver"] is not None:
+            run = summary[0]
+            total, silver, sampled = run["total"], run["silver"], run["sampled"]
+        else:
+            row = conn.execute(text(STATS_SQL)).one()
+            total, silver, sampled = row.total, row.silver, row.sampled
+    return {
         "total": int(total),
         "silver": int(silver),
-        "excluded": int(excluded),
+        "excluded": int(total - silver),
         "sampled": int(sampled)
     }
 
-    return render_template_string(HTML, stats=stats, charts=charts)
+
+def parse_chart_filters(args):
+    filters = {}
+    for name in CHART_FILTERS:
+        value = args.get(name, "").strip()
+        if not value:
+            continue
+        filters[name] = date.fromisoformat(value) if name.startswith("date_") else value
+    return filters
+
+
+def parse_limit(args):
+    limit = int(args.get("limit", CHARTS_PAGE_SIZE))
+    if not 1 <= limit <= CHARTS_MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {CHARTS_MAX_PAGE_SIZE}")
+    return limit
+
+
+def parse_chart_query(args):
+    """
+    Validate /api/charts query args into (filters, cursor, limit).
+    Raises ValueError with a message fit for the client.
+    """
+    filters = parse_chart_filters(args)
+
+    cursor = None
+    if args.get("cursor"):
+        # "<date_of_service or empty>|<encounter_id>|<tenant>|<ehr_source>"
+        # of the last row served
+        parts = args["cursor"].split("|")
+        if len(parts) != 4 or not all(parts[1:]):
+            raise ValueError("invalid cursor")
+        cursor_date, cursor_id, cursor_tenant, cursor_source = parts
+        cursor = (
+            date.fromisoformat(cursor_date) if cursor_date else None,
+            cursor_id, cursor_tenant, cursor_source
+        )
+    return filters, cursor, parse_limit(args)
+
+
+def parse_search_query(args):
+    """
+    Validate /api/charts/search query args into (terms, filters, cursor,
+    limit). Raises ValueError with a message fit for the client.
+    """
+    terms = args.get("q", "").strip()
+    if not terms:
+        raise ValueError("q is required")
+    if len(terms) > SEARCH_MAX_QUERY_LENGTH:
+        raise ValueError(f"q must be at most {SEARCH_MAX_QUERY_LENGTH} characters")
+    filters = parse_chart_filters(args)
+
+    cursor = None
+    if args.get("cursor"):
+        # "<rank>|<encounter_id>|<tenant>|<ehr_source>" of the last row served
+        parts = args["cursor"].split("|")
+        if len(parts) != 4 or not all(parts):
+            raise ValueError("invalid cursor")
+        cursor = (float(parts[0]), *parts[1:])
+    return terms, filters, cursor, parse_limit(args)
+
+
+def build_charts_query(filters, cursor=None, limit=CHARTS_PAGE_SIZE):
+    """
+    SQL and bind params for one page of sampled charts, newest
+    date_of_service first (rows without a date sort first, as in Postgres).
+
+    Keyset pagination: the next page starts strictly after the
+    (date_of_service, encounter_id, tenant, ehr_source) of the last row
+    served, so every page costs the same index range scan no matter how
+    deep the reader scrolls. The same encounter_id can come from several
+    sources, hence the source as tie-break.
+    """
+    where = ["is_sampled = TRUE"]
+    params = dict(filters, limit=limit + 1)
+    where += [CHART_FILTERS[name] for name in filters]
+
+    if cursor is not None:
+        cursor_date, cursor_id, cursor_tenant, cursor_source = cursor
+        params.update(cursor_id=cursor_id, cursor_tenant=cursor_tenant,
+                      cursor_source=cursor_source)
+        if cursor_date is None:
+            where.append(
+                "((date_of_service IS NULL AND (encounter_id, tenant, ehr_source)"
+                " < (:cursor_id, :cursor_tenant, :cursor_source))"
+                " OR date_of_service IS NOT NULL)"
+            )
+        else:
+            params["cursor_date"] = cursor_date
+            where.append(
+                "(date_of_service, encounter_id, tenant, ehr_source)"
+                " < (:cursor_date, :cursor_id, :cursor_tenant, :cursor_source)"
+            )
+
+    sql = f"""
+        SELECT {CHART_COLUMNS}
+        FROM gold_encounters
+        WHERE {" AND ".join(where)}
+        ORDER BY date_of_service DESC, encounter_id DESC, tenant DESC, ehr_source DESC
+        LIMIT :limit
+    """
+    return sql, params
+
+
+def load_charts_page(filters, cursor=None, limit=CHARTS_PAGE_SIZE):
+    """One page of sampled charts plus the cursor of the next page (or None)."""
+    sql, params = build_charts_query(filters, cursor, limit)
+    with get_engine().connect() as conn:
+        set_statement_timeout(conn, DASHBOARD_STATEMENT_TIMEOUT_MS)
+        rows = [dict(row._mapping) for row in conn.execute(text(sql), params)]
+
+    # One extra row tells us whether another page exists
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        last_date = last["date_of_service"].isoformat() if last["date_of_service"] else ""
+        next_cursor = f"{last_date}|{last['encounter_id']}|{last['tenant']}|{last['ehr_source']}"
+
+    for row in rows:
+        if row["date_of_service"] is not None:
+            row["date_of_service"] = row["date_of_service"].isoformat()
+    return {"charts": rows, "next_cursor": next_cursor, "limit": limit}
+
+
+def build_search_query(terms, filters, cursor=None, limit=CHARTS_PAGE_SIZE):
+    """
+    SQL and bind params for one page of sampled charts whose clinical
+    notes match terms (web-search syntax: words, "phrases", or, -not),
+    most relevant first.
+
+    The match runs on the GIN index over clinical_notes_tsv, so only
+    matching charts are read and ranked, and ts_rank works from the stored
+    tsvector instead of re-parsing every note. Pages are keyset-paginated
+    on (rank, encounter_id, tenant, ehr_source) like build_charts_query;
+    the rank is compared as float8, which round-trips through the cursor
+    exactly.
+    """
+    rank = "CAST(ts_rank(clinical_notes_tsv, search.query) AS FLOAT8)"
+    where = ["is_sampled = TRUE", "clinical_notes_tsv @@ search.query"]
+    where += [CHART_FILTERS[name] for name in filters]
+    params = dict(filters, terms=terms, limit=limit + 1)
+
+    if cursor is not None:
+        cursor_rank, cursor_id, cursor_tenant, cursor_source = cursor
+        params.update(cursor_rank=cursor_rank, cursor_id=cursor_id,
+                      cursor_tenant=cursor_tenant, cursor_source=cursor_source)
+        where.append(
+            f"({rank}, encounter_id, tenant, ehr_source)"
+            f" < (:cursor_rank, :cursor_id, :cursor_tenant, :cursor_source)"
+        )
+
+    sql = f"""
+        WITH search AS (
+            SELECT websearch_to_tsquery('{NOTES_SEARCH_CONFIG}', :terms) AS query
+        )
+        SELECT {CHART_COLUMNS}, {rank} AS rank
+        FROM gold_encounters, search
+        WHERE {" AND ".join(where)}
+        ORDER BY rank DESC, encounter_id DESC, tenant DESC, ehr_source DESC
+        LIMIT :limit
+    """
+    return sql, params
+
+
+def load_search_page(terms, filters, cursor=None, limit=CHARTS_PAGE_SIZE):
+    """One page of search results plus the cursor of the next page (or None)."""
+    sql, params = build_search_query(terms, filters, cursor, limit)
+    with get_engine().connect() as conn:
+        set_statement_timeout(conn, DASHBOARD_STATEMENT_TIMEOUT_MS)
+        rows = [dict(row._mapping) for row in conn.execute(text(sql), params)]
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = f"{last['rank']!r}|{last['encounter_id']}|{last['tenant']}|{last['ehr_source']}"
+
+    for row in rows:
+        if row["date_of_service"] is not None:
+            row["date_of_service"] = row["date_of_service"].isoformat()
+    return {"charts": rows, "next_cursor": next_cursor, "limit": limit, "q": terms}
+
+
+@app.route("/api/charts")
+def api_charts():
+    try:
+        filters, cursor, limit = parse_chart_query(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    start_gold_load_listener()
+    if cursor is None:
+        # First pages are what everyone opens — serve them from the cache
+        key = ("charts", tuple(sorted(filters.items())), limit)
+        page = cached(key, lambda: load_charts_page(filters, None, limit))
+    else:
+        page = load_charts_page(filters, cursor, limit)
+    return jsonify(page)
+
+
+@app.route("/api/charts/search")
+def api_charts_search():
+    try:
+        terms, filters, cursor, limit = parse_search_query(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    start_gold_load_listener()
+    if cursor is None:
+        key = ("search", terms, tuple(sorted(filters.items())), limit)
+        page = cached(key, lambda: load_search_page(terms, filters, None, limit))
+    else:
+        page = load_search_page(terms, filters, cursor, limit)
+    return jsonify(page)
+
+
+@app.route("/")
+def index():
+    start_gold_load_listener()
+    stats = cached("stats", load_stats)
+    return render_template_string(HTML, stats=stats)
 
 if __name__ == "__main__":
     app.run(debug=True, port=5000)
@@ -0,0 +1,451 @@
+import csv
+import io
+import os
+import struct
+import time
+from datetime import date, datetime
+import pandas as pd
+from sqlalchemy import inspect, text
+from dotenv import load_dotenv
+
+from services.metrics.stage_metrics import count_bytes_written
+
+load_dotenv()
+
+# Bulk load settings
+LOAD_METHOD = os.getenv("LOAD_METHOD", "copy")        # copy | multi
+COPY_FORMAT = os.getenv("COPY_FORMAT", "text")        # text | binary
+COPY_BATCH_SIZE = int(os.getenv("COPY_BATCH_SIZE", "50000"))
+
+PG_EPOCH = date(2000, 1, 1)
+PG_EPOCH_TS = datetime(2000, 1, 1)
+BINARY_HEADER = b"PGCOPY\n\377\r\n\0" + struct.pack("!ii", 0, 0)
+BINARY_TRAILER = struct.pack("!h", -1)
+NULL_FIELD = struct.pack("!i", -1)
+
+
+def _is_null(value):
+    """True for None / NaN / NaT, without choking on lists."""
+    if value is None:
+        return True
+    if isinstance(value, (list, tuple)):
+        return False
+    try:
+        return bool(pd.isna(value))
+    except (TypeError, ValueError):
+        return False
+
+
+def _encode_text(value):
+    return str(value).encode("utf-8")
+
+
+def _encode_bool(value):
+    return struct.pack("!?", bool(value))
+
+
+def _encode_int4(value):
+    return struct.pack("!i", int(value))
+
+
+def _encode_int8(value):
+    return struct.pack("!q", int(value))
+
+
+def _encode_float8(value):
+    return struct.pack("!d", float(value))
+
+
+def _encode_date(value):
+    if isinstance(value, datetime):
+        value = value.date()
+    elif isinstance(value, str):
+        value = date.fromisoformat(value[:10])
+    return struct.pack("!i", (value - PG_EPOCH).days)
+
+
+def _array_items(value):
+    """Elements of a list-like (or legacy comma-joined string) array value."""
+    if isinstance(value, str):
+        return value.split(",") if value else []
+    return list(value)
+
+
+def _encode_text_array(value):
+    # One-dimensional text[]: ndim, has-nulls flag, element type oid (25 =
+    # text), then the dimension's size and lower bound, then each element
+    items = _array_items(value)
+    if not items:
+        return struct.pack("!iii", 0, 0, 25)
+    has_null = any(_is_null(item) for item in items)
+    payload = [struct.pack("!iiiii", 1, int(has_null), 25, len(items), 1)]
+    for item in items:
+        if _is_null(item):
+            payload.append(NULL_FIELD)
+            continue
+        encoded = str(item).encode("utf-8")
+        payload.append(struct.pack("!i", len(encoded)) + encoded)
+    return b"".join(payload)
+
+
+def _array_literal(value):
+    """A list-like value as a Postgres array literal, for text COPY."""
+    if _is_null(value):
+        return None
+    elements = []
+    for item in _array_items(value):
+        if _is_null(item):
+            elements.append("NULL")
+        else:
+            escaped = str(item).replace("\\", "\\\\").replace('"', '\\"')
+            elements.append(f'"{escaped}"')
+    return "{" + ",".join(elements) + "}"
+
+
+def _encode_timestamp(value):
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    elif not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    delta = value.replace(tzinfo=None) - PG_EPOCH_TS
+    micros = (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+    return struct.pack("!q", micros)
+
+
+# Postgres type name -> binary COPY encoder
+BINARY_ENCODERS = {
+    "text": _encode_text,
+    "varchar": _encode_text,
+    "bpchar": _encode_text,
+    "bool": _encode_bool,
+    "int4": _encode_int4,
+    "int8": _encode_int8,
+    "float8": _encode_float8,
+    "date": _encode_date,
+    "timestamp": _encode_timestamp,
+    "_text": _encode_text_array,
+}
+
+
+def _column_types(conn, table_name):
+    """Look up the Postgres type name of every column in the target table."""
+    rows = conn.execute(text("""
+        SELECT a.attname, t.typname
+        FROM pg_attribute a
+        JOIN pg_type t ON t.oid = a.atttypid
+        WHERE a.attrelid = CAST(:table_name AS regclass)
+          AND a.attnum > 0 AND NOT a.attisdropped
+    """), {"table_name": table_name})
+    return {name: type_name for name, type_name in rows}
+
+
+def _text_batch(df):
+    """Serialize a DataFrame slice as COPY csv input."""
+    buffer = io.StringIO()
+    df.to_csv(
+        buffer, index=False, header=False,
+        na_rep="\\N", quoting=csv.QUOTE_MINIMAL
+    )
+    return io.BytesIO(buffer.getvalue().encode("utf-8"))
+
+
+def _binary_batch(df, encoders):
+    """Serialize a DataFrame slice as COPY binary input."""
+    buffer = io.BytesIO()
+    buffer.write(BINARY_HEADER)
+    field_count = struct.pack("!h", len(encoders))
+    for row in df.itertuples(index=False, name=None):
+        buffer.write(field_count)
+        for value, encode in zip(row, encoders):
+            if _is_null(value):
+                buffer.write(NULL_FIELD)
+                continue
+            payload = encode(value)
+            buffer.write(struct.pack("!i", len(payload)))
+            buffer.write(payload)
+    buffer.write(BINARY_TRAILER)
+    buffer.seek(0)
+    return buffer
+
+
+def copy_dataframe(conn, df, table_name, copy_format=None, batch_size=None):
+    """
+    Stream a DataFrame into an existing table with COPY ... FROM STDIN.
+    Rows are sent in batches of batch_size so the client never serializes
+    more than one batch at a time. Runs inside the caller's transaction.
+    """
+    copy_format = copy_format or COPY_FORMAT
+    batch_size = batch_size or COPY_BATCH_SIZE
+
+    # Only send the columns the target table declares (e.g. silver's
+    # transformed_at is not part of gold) — the rest fall back to defaults
+    types = _column_types(conn, table_name)
+    df = df[[c for c in df.columns if c in types]]
+    columns = ", ".join(f'"{c}"' for c in df.columns)
+    array_columns = [c for c in df.columns if types[c].startswith("_")]
+    if copy_format == "text" and array_columns:
+        # CSV has no list type — array columns go in as array literals
+        df = df.assign(**{c: df[c].map(_array_literal) for c in array_columns})
+
+    if copy_format == "binary":
+        try:
+            encoders = [BINARY_ENCODERS[types[c]] for c in df.columns]
+        except KeyError as e:
+            raise ValueError(f"Binary COPY does not support type {e} in {table_name}")
+        copy_sql = f"COPY {table_name} ({columns}) FROM STDIN WITH (FORMAT binary)"
+    elif copy_format == "text":
+        copy_sql = f"COPY {table_name} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+    else:
+        raise ValueError(f"Unknown COPY format: {copy_format}")
+
+    cursor = conn.connection.cursor()
+    try:
+        for start in range(0, len(df), batch_size):
+            batch = df.iloc[start:start + batch_size]
+            if copy_format == "binary":
+                payload = _binary_batch(batch, encoders)
+            else:
+                payload = _text_batch(batch)
+            count_bytes_written(payload.getbuffer().nbytes)
+            cursor.copy_expert(copy_sql, payload)
+    finally:
+        cursor.close()
+    return len(df)
+
+
+def ensure_unique_key(conn, table_name, key_columns):
+    """
+    Make sure ON CONFLICT has a unique index to target.
+    Tables created by an old to_sql(if_exists="replace") lost their primary key.
+    """
+    has_key = conn.execute(text("""
+        SELECT 1
+        FROM pg_index i
+        WHERE i.indrelid = CAST(:table_name AS regclass)
+          AND i.indisunique
+          AND ARRAY(
+              SELECT a.attname::text
+              FROM unnest(i.indkey) WITH ORDINALITY AS k(attnum, position)
+              JOIN pg_attribute a
+                ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+              ORDER BY k.position
+          ) = CAST(:key_columns AS text[])
+    """), {"table_name": table_name, "key_columns": list(key_columns)}).first()
+    if not has_key:
+        index_name = f"{table_name}_{'_'.join(key_columns)}_key"
+        conn.execute(text(
+            f"CREATE UNIQUE INDEX {index_name} ON {table_name} ({', '.join(key_columns)})"
+        ))
+
+
+def delete_moved_rows(conn, table_name, stage_table, row_key, key_columns,
+                      version_column=None):
+    """
+    Settle rows that match a staged row on row_key but not on the rest of
+    key_columns — on a partitioned table, an encounter whose date_of_service
+    changed. ON CONFLICT (key_columns) can't see that pair, so the merge
+    would keep both: the table's row is deleted when the staged one is at
+    least as new (by version_column), the staged one otherwise.
+    """
+    moved = [c for c in key_columns if c not in row_key]
+    if not moved:
+        return
+    matches = " AND ".join(f't."{c}" = s."{c}"' for c in row_key)
+    differs = " OR ".join(f't."{c}" IS DISTINCT FROM s."{c}"' for c in moved)
+    newer = ""
+    if version_column:
+        newer = f" AND (t.{version_column} IS NULL OR t.{version_column} <= s.{version_column})"
+    conn.execute(text(
+        f"DELETE FROM {table_name} t USING {stage_table} s "
+        f"WHERE {matches} AND ({differs}){newer}"
+    ))
+    # Whatever still differs is newer in the table than in the stage
+    conn.execute(text(
+        f"DELETE FROM {stage_table} s USING {table_name} t "
+        f"WHERE {matches} AND ({differs})"
+    ))
+
+
+def upsert_dataframe(conn, df, table_name, key_columns, version_column=None,
+                     copy_format=None, batch_size=None, row_key=None):
+    """
+    Merge a DataFrame into an existing table.
+    Rows are COPY'd into a temp staging table, then merged with
+    INSERT ... SELECT ... ON CONFLICT (key) DO UPDATE. When version_column is
+    given, an existing row is only overwritten by a row at least as new.
+    row_key, when narrower than key_columns (a partitioned table's key
+    includes date_of_service), identifies a row across its partitions: a
+    row that moved partition replaces its old self (see delete_moved_rows).
+    Runs inside the caller's transaction. Returns the number of rows written.
+    """
+    stage_table = f"_stage_{table_name}"
+    ensure_unique_key(conn, table_name, key_columns)
+    conn.execute(text(
+        f"CREATE TEMP TABLE {stage_table} (LIKE {table_name} INCLUDING DEFAULTS) "
+        f"ON COMMIT DROP"
+    ))
+    copy_dataframe(conn, df, stage_table, copy_format, batch_size)
+    if row_key:
+        delete_moved_rows(conn, table_name, stage_table, row_key, key_columns, version_column)
+
+    types = _column_types(conn, table_name)
+    columns = [c for c in df.columns if c in types]
+    column_list = ", ".join(f'"{c}"' for c in columns)
+    updates = ", ".join(
+        f'"{c}" = EXCLUDED."{c}"' for c in columns if c not in key_columns
+    )
+    merge_sql = f"""
+        INSERT INTO {table_name} ({column_list})
+        SELECT {column_list} FROM {stage_table}
+        ORDER BY {', '.join(key_columns)}
+        ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET {updates}
+    """
+    if version_column:
+        merge_sql += (
+            f" WHERE {table_name}.{version_column} IS NULL"
+            f" OR {table_name}.{version_column} <= EXCLUDED.{version_column}"
+        )
+    result = conn.execute(text(merge_sql))
+    conn.execute(text(f"DROP TABLE {stage_table}"))
+    return result.rowcount
+
+
+def update_dataframe(conn, df, table_name, key_columns, version_column=None,
+                     copy_format=None, batch_size=None):
+    """
+    Overwrite existing rows with a DataFrame's values, matched on
+    key_columns — which need not be a unique index, so a row of a
+    partitioned table whose date_of_service changed is moved to its new
+    partition instead of being inserted beside the old one. Rows without a
+    match are inserted. version_column works as in upsert_dataframe.
+    Runs inside the caller's transaction. Returns the number of rows written.
+    """
+    stage_table = f"_update_{table_name}"
+    conn.execute(text(
+        f"CREATE TEMP TABLE {stage_table} (LIKE {table_name} INCLUDING DEFAULTS) "
+        f"ON COMMIT DROP"
+    ))
+    copy_dataframe(conn, df, stage_table, copy_format, batch_size)
+
+    types = _column_types(conn, table_name)
+    columns = [c for c in df.columns if c in types]
+    column_list = ", ".join(f'"{c}"' for c in columns)
+    assignments = ", ".join(
+        f'"{c}" = s."{c}"' for c in columns if c not in key_columns
+    )
+    matches = " AND ".join(f't."{c}" = s."{c}"' for c in key_columns)
+    update_sql = f"UPDATE {table_name} t SET {assignments} FROM {stage_table} s WHERE {matches}"
+    if version_column:
+        update_sql += (
+            f" AND (t.{version_column} IS NULL OR t.{version_column} <= s.{version_column})"
+        )
+    updated = conn.execute(text(update_sql)).rowcount
+    inserted = conn.execute(text(f"""
+        INSERT INTO {table_name} ({column_list})
+        SELECT {column_list} FROM {stage_table} s
+        WHERE NOT EXISTS (SELECT 1 FROM {table_name} t WHERE {matches})
+    """)).rowcount
+    conn.execute(text(f"DROP TABLE {stage_table}"))
+    return updated + inserted
+
+
+def supports_copy(conn):
+    """True when the underlying DBAPI driver can stream COPY (psycopg2)."""
+    cursor = conn.connection.cursor()
+    try:
+        return hasattr(cursor, "copy_expert")
+    finally:
+        cursor.close()
+
+
+def clear_table(conn, table_name, scope=None):
+    """
+    Empty a table for a replace load: TRUNCATE, or — when scope maps
+    columns to values — DELETE only the rows of that scope.
+    """
+    if not scope:
+        conn.execute(text(f"TRUNCATE TABLE {table_name}"))
+        return
+    where = " AND ".join(f"{column} = :{column}" for column in scope)
+    conn.execute(text(f"DELETE FROM {table_name} WHERE {where}"), scope)
+
+
+def bulk_load(data, table_name, engine, if_exists="replace", method=None,
+              copy_format=None, batch_size=None, before_chunk=None, after_load=None,
+              scope=None):
+    """
+    Load a DataFrame — or an iterable of DataFrame chunks — into Postgres,
+    preferring COPY over INSERT.
+
+    - method="copy"  → TRUNCATE (for replace) + COPY in one transaction
+    - method="multi" → the original DataFrame.to_sql(method="multi") path,
+                       also TRUNCATE for replace so the table's DDL survives
+    Falls back to "multi" when the database driver has no COPY support.
+    Chunks are consumed one at a time, so a generator keeps memory bounded.
+    before_chunk(conn, chunk), if given, runs before each chunk is written
+    (e.g. to create the partitions it needs); after_load(conn) runs after
+    the rows are written. Both run inside the load transaction, so derived
+    objects commit (or roll back) with the load.
+    scope (e.g. {"tenant": ..., "ehr_source": ...}) narrows a replace to
+    the rows matching it, leaving every other scope's rows in place.
+    Returns a stats dict with rows, seconds, rows_per_sec and method used.
+    """
+    method = method or LOAD_METHOD
+    copy_format = copy_format or COPY_FORMAT
+    batch_size = batch_size or COPY_BATCH_SIZE
+    chunks = [data] if isinstance(data, pd.DataFrame) else data
+    started = time.perf_counter()
+    rows = 0
+
+    if method == "copy":
+        with engine.begin() as conn:
+            if supports_copy(conn):
+                table_exists = inspect(conn).has_table(table_name)
+                if table_exists and if_exists == "replace":
+                    clear_table(conn, table_name, scope)
+                for chunk in chunks:
+                    if not table_exists:
+                        chunk.head(0).to_sql(table_name, conn, index=False)
+                        table_exists = True
+                    if before_chunk:
+                        before_chunk(conn, chunk)
+                    rows += copy_dataframe(conn, chunk, table_name, copy_format, batch_size)
+                if after_load:
+                    after_load(conn)
+                method = f"copy/{copy_format}"
+            else:
+                method = "multi"
+    if method == "multi":
+        with engine.begin() as conn:
+            # Empty an existing table rather than letting to_sql drop it,
+            # which would throw away its keys and indexes
+            types = None
+            if inspect(conn).has_table(table_name):
+                types = _column_types(conn, table_name)
+                if if_exists == "replace":
+                    clear_table(conn, table_name, scope)
+                    if_exists = "append"
+            for chunk in chunks:
+                if types is not None:
+                    chunk = chunk[[c for c in chunk.columns if c in types]]
+                if before_chunk:
+                    before_chunk(conn, chunk)
+                chunk.to_sql(
+                    table_name,
+                    conn,
+                    if_exists=if_exists,
+                    index=False,
+                    method="multi"
+                )
+                if_exists = "append"
+                rows += len(chunk)
+            if after_load:
+                after_load(conn)
+
+    seconds = time.perf_counter() - started
+    return {
+        "rows": rows,
+        "seconds": round(seconds, 3),
+        "rows_per_sec": int(rows / seconds) if seconds > 0 else 0,
+        "method": method,
+    }
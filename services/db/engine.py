@@ -0,0 +1,104 @@
+import os
+import threading
+import pandas as pd
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Database connection
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PORT = os.getenv("DB_PORT", "5432")
+DB_NAME = os.getenv("DB_NAME", "zivian_db")
+DB_USER = os.getenv("DB_USER", "postgres")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "postgres123")
+
+# One pool per process: a pipeline task needs a connection or two, the
+# dashboard one per concurrent request
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+# Seconds before a pooled connection is replaced, so none outlives a
+# server-side idle timeout
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Limit on any single statement, in ms (0 = none) — loads can take a while,
+# interactive readers pass a tighter one to set_statement_timeout
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+# Rows per round trip when a read streams through a server-side cursor
+DB_STREAM_CHUNK_SIZE = int(os.getenv("DB_STREAM_CHUNK_SIZE", "50000"))
+# executemany() batching for psycopg2: INSERTs become multi-row VALUES,
+# UPDATE/DELETEs go through execute_batch
+DB_EXECUTEMANY_PAGE_SIZE = int(os.getenv("DB_EXECUTEMANY_PAGE_SIZE", "1000"))
+
+_engine = None
+_engine_pid = None
+_engine_lock = threading.Lock()
+
+
+def database_url():
+    return f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+
+def create_pipeline_engine():
+    """A new engine with the pipeline's pool, timeout and executemany settings."""
+    connect_args = {"application_name": "zivian-pipeline"}
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+    return create_engine(
+        database_url(),
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+        executemany_mode="values_plus_batch",
+        executemany_values_page_size=DB_EXECUTEMANY_PAGE_SIZE,
+        executemany_batch_page_size=DB_EXECUTEMANY_PAGE_SIZE,
+        connect_args=connect_args,
+    )
+
+
+def get_engine():
+    """
+    Process-wide pooled engine, created on first use. In a forked child
+    (Airflow task, backfill worker) the pool inherited from the parent is
+    dropped — without closing the parent's connections — and refilled.
+    """
+    global _engine, _engine_pid
+    if _engine is None or _engine_pid != os.getpid():
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_pipeline_engine()
+            elif _engine_pid != os.getpid():
+                _engine.dispose(close=False)
+            _engine_pid = os.getpid()
+    return _engine
+
+
+def set_statement_timeout(conn, milliseconds):
+    """Cap every statement for the rest of the caller's transaction (0 = no limit)."""
+    conn.execute(text(f"SET LOCAL statement_timeout = {int(milliseconds)}"))
+
+
+def advisory_xact_lock(conn, key):
+    """
+    Wait for the transaction-level advisory lock named key; it is held
+    until the caller's transaction commits or rolls back.
+    """
+    conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": key})
+
+
+def read_sql_chunks(sql, params=None, chunk_size=None, engine=None):
+    """
+    Run a query through a server-side (named) cursor and yield the result
+    as DataFrames of at most chunk_size rows, so neither the driver nor
+    pandas ever holds the whole result set. engine may also be a
+    connection, to read inside the caller's transaction.
+    """
+    chunk_size = chunk_size or DB_STREAM_CHUNK_SIZE
+    engine = engine or get_engine()
+    if isinstance(engine, Engine):
+        with engine.connect() as conn:
+            yield from read_sql_chunks(sql, params, chunk_size, conn)
+        return
+    conn = engine.execution_options(stream_results=True, max_row_buffer=chunk_size)
+    yield from pd.read_sql(text(sql), conn, params=params, chunksize=chunk_size)
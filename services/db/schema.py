@@ -0,0 +1,695 @@
+import json
+import os
+import re
+import sys
+from datetime import date, timedelta
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from dotenv import load_dotenv
+
+# Add project root to path so the plan check can also run as a plain script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from services.db.bulk_load import copy_dataframe, ensure_unique_key
+from services.db.engine import advisory_xact_lock
+
+load_dotenv()
+
+# none  = silver/gold are single heaps (original layout)
+# month | day = range-partitioned by date_of_service, one partition per period
+TABLE_PARTITIONING = os.getenv("TABLE_PARTITIONING", "none")
+# Periods around today created up front, so concurrent writers (backfill
+# workers) rarely need to add a partition; anything else lands in the
+# default partition until a load for that period creates its own
+PARTITION_PREMAKE = int(os.getenv("PARTITION_PREMAKE", "2"))
+PARTITION_LOOKBACK = int(os.getenv("PARTITION_LOOKBACK", "2"))
+
+PARTITIONED_TABLES = ["silver_encounters", "gold_encounters"]
+
+# Text search configuration clinical_notes is indexed (and searched) with.
+# Baked into the generated column — changing it means dropping the column
+# so ensure_table re-adds it
+NOTES_SEARCH_CONFIG = "english"
+# Kept up to date by Postgres on every insert / update, whichever load path
+# (COPY, merge, ELT, partition reload) wrote the row
+NOTES_TSV_DEFINITION = (
+    f"TSVECTOR GENERATED ALWAYS AS "
+    f"(to_tsvector('{NOTES_SEARCH_CONFIG}', coalesce(clinical_notes, ''))) STORED"
+)
+
+# One place for the pipeline's DDL. Loads TRUNCATE and refill these tables
+# instead of letting to_sql drop them, so keys and indexes survive every run.
+TABLE_DDL = {
+    "silver_encounters": """
+        CREATE TABLE IF NOT EXISTS {table} (
+            tenant              VARCHAR(50) NOT NULL,
+            ehr_source          VARCHAR(50) NOT NULL,
+            encounter_id        VARCHAR(20) NOT NULL,
+            patient_id          VARCHAR(20) NOT NULL,
+            app_id              VARCHAR(20),
+            physician_id        VARCHAR(20),
+            date_of_service     DATE,
+            state               VARCHAR(5),
+            status              VARCHAR(20),
+            medications         TEXT[],
+            clinical_notes      TEXT,
+            clinical_notes_tsv  {notes_tsv},
+            ingestion_timestamp TIMESTAMP,
+            transformed_at      TIMESTAMP DEFAULT NOW(),
+            PRIMARY KEY ({key})
+        ){partition_by};
+    """,
+    "gold_encounters": """
+        CREATE TABLE IF NOT EXISTS {table} (
+            tenant              VARCHAR(50) NOT NULL,
+            ehr_source          VARCHAR(50) NOT NULL,
+            encounter_id        VARCHAR(20) NOT NULL,
+            patient_id          VARCHAR(20) NOT NULL,
+            app_id              VARCHAR(20),
+            physician_id        VARCHAR(20),
+            date_of_service     DATE,
+            state               VARCHAR(5),
+            status              VARCHAR(20),
+            medications         TEXT[],
+            clinical_notes      TEXT,
+            clinical_notes_tsv  {notes_tsv},
+            ingestion_timestamp TIMESTAMP,
+            is_sampled          BOOLEAN DEFAULT FALSE,
+            sampling_reason     VARCHAR(50),
+            gold_loaded_at      TIMESTAMP DEFAULT NOW(),
+            PRIMARY KEY ({key})
+        ){partition_by};
+    """,
+    # One row per (run, dimension, value) — dimension is run, state,
+    # physician_id or date_of_service; the run row has an empty value and
+    # is the only one with a silver count
+    "gold_summary": """
+        CREATE SEQUENCE IF NOT EXISTS gold_summary_run_id_seq;
+        CREATE TABLE IF NOT EXISTS gold_summary (
+            run_id              BIGINT NOT NULL,
+            dimension           VARCHAR(20) NOT NULL,
+            dimension_value     VARCHAR(20) NOT NULL,
+            total               BIGINT NOT NULL,
+            completed           BIGINT NOT NULL,
+            sampled             BIGINT NOT NULL,
+            silver              BIGINT,
+            summarized_at       TIMESTAMP DEFAULT NOW(),
+            PRIMARY KEY (run_id, dimension, dimension_value)
+        );
+    """,
+    "pipeline_watermarks": """
+        CREATE TABLE IF NOT EXISTS pipeline_watermarks (
+            source_key          VARCHAR(200) PRIMARY KEY,
+            last_partition      VARCHAR(40) NOT NULL,
+            last_ingestion_ts   TIMESTAMP,
+            updated_at          TIMESTAMP DEFAULT NOW()
+        );
+    """,
+    "silver_processed_partitions": """
+        CREATE TABLE IF NOT EXISTS silver_processed_partitions (
+            source_key          VARCHAR(200) NOT NULL,
+            partition_name      VARCHAR(40) NOT NULL,
+            row_count           INTEGER,
+            processed_at        TIMESTAMP DEFAULT NOW(),
+            PRIMARY KEY (source_key, partition_name)
+        );
+    """,
+}
+
+# Business key of each fact table — re-asserted on tables a legacy
+# to_sql(if_exists="replace") rebuilt without their primary key. A
+# partitioned table's key must include the partition column. encounter_ids
+# are only unique within one EHR source, so the source is part of the key.
+TABLE_KEYS = {
+    "silver_encounters": ["tenant", "ehr_source", "encounter_id"],
+    "gold_encounters": ["tenant", "ehr_source", "encounter_id"],
+}
+
+# Columns added to a table after it first shipped, with the value
+# rows already in an older table get: those were all loaded from the one
+# TENANT / EHR_SOURCE the pipeline was configured for. None = the
+# definition fills old rows itself (a generated column, or NULL)
+ADDED_COLUMNS = {
+    table_name: {
+        "tenant": ("VARCHAR(50) NOT NULL", os.getenv("TENANT", "zivian")),
+        "ehr_source": ("VARCHAR(50) NOT NULL", os.getenv("EHR_SOURCE", "athenahealth")),
+        "clinical_notes_tsv": (NOTES_TSV_DEFINITION, None),
+    }
+    for table_name in ("silver_encounters", "gold_encounters")
+}
+ADDED_COLUMNS["gold_summary"] = {
+    "silver": ("BIGINT", None),
+}
+
+
+# Columns whose type changed after the table first shipped:
+# column -> (new type, its pg_type name, USING expression for old rows)
+CHANGED_COLUMNS = {
+    table_name: {
+        # Was a comma-joined string; an array is what the GIN index needs
+        "medications": ("TEXT[]", "_text", "string_to_array(medications, ',')"),
+    }
+    for table_name in ("silver_encounters", "gold_encounters")
+}
+
+
+def is_partitioning_enabled(table_name):
+    return TABLE_PARTITIONING != "none" and table_name in PARTITIONED_TABLES
+
+
+def table_key(table_name):
+    """Columns ON CONFLICT merges into table_name must target."""
+    key = list(TABLE_KEYS[table_name])
+    if is_partitioning_enabled(table_name):
+        key.append("date_of_service")
+    return key
+
+
+def table_ddl(table_name, as_name=None):
+    """
+    CREATE statement(s) for a managed table under the current settings.
+    as_name builds the same fact table under another name (a load's
+    staging copy); its partitions and indexes take that name as prefix.
+    """
+    if table_name not in TABLE_KEYS:
+        return TABLE_DDL[table_name]
+    as_name = as_name or table_name
+    partition_by = ""
+    if is_partitioning_enabled(table_name):
+        partition_by = (
+            f" PARTITION BY RANGE (date_of_service);\n"
+            f"        CREATE TABLE IF NOT EXISTS {as_name}_default "
+            f"PARTITION OF {as_name} DEFAULT"
+        )
+    return TABLE_DDL[table_name].format(
+        table=as_name, key=", ".join(table_key(table_name)), partition_by=partition_by,
+        notes_tsv=NOTES_TSV_DEFINITION
+    )
+
+# The small chart columns the review queries return, carried in the sampled
+# index so a page is found and filtered without touching the heap; notes
+# and medications are read from the heap for the page's rows only (a long
+# note would overflow the btree's ~2.7KB tuple limit)
+CHART_INDEX_INCLUDE = "patient_id, physician_id, state, sampling_reason"
+
+TABLE_INDEXES = {
+    "silver_encounters": {
+        "silver_encounters_patient_id_idx": "(patient_id)",
+        "silver_encounters_physician_id_idx": "(physician_id)",
+        "silver_encounters_medications_idx": "USING GIN (medications)",
+        "silver_encounters_notes_tsv_idx": "USING GIN (clinical_notes_tsv)",
+    },
+    "gold_encounters": {
+        # Matches ORDER BY date_of_service DESC, encounter_id DESC (then the
+        # source, as tie-break) in the dashboard and chart_viewer, over
+        # sampled rows only
+        "gold_encounters_sampled_page_idx": (
+            f"(date_of_service DESC, encounter_id DESC, tenant DESC, ehr_source DESC) "
+            f"INCLUDE ({CHART_INDEX_INCLUDE}) WHERE is_sampled"
+        ),
+        "gold_encounters_patient_id_idx": "(patient_id)",
+        "gold_encounters_physician_id_idx": "(physician_id)",
+        # medications @> ARRAY[ndc] lookups over the charts under review
+        "gold_encounters_sampled_medications_idx": "USING GIN (medications) WHERE is_sampled",
+        # Full-text search over the notes of the charts under review
+        "gold_encounters_sampled_notes_tsv_idx": (
+            "USING GIN (clinical_notes_tsv) WHERE is_sampled"
+        ),
+    },
+}
+
+
+# Indexes an older version created and a replacement now covers
+RETIRED_INDEXES = {
+    # INCLUDEd clinical_notes and medications — now gold_encounters_sampled_page_idx
+    "gold_encounters": ["gold_encounters_sampled_dos_idx"],
+}
+
+
+def create_indexes(conn, table_name, as_name=None):
+    """
+    Create any missing secondary index of a managed table (or of its
+    staging copy as_name, with index names prefixed to match), and drop
+    its retired ones.
+    """
+    as_name = as_name or table_name
+    for index_name in RETIRED_INDEXES.get(table_name, []):
+        index_name = as_name + index_name[len(table_name):]
+        conn.execute(text(f"DROP INDEX IF EXISTS {index_name}"))
+    for index_name, definition in TABLE_INDEXES.get(table_name, {}).items():
+        index_name = as_name + index_name[len(table_name):]
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS {index_name} ON {as_name} {definition}"
+        ))
+
+
+def add_missing_columns(conn, table_name):
+    """
+    Add the ADDED_COLUMNS an older table lacks. Existing rows are filled
+    with the column's backfill value, which then stops being a default
+    (generated columns compute theirs).
+    """
+    existing = set(conn.execute(text("""
+        SELECT column_name FROM information_schema.columns WHERE table_name = :table_name
+    """), {"table_name": table_name}).scalars())
+    for column, (definition, backfill) in ADDED_COLUMNS.get(table_name, {}).items():
+        if column in existing:
+            continue
+        if backfill is None:
+            conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column} {definition}"))
+            print(f"[SCHEMA] Added {table_name}.{column}")
+            continue
+        value = backfill.replace("'", "''")
+        conn.execute(text(
+            f"ALTER TABLE {table_name} ADD COLUMN {column} {definition} DEFAULT '{value}'"
+        ))
+        conn.execute(text(f"ALTER TABLE {table_name} ALTER COLUMN {column} DROP DEFAULT"))
+        print(f"[SCHEMA] Added {table_name}.{column} (existing rows: {backfill})")
+
+
+def convert_changed_columns(conn, table_name):
+    """
+    Convert the CHANGED_COLUMNS of an older table to their new type in
+    place, rewriting existing values with the column's USING expression.
+    """
+    current = dict(conn.execute(text("""
+        SELECT column_name, udt_name FROM information_schema.columns
+        WHERE table_name = :table_name
+    """), {"table_name": table_name}).all())
+    for column, (definition, type_name, using) in CHANGED_COLUMNS.get(table_name, {}).items():
+        if column not in current or current[column] == type_name:
+            continue
+        conn.execute(text(
+            f"ALTER TABLE {table_name} ALTER COLUMN {column} TYPE {definition} USING {using}"
+        ))
+        print(f"[SCHEMA] Converted {table_name}.{column} from {current[column]} to {definition}")
+
+
+def insertable_columns(conn, table_name):
+    """Column names of table_name in order, generated columns left out."""
+    return conn.execute(text("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_name = :table_name AND is_generated = 'NEVER'
+        ORDER BY ordinal_position
+    """), {"table_name": table_name}).scalars().all()
+
+
+def drop_narrower_keys(conn, table_name, key_columns):
+    """
+    Drop unique keys on a strict subset of key_columns (e.g. the old
+    encounter_id primary key): they would reject rows the key allows.
+    """
+    rows = conn.execute(text("""
+        SELECT ic.relname, con.conname, ARRAY(
+            SELECT a.attname::text
+            FROM unnest(i.indkey) AS k(attnum)
+            JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+        )
+        FROM pg_index i
+        JOIN pg_class ic ON ic.oid = i.indexrelid
+        LEFT JOIN pg_constraint con ON con.conindid = i.indexrelid
+                                   AND con.conrelid = i.indrelid
+        WHERE i.indrelid = CAST(:table_name AS regclass) AND i.indisunique
+    """), {"table_name": table_name})
+    for index_name, constraint_name, columns in rows.all():
+        if not set(columns) < set(key_columns):
+            continue
+        if constraint_name:
+            conn.execute(text(f"ALTER TABLE {table_name} DROP CONSTRAINT {constraint_name}"))
+        else:
+            conn.execute(text(f"DROP INDEX {index_name}"))
+        print(f"[SCHEMA] Dropped {index_name} on ({', '.join(columns)}) — "
+              f"{table_name} is now keyed on ({', '.join(key_columns)})")
+
+
+def ensure_table(engine_or_conn, table_name):
+    """
+    Create a managed table with its key and indexes, or repair an existing
+    one that lost them. Accepts an engine or a connection inside the
+    caller's transaction.
+    """
+    if table_name not in TABLE_DDL:
+        raise ValueError(f"No managed DDL for table {table_name}")
+
+    def apply(conn):
+        conn.execute(text(table_ddl(table_name)))
+        add_missing_columns(conn, table_name)
+        convert_changed_columns(conn, table_name)
+        partitioned = is_partitioned(conn, table_name)
+        if is_partitioning_enabled(table_name) and not partitioned:
+            print(f"[SCHEMA] WARNING: {table_name} is not partitioned — run "
+                  f"python services/db/schema.py --migrate to convert it")
+        elif partitioned and not is_partitioning_enabled(table_name):
+            print(f"[SCHEMA] WARNING: {table_name} is partitioned but "
+                  f"TABLE_PARTITIONING is {TABLE_PARTITIONING}")
+            create_indexes(conn, table_name)
+            return
+        if table_name in TABLE_KEYS:
+            drop_narrower_keys(conn, table_name, table_key(table_name))
+            ensure_unique_key(conn, table_name, table_key(table_name))
+        create_indexes(conn, table_name)
+        if partitioned:
+            ensure_partition_window(conn, table_name)
+
+    if isinstance(engine_or_conn, Engine):
+        with engine_or_conn.begin() as conn:
+            apply(conn)
+    else:
+        apply(engine_or_conn)
+
+
+def ensure_schema(engine):
+    """Create or repair every managed table."""
+    for table_name in TABLE_DDL:
+        ensure_table(engine, table_name)
+
+
+def partition_bounds(day, granularity=None):
+    """(start, end, name suffix) of the partition period containing day."""
+    granularity = granularity or TABLE_PARTITIONING
+    if granularity == "month":
+        start = date(day.year, day.month, 1)
+        end = date(day.year + (day.month == 12), day.month % 12 + 1, 1)
+        return start, end, start.strftime("%Y_%m")
+    if granularity == "day":
+        start = date(day.year, day.month, day.day)
+        return start, start + timedelta(days=1), start.strftime("%Y_%m_%d")
+    raise ValueError(f"Unknown partition granularity: {granularity}")
+
+
+def partition_name(table_name, day):
+    return f"{table_name}_p{partition_bounds(day)[2]}"
+
+
+def is_partitioned(conn, table_name):
+    return conn.execute(text("""
+        SELECT 1 FROM pg_partitioned_table
+        WHERE partrelid = to_regclass(:table_name)
+    """), {"table_name": table_name}).first() is not None
+
+
+def list_partitions(conn, table_name):
+    """[(partition name, start, end)] of a partitioned table, default excluded."""
+    rows = conn.execute(text("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(:table_name)
+        ORDER BY c.relname
+    """), {"table_name": table_name})
+    partitions = []
+    for name, bound in rows:
+        match = re.search(r"FROM \('([\d-]+)'\) TO \('([\d-]+)'\)", bound)
+        if match:
+            partitions.append((
+                name, date.fromisoformat(match.group(1)), date.fromisoformat(match.group(2))
+            ))
+    return partitions
+
+
+def create_partition(conn, table_name, day):
+    """
+    Add the partition for day's period. Rows of that period already parked
+    in the default partition move into it, then it is attached — so a
+    period can gain its own partition at any time.
+    """
+    start, end, _ = partition_bounds(day)
+    name = partition_name(table_name, day)
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {name} "
+        f"(LIKE {table_name} INCLUDING DEFAULTS INCLUDING GENERATED)"
+    ))
+    columns = ", ".join(insertable_columns(conn, table_name))
+    conn.execute(text(f"""
+        WITH moved AS (
+            DELETE FROM {table_name}_default
+            WHERE date_of_service >= :start AND date_of_service < :end
+            RETURNING {columns}
+        )
+        INSERT INTO {name} ({columns}) SELECT {columns} FROM moved
+    """), {"start": start, "end": end})
+    conn.execute(text(
+        f"ALTER TABLE {table_name} ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ('{start}') TO ('{end}')"
+    ))
+    print(f"[SCHEMA] Created partition {name} [{start}, {end})")
+    return name
+
+
+def ensure_partitions(conn, table_name, dates):
+    """
+    Make sure every date_of_service in dates has its own partition.
+    Runs in the caller's load transaction, before the rows are written.
+    No-op for tables that aren't partitioned (or with partitioning off).
+    Parallel loads (one per source) can need the same new period, so
+    partition DDL on a table is serialized: the second load waits for the
+    first to commit and then finds the partition already there.
+    """
+    if TABLE_PARTITIONING == "none" or not is_partitioned(conn, table_name):
+        return []
+    days = pd.to_datetime(pd.Series(list(dates)), errors="coerce").dropna()
+    if days.empty:
+        return []
+    periods = {partition_bounds(d)[0] for d in days.dt.date.unique()}
+    if not periods - {start for _, start, _ in list_partitions(conn, table_name)}:
+        return []
+    advisory_xact_lock(conn, f"partitions:{table_name}")
+    existing = {start for _, start, _ in list_partitions(conn, table_name)}
+    return [create_partition(conn, table_name, d) for d in sorted(periods - existing)]
+
+
+def partition_hook(table_name):
+    """bulk_load before_chunk hook creating partitions for each chunk, or None."""
+    if not is_partitioning_enabled(table_name):
+        return None
+    return lambda conn, chunk: ensure_partitions(conn, table_name, chunk["date_of_service"])
+
+
+def ensure_partition_window(conn, table_name, today=None):
+    """Pre-create PARTITION_LOOKBACK periods back through PARTITION_PREMAKE ahead."""
+    start, _, _ = partition_bounds(today or date.today())
+    days = [start]
+    previous, following = start, start
+    for _ in range(PARTITION_LOOKBACK):
+        previous = partition_bounds(previous - timedelta(days=1))[0]
+        days.append(previous)
+    for _ in range(PARTITION_PREMAKE):
+        following = partition_bounds(following)[1]
+        days.append(following)
+    return ensure_partitions(conn, table_name, days)
+
+
+def drop_partition(conn, table_name, day):
+    """Purge one period: drop its partition instead of a bulk DELETE."""
+    name = partition_name(table_name, day)
+    conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+    print(f"[SCHEMA] Dropped partition {name}")
+
+
+def drop_partitions_before(conn, table_name, cutoff):
+    """Retention: drop every partition that ends on or before cutoff."""
+    dropped = []
+    for name, _, end in list_partitions(conn, table_name):
+        if end <= cutoff:
+            conn.execute(text(f"DROP TABLE {name}"))
+            dropped.append(name)
+    print(f"[SCHEMA] Dropped {len(dropped)} partition(s) of {table_name} before {cutoff}")
+    return dropped
+
+
+def swap_partition(conn, table_name, day, replacement_table):
+    """
+    Replace a period's partition with a fully loaded table of the same
+    shape: detach + drop the old one, rename and attach the new one.
+    A CHECK constraint matching the bounds lets ATTACH skip its scan.
+    """
+    start, end, _ = partition_bounds(day)
+    name = partition_name(table_name, day)
+    conn.execute(text(
+        f"ALTER TABLE {replacement_table} ADD CONSTRAINT {replacement_table}_bounds "
+        f"CHECK (date_of_service IS NOT NULL AND date_of_service >= '{start}' "
+        f"AND date_of_service < '{end}')"
+    ))
+    if name in {n for n, _, _ in list_partitions(conn, table_name)}:
+        conn.execute(text(f"ALTER TABLE {table_name} DETACH PARTITION {name}"))
+        conn.execute(text(f"DROP TABLE {name}"))
+    conn.execute(text(f"ALTER TABLE {replacement_table} RENAME TO {name}"))
+    conn.execute(text(
+        f"ALTER TABLE {table_name} ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ('{start}') TO ('{end}')"
+    ))
+    conn.execute(text(f"ALTER TABLE {name} DROP CONSTRAINT {replacement_table}_bounds"))
+
+
+def reload_partition(engine, table_name, day, df):
+    """
+    Reload one period of a partitioned table from df (rows outside the
+    period are rejected): the rows are COPY'd into a side table which is
+    then swapped in, so readers see either the old or the new period.
+    """
+    replacement = f"{partition_name(table_name, day)}_reload"
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE TABLE {replacement} (LIKE {table_name} INCLUDING DEFAULTS INCLUDING GENERATED)"
+        ))
+        rows = copy_dataframe(conn, df, replacement)
+        swap_partition(conn, table_name, day, replacement)
+    print(f"[SCHEMA] Reloaded {rows} rows into {partition_name(table_name, day)}")
+    return rows
+
+
+def migrate_to_partitioned(engine, table_name):
+    """
+    Convert an existing heap table into the partitioned layout: the heap
+    (and its indexes) are renamed aside, the partitioned table is created
+    with a partition per period found in the data, rows are copied across
+    and the heap is dropped — all in one transaction.
+    """
+    old_table = f"{table_name}_unpartitioned"
+    with engine.begin() as conn:
+        if is_partitioned(conn, table_name):
+            print(f"[SCHEMA] {table_name} is already partitioned")
+            return
+        missing_dates = conn.execute(text(
+            f"SELECT COUNT(*) FROM {table_name} WHERE date_of_service IS NULL"
+        )).scalar()
+        if missing_dates:
+            raise ValueError(
+                f"{table_name} has {missing_dates} row(s) without date_of_service; "
+                f"they cannot be placed in a date partition"
+            )
+        # Bring the heap's columns up to date first, so its rows copy as-is
+        add_missing_columns(conn, table_name)
+        convert_changed_columns(conn, table_name)
+        conn.execute(text(f"ALTER TABLE {table_name} RENAME TO {old_table}"))
+        index_names = conn.execute(text(
+            "SELECT indexname FROM pg_indexes WHERE tablename = :table_name"
+        ), {"table_name": old_table}).scalars().all()
+        for index_name in index_names:
+            conn.execute(text(
+                f"ALTER INDEX {index_name} RENAME TO {index_name[:48]}_unpartitioned"
+            ))
+
+        ensure_table(conn, table_name)
+        dates = conn.execute(text(f"SELECT DISTINCT date_of_service FROM {old_table}")).scalars()
+        ensure_partitions(conn, table_name, dates)
+        columns = ", ".join(insertable_columns(conn, table_name))
+        moved = conn.execute(text(
+            f"INSERT INTO {table_name} ({columns}) SELECT {columns} FROM {old_table}"
+        )).rowcount
+        conn.execute(text(f"DROP TABLE {old_table}"))
+    print(f"[SCHEMA] Migrated {moved} rows of {table_name} into date partitions")
+
+
+def explain(conn, sql, params=None):
+    """EXPLAIN (FORMAT JSON) a query and return the top plan node."""
+    result = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"), params or {}).scalar()
+    plan = result if isinstance(result, list) else json.loads(result)
+    return plan[0]["Plan"]
+
+
+def plan_indexes(plan):
+    """Names of every index the plan reads, depth first (partition-level names)."""
+    names = []
+    if "Index Name" in plan:
+        names.append(plan["Index Name"])
+    for child in plan.get("Plans", []):
+        names.extend(plan_indexes(child))
+    return names
+
+
+def check_query_plans(engine, queries, force_index=True):
+    """
+    EXPLAIN each (label, sql, params, expected_index) query and report
+    whether the plan reads the expected index. force_index turns off
+    sequential scans for the check, so a small dev table still shows
+    whether the index is usable. Returns the labels that missed.
+    """
+    missed = []
+    with engine.begin() as conn:
+        if force_index:
+            conn.execute(text("SET LOCAL enable_seqscan = off"))
+        for label, sql, params, expected_index in queries:
+            # On a partitioned table the plan names each partition's index;
+            # report the parent index they all belong to
+            used = []
+            for index_name in plan_indexes(explain(conn, sql, params)):
+                root = conn.execute(text(
+                    "SELECT CAST(pg_partition_root(to_regclass(:index_name)) AS text)"
+                ), {"index_name": index_name}).scalar()
+                if (root or index_name) not in used:
+                    used.append(root or index_name)
+            ok = expected_index in used
+            if not ok:
+                missed.append(label)
+            print(f"[SCHEMA] {'OK  ' if ok else 'MISS'} {label}: "
+                  f"{', '.join(used) or 'no index'}")
+    return missed
+
+
+def review_queries():
+    """
+    (label, sql, params, expected_index) of every review query the indexes
+    exist for — the dashboard pages, its filters and search, chart_viewer
+    and the gold lookups — for check_query_plans.
+    """
+    from services.dashboard import build_charts_query, build_search_query
+    from services.chart_viewer import CHARTS_SQL
+
+    return [
+        ("dashboard first page",
+         *build_charts_query({}, None, 50), "gold_encounters_sampled_page_idx"),
+        ("dashboard next page",
+         *build_charts_query({}, (date.today(), "ENC-99999", "zivian", "athenahealth"), 50),
+         "gold_encounters_sampled_page_idx"),
+        ("dashboard filtered page",
+         *build_charts_query({"state": "CA", "medication": "NDC-0069-0001"}, None, 50),
+         "gold_encounters_sampled_medications_idx"),
+        # One NDC matches ~40% of the generated charts — walking the page
+        # index in order beats the GIN lookup plus a sort
+        ("dashboard by medication",
+         *build_charts_query({"medication": "NDC-0069-0003"}, None, 50),
+         "gold_encounters_sampled_page_idx"),
+        ("dashboard search",
+         *build_search_query("chest pain", {}, None, 50),
+         "gold_encounters_sampled_notes_tsv_idx"),
+        ("dashboard search next page",
+         *build_search_query("chest pain", {"state": "CA"},
+                             (0.05, "ENC-99999", "zivian", "athenahealth"), 50),
+         "gold_encounters_sampled_notes_tsv_idx"),
+        ("chart_viewer report", CHARTS_SQL, {}, "gold_encounters_sampled_page_idx"),
+        ("gold by patient", "SELECT * FROM gold_encounters WHERE patient_id = :p",
+         {"p": "PAT-0001"}, "gold_encounters_patient_id_idx"),
+        ("gold by physician", "SELECT * FROM gold_encounters WHERE physician_id = :p",
+         {"p": "PHY-001"}, "gold_encounters_physician_id_idx"),
+    ]
+
+
+if __name__ == "__main__":
+    import argparse
+    from services.db.engine import get_engine
+
+    parser = argparse.ArgumentParser(description="Schema management for the pipeline tables")
+    parser.add_argument("--migrate", action="store_true",
+                        help="convert silver/gold heaps to TABLE_PARTITIONING partitions")
+    parser.add_argument("--drop-before", help="drop silver/gold partitions ending on or "
+                                              "before this date (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("SCHEMA CHECK — REVIEW QUERY PLANS")
+    print("=" * 60)
+
+    engine = get_engine()
+    if args.migrate:
+        for table_name in PARTITIONED_TABLES:
+            migrate_to_partitioned(engine, table_name)
+    ensure_schema(engine)
+    if args.drop_before:
+        with engine.begin() as conn:
+            for table_name in PARTITIONED_TABLES:
+                drop_partitions_before(conn, table_name, date.fromisoformat(args.drop_before))
+
+    missed = check_query_plans(engine, review_queries())
+    sys.exit(1 if missed else 0)
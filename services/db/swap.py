@@ -0,0 +1,231 @@
+import os
+import sys
+import time
+from contextlib import contextmanager
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from dotenv import load_dotenv
+
+# Add project root to path so rollbacks can also run as a plain script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from services.db.bulk_load import (
+    LOAD_METHOD, COPY_FORMAT, COPY_BATCH_SIZE, _column_types, copy_dataframe, supports_copy
+)
+from services.db.schema import (
+    create_indexes, ensure_partition_window, ensure_partitions, is_partitioned, table_ddl
+)
+
+load_dotenv()
+
+# false = TRUNCATE + refill the live table (readers wait for the whole load)
+# true  = replace loads fill a staging copy and rename it into place; opt-in,
+#         as the copy plus SWAP_SNAPSHOTS old versions need up to
+#         (2 + SWAP_SNAPSHOTS)x the table's disk space while a load runs
+SWAP_LOADS = os.getenv("SWAP_LOADS", "false").lower() == "true"
+# Previous versions kept after a swap, for rollback (0 = drop the old table)
+SWAP_SNAPSHOTS = int(os.getenv("SWAP_SNAPSHOTS", "1"))
+# How long the swap waits for readers' locks before backing off and retrying
+SWAP_LOCK_TIMEOUT = os.getenv("SWAP_LOCK_TIMEOUT", "5s")
+SWAP_MAX_RETRIES = int(os.getenv("SWAP_MAX_RETRIES", "5"))
+
+LOCK_NOT_AVAILABLE = "55P03"
+
+
+def staging_name(table_name):
+    return f"{table_name}_new"
+
+
+def snapshot_name(table_name, generation):
+    return f"{table_name}_old{generation}"
+
+
+def relation_family(conn, table_name):
+    """
+    [(name, relkind)] of a table, its partitions and every index on them —
+    everything whose name carries the table's prefix. Empty if the table
+    doesn't exist.
+    """
+    if conn.execute(text("SELECT to_regclass(:t)"), {"t": table_name}).scalar() is None:
+        return []
+    rows = conn.execute(text("""
+        WITH tables AS (
+            SELECT CAST(:table_name AS regclass) AS relid
+            UNION
+            SELECT relid FROM pg_partition_tree(CAST(:table_name AS regclass))
+        )
+        SELECT c.relname, c.relkind
+        FROM tables t JOIN pg_class c ON c.oid = t.relid
+        UNION ALL
+        SELECT ic.relname, ic.relkind
+        FROM tables t
+        JOIN pg_index i ON i.indrelid = t.relid
+        JOIN pg_class ic ON ic.oid = i.indexrelid
+    """), {"table_name": table_name})
+    return [(name, kind) for name, kind in rows]
+
+
+def rename_family(conn, table_name, new_name):
+    """
+    Rename a table together with its partitions and indexes, swapping the
+    table_name prefix for new_name, so the next staging copy can reuse the
+    names. Catalog-only: no data is rewritten.
+    """
+    family = relation_family(conn, table_name)
+    # Indexes and partitions first, the parent table last
+    family.sort(key=lambda member: (member[0] == table_name, member[1] not in ("i", "I")))
+    for name, kind in family:
+        if not name.startswith(table_name):
+            continue
+        renamed = (new_name + name[len(table_name):])[:63]
+        statement = "ALTER INDEX" if kind in ("i", "I") else "ALTER TABLE"
+        conn.execute(text(f'{statement} "{name}" RENAME TO "{renamed}"'))
+
+
+def create_staging_table(conn, table_name):
+    """
+    Fresh, empty copy of a managed table to load into — same columns, key
+    and partition layout, but no secondary indexes yet (they are built
+    once the rows are in). Leftovers of an interrupted load are dropped.
+    """
+    staging = staging_name(table_name)
+    conn.execute(text(f"DROP TABLE IF EXISTS {staging}"))
+    conn.execute(text(table_ddl(table_name, as_name=staging)))
+    if is_partitioned(conn, staging):
+        ensure_partition_window(conn, staging)
+    return staging
+
+
+def _swap(conn, table_name, snapshots):
+    staging = staging_name(table_name)
+    if snapshots > 0:
+        conn.execute(text(f"DROP TABLE IF EXISTS {snapshot_name(table_name, snapshots)}"))
+        for generation in range(snapshots - 1, 0, -1):
+            rename_family(conn, snapshot_name(table_name, generation),
+                          snapshot_name(table_name, generation + 1))
+        rename_family(conn, table_name, snapshot_name(table_name, 1))
+    else:
+        conn.execute(text(f"DROP TABLE IF EXISTS {table_name}"))
+    rename_family(conn, staging, table_name)
+
+
+def swap_in(conn, table_name, snapshots=None):
+    """
+    Put the loaded staging copy live with a handful of renames, keeping
+    the replaced table as snapshot _old1 (older ones shift to _old2 ...).
+    Waits at most SWAP_LOCK_TIMEOUT for readers; on a timeout the swap is
+    rolled back to a savepoint and retried, so the load never queues
+    every new reader behind its lock for long.
+    """
+    snapshots = SWAP_SNAPSHOTS if snapshots is None else snapshots
+    conn.execute(text(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'"))
+    for attempt in range(1, SWAP_MAX_RETRIES + 1):
+        savepoint = conn.begin_nested()
+        try:
+            _swap(conn, table_name, snapshots)
+            savepoint.commit()
+            break
+        except OperationalError as e:
+            savepoint.rollback()
+            if getattr(e.orig, "pgcode", None) != LOCK_NOT_AVAILABLE \
+                    or attempt == SWAP_MAX_RETRIES:
+                raise
+            print(f"[SWAP] {table_name} busy, retrying swap ({attempt})...")
+            time.sleep(attempt)
+    conn.execute(text("SET LOCAL lock_timeout = 0"))
+    print(f"[SWAP] {staging_name(table_name)} swapped in as {table_name} "
+          f"({snapshots} snapshot(s) kept)")
+
+
+@contextmanager
+def swap_into(conn, table_name, snapshots=None):
+    """
+    Load a managed table through a staging copy, inside the caller's
+    transaction:
+
+        with swap_into(conn, "silver_encounters") as staging:
+            ... write rows into staging ...
+
+    On exit the staging copy gets its indexes and fresh statistics and is
+    swapped in. Readers keep seeing the previous table until the caller
+    commits; if the body raises, nothing is swapped.
+    """
+    staging = create_staging_table(conn, table_name)
+    yield staging
+    create_indexes(conn, table_name, as_name=staging)
+    conn.execute(text(f"ANALYZE {staging}"))
+    swap_in(conn, table_name, snapshots)
+
+
+def swap_load(data, table_name, engine, method=None, copy_format=None,
+              batch_size=None, after_load=None, snapshots=None):
+    """
+    bulk_load(if_exists="replace") through a staging copy: rows are COPY'd
+    (or inserted, for method="multi") into the staging table, which is
+    then indexed and swapped in. after_load(conn) runs after the swap, in
+    the same transaction, so it already sees the new table.
+    Returns the same stats dict as bulk_load.
+    """
+    method = method or LOAD_METHOD
+    copy_format = copy_format or COPY_FORMAT
+    batch_size = batch_size or COPY_BATCH_SIZE
+    chunks = [data] if isinstance(data, pd.DataFrame) else data
+    started = time.perf_counter()
+    rows = 0
+
+    with engine.begin() as conn:
+        if method == "copy" and not supports_copy(conn):
+            method = "multi"
+        with swap_into(conn, table_name, snapshots) as staging:
+            types = _column_types(conn, staging)
+            for chunk in chunks:
+                if "date_of_service" in chunk.columns:
+                    ensure_partitions(conn, staging, chunk["date_of_service"])
+                if method == "copy":
+                    rows += copy_dataframe(conn, chunk, staging, copy_format, batch_size)
+                else:
+                    chunk[[c for c in chunk.columns if c in types]].to_sql(
+                        staging, conn, if_exists="append", index=False, method="multi"
+                    )
+                    rows += len(chunk)
+        if after_load:
+            after_load(conn)
+
+    seconds = time.perf_counter() - started
+    return {
+        "rows": rows,
+        "seconds": round(seconds, 3),
+        "rows_per_sec": int(rows / seconds) if seconds > 0 else 0,
+        "method": f"swap+{method}/{copy_format}" if method == "copy" else f"swap+{method}",
+    }
+
+
+def rollback_swap(engine, table_name, generation=1):
+    """
+    Put snapshot _old<generation> back live; the current table takes its
+    place as that snapshot, so a rollback can itself be undone.
+    """
+    snapshot = snapshot_name(table_name, generation)
+    parked = f"{table_name}_rollback"
+    with engine.begin() as conn:
+        if conn.execute(text("SELECT to_regclass(:t)"), {"t": snapshot}).scalar() is None:
+            raise ValueError(f"No snapshot {snapshot} to roll back to")
+        conn.execute(text(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'"))
+        rename_family(conn, table_name, parked)
+        rename_family(conn, snapshot, table_name)
+        rename_family(conn, parked, snapshot)
+    print(f"[SWAP] Rolled {table_name} back to {snapshot}")
+
+
+if __name__ == "__main__":
+    import argparse
+    from services.db.engine import get_engine
+
+    parser = argparse.ArgumentParser(description="Roll a swapped table back to a snapshot")
+    parser.add_argument("table", help="e.g. gold_encounters")
+    parser.add_argument("--generation", type=int, default=1,
+                        help="snapshot to restore: 1 = the table replaced by the last load")
+    args = parser.parse_args()
+
+    rollback_swap(get_engine(), args.table, args.generation)
@@ -1,11 +1,23 @@
-import json
 import os
+import shutil
+import sys
 import uuid
 from datetime import datetime, timedelta
 from faker import Faker
 from dotenv import load_dotenv
 import random
 
+# Add project root to path so this stage can also run as a plain script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from services.bronze.bronze_files import (
+    BRONZE_FORMAT, BRONZE_COMPRESSION, write_bronze_file
+)
+from services.bronze.bronze_catalog import (
+    new_partition_stats, track_records, register_partition
+)
+from services.metrics.stage_metrics import measure
+
 # Load environment variables
 load_dotenv()
 
@@ -17,14 +29,11 @@ TENANT = os.getenv("TENANT", "zivian")
 ENVIRONMENT = os.getenv("ENVIRONMENT", "dev")
 EHR_SOURCE = os.getenv("EHR_SOURCE", "athenahealth")
 
-def generate_encounters(num_records=1000):
+def iter_encounters(num_records=1000):
     """
-    Simulates pulling encounter data from AthenaHealth API.
-    In real project this would be an actual API call with OAuth2.
+    Yield simulated encounters one at a time — the same records, in the
+    same order, that generate_encounters returns as a list.
     """
-    print(f"[EXTRACT] Generating {num_records} patient encounters from {EHR_SOURCE}...")
-    
-    encounters = []
     statuses = ["completed", "completed", "completed", "cancelled", "pending"]
     states = ["CA", "TX", "NY", "FL", "IL", "WA", "GA", "AZ"]
     medications = [
@@ -33,7 +42,7 @@ def generate_encounters(num_records=1000):
     ]
 
     for i in range(1, num_records + 1):
-        encounter = {
+        yield {
             "encounter_id": f"ENC-{str(i).zfill(5)}",
             "patient_id": f"PAT-{str(random.randint(1, 500)).zfill(4)}",
             "app_id": f"APP-{str(random.randint(1, 50)).zfill(3)}",
@@ -47,43 +56,87 @@ def generate_encounters(num_records=1000):
             "clinical_notes": f"Patient visit note {i} - {fake.sentence()}",
             "ingestion_timestamp": datetime.utcnow().isoformat()
         }
-        encounters.append(encounter)
+
+
+def generate_encounters(num_records=1000, ehr_source=None):
+    """
+    Simulates pulling encounter data from AthenaHealth API.
+    In real project this would be an actual API call with OAuth2.
+    """
+    print(f"[EXTRACT] Generating {num_records} patient encounters from {ehr_source or EHR_SOURCE}...")
+    
+    encounters = list(iter_encounters(num_records))
 
     print(f"[EXTRACT] Successfully generated {len(encounters)} encounters")
     return encounters
 
 
-def save_to_bronze(encounters):
+def partition_name_for(moment):
+    """Bronze partition folder name for a point in time."""
+    return moment.strftime("%Y-%m-%dT%H-%M-%S")
+
+
+def create_bronze_partition(tenant=None, ehr_source=None, partition=None):
     """
-    Saves raw encounter data to Bronze layer.
-    Simulates writing to Azure Blob Storage.
-    Directory structure matches the technical document exactly.
+    Create a bronze partition folder and return its path.
+    partition defaults to a fresh timestamp; a scheduler passes the one
+    derived from its data interval instead, so a retried run writes the
+    same folder — any files a failed attempt left there are removed first.
     """
-    timestamp = datetime.utcnow().strftime("%Y-%m-%dT%H-%M-%S")
+    rerun_safe = partition is not None
+    partition = partition or partition_name_for(datetime.utcnow())
     
     # Build folder path exactly as per technical document
     bronze_path = os.path.join(
         BRONZE_BASE_PATH,
-        TENANT,
+        tenant or TENANT,
         ENVIRONMENT,
-        EHR_SOURCE,
+        ehr_source or EHR_SOURCE,
         "encounters",
-        timestamp
+        partition
     )
     
-    # Create folder
+    # Create folder — emptied for a named partition, so a rerun overwrites
+    # its files rather than adding to them
+    if rerun_safe and os.path.isdir(bronze_path):
+        shutil.rmtree(bronze_path)
     os.makedirs(bronze_path, exist_ok=True)
+    return bronze_path
+
+
+def save_to_bronze(encounters, fmt=None, compression=None, level=None,
+                   tenant=None, ehr_source=None, partition=None):
+    """
+    Saves raw encounter data to Bronze layer.
+    Simulates writing to Azure Blob Storage.
+    Directory structure matches the technical document exactly.
+    fmt is "ndjson" (default) or "parquet" — see BRONZE_FORMAT.
+    compression is "none" (default), "gzip" or "zstd" — see BRONZE_COMPRESSION.
+    tenant / ehr_source default to TENANT / EHR_SOURCE; partition to a
+    fresh timestamp (see create_bronze_partition). The partition is then
+    registered in the bronze catalog, with stats gathered while writing.
+    """
+    fmt = fmt or BRONZE_FORMAT
+    compression = compression or BRONZE_COMPRESSION
+
+    # Build and create the timestamped partition folder
+    bronze_path = create_bronze_partition(tenant, ehr_source, partition)
     
-    # Save as NDJSON (one JSON record per line — FHIR standard format)
-    file_path = os.path.join(bronze_path, "encounters_raw.ndjson")
-    
-    with open(file_path, "w") as f:
-        for encounter in encounters:
-            f.write(json.dumps(encounter) + "\n")
+    # Save as NDJSON (one JSON record per line — FHIR standard format),
+    # or as Parquet when BRONZE_FORMAT=parquet, compressed while streaming
+    stats = new_partition_stats()
+    with measure("save_to_bronze", tenant=tenant, ehr_source=ehr_source) as step:
+        file_path, record_count = write_bronze_file(
+            track_records(encounters, stats), bronze_path, fmt, compression, level
+        )
+        register_partition(bronze_path, tenant or TENANT, ehr_source or EHR_SOURCE, stats)
+        step.add(rows_in=record_count, rows_out=record_count,
+                 bytes_written=os.path.getsize(file_path))
     
     print(f"[EXTRACT] Raw data saved to Bronze layer:")
     print(f"          Path: {file_path}")
-    print(f"          Total records: {len(encounters)}")
+    print(f"          Format: {fmt} (compression: {compression})")
+    print(f"          Total records: {record_count}")
     return file_path
 
 
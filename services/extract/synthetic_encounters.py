@@ -0,0 +1,182 @@
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from faker import Faker
+from dotenv import load_dotenv
+
+# Add project root to path so the generator can also run as a plain script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from services.bronze.bronze_files import BRONZE_FORMAT, BRONZE_COMPRESSION, write_bronze_file
+from services.bronze.bronze_catalog import (
+    new_partition_stats, track_records, merge_partition_stats, register_partition
+)
+from services.extract.extract_encounters import TENANT, EHR_SOURCE, create_bronze_partition
+
+load_dotenv()
+
+# Load-test generator settings
+LOADGEN_RECORDS = int(os.getenv("LOADGEN_RECORDS", "10000000"))
+LOADGEN_SHARD_SIZE = int(os.getenv("LOADGEN_SHARD_SIZE", "500000"))
+LOADGEN_WORKERS = int(os.getenv("LOADGEN_WORKERS", str(os.cpu_count() or 4)))
+LOADGEN_SEED = int(os.getenv("LOADGEN_SEED", "42"))
+LOADGEN_PATIENTS = int(os.getenv("LOADGEN_PATIENTS", "500"))
+LOADGEN_PHYSICIANS = int(os.getenv("LOADGEN_PHYSICIANS", "100"))
+LOADGEN_APPS = int(os.getenv("LOADGEN_APPS", "50"))
+LOADGEN_DUPLICATE_RATE = float(os.getenv("LOADGEN_DUPLICATE_RATE", "0.0"))
+LOADGEN_LATE_RATE = float(os.getenv("LOADGEN_LATE_RATE", "0.0"))
+
+# Same value pools as generate_encounters
+STATUSES = ["completed", "completed", "completed", "cancelled", "pending"]
+STATES = ["CA", "TX", "NY", "FL", "IL", "WA", "GA", "AZ"]
+MEDICATIONS = [
+    "NDC-0069-0001", "NDC-0069-0002", "NDC-0069-0003",
+    "NDC-0069-0004", "NDC-0069-0005"
+]
+
+# Faker is the slow part, so each shard draws notes from a pre-built pool
+SENTENCE_POOL_SIZE = 1000
+# Re-sent duplicates are drawn from this many recent encounters
+DUPLICATE_WINDOW = 1000
+# Normal encounters are from the last 30 days, late ones from up to a year back
+SERVICE_WINDOW_DAYS = 30
+LATE_WINDOW_DAYS = 365
+
+
+def shard_seed(seed, shard_id):
+    """Deterministic per-shard seed: same seed + shard → same records."""
+    return seed * 1_000_003 + shard_id
+
+
+def iter_shard_encounters(shard_id, first_id, count, seed=LOADGEN_SEED,
+                          patients=LOADGEN_PATIENTS, physicians=LOADGEN_PHYSICIANS,
+                          apps=LOADGEN_APPS, duplicate_rate=LOADGEN_DUPLICATE_RATE,
+                          late_rate=LOADGEN_LATE_RATE, as_of=None):
+    """
+    Yield count encounter records for one shard, one at a time.
+
+    - encounter_ids are numbered from first_id, so shards never collide
+    - with probability duplicate_rate a record re-sends a recent encounter
+      (same encounter_id and content, new ingestion_timestamp)
+    - with probability late_rate the date_of_service falls before the
+      normal 30-day window, like a late-arriving record
+    Records have the same shape as generate_encounters output.
+    """
+    rng = random.Random(shard_seed(seed, shard_id))
+    fake = Faker()
+    fake.seed_instance(shard_seed(seed, shard_id))
+    sentences = [fake.sentence() for _ in range(SENTENCE_POOL_SIZE)]
+    as_of = as_of or date.today()
+    ingestion_timestamp = datetime.utcnow().isoformat()
+    recent = []
+    next_id = first_id
+
+    for _ in range(count):
+        if recent and rng.random() < duplicate_rate:
+            encounter = dict(rng.choice(recent))
+            encounter["ingestion_timestamp"] = ingestion_timestamp
+            yield encounter
+            continue
+
+        if rng.random() < late_rate:
+            days_back = rng.randint(SERVICE_WINDOW_DAYS + 1, LATE_WINDOW_DAYS)
+        else:
+            days_back = rng.randint(0, SERVICE_WINDOW_DAYS)
+        encounter = {
+            "encounter_id": f"ENC-{str(next_id).zfill(5)}",
+            "patient_id": f"PAT-{str(rng.randint(1, patients)).zfill(4)}",
+            "app_id": f"APP-{str(rng.randint(1, apps)).zfill(3)}",
+            "physician_id": f"PHY-{str(rng.randint(1, physicians)).zfill(3)}",
+            "date_of_service": str(as_of - timedelta(days=days_back)),
+            "state": rng.choice(STATES),
+            "status": rng.choice(STATUSES),
+            "medications": rng.sample(MEDICATIONS, k=rng.randint(1, 3)),
+            "clinical_notes": f"Patient visit note {next_id} - {rng.choice(sentences)}",
+            "ingestion_timestamp": ingestion_timestamp
+        }
+        next_id += 1
+
+        if len(recent) < DUPLICATE_WINDOW:
+            recent.append(encounter)
+        else:
+            recent[rng.randrange(DUPLICATE_WINDOW)] = encounter
+        yield encounter
+
+
+def write_shard(bronze_path, shard_id, first_id, count, fmt, compression, options):
+    """
+    Generate one shard straight into its own bronze part file.
+    Returns (file_path, written, catalog stats of the part).
+    """
+    stats = new_partition_stats()
+    records = track_records(iter_shard_encounters(shard_id, first_id, count, **options), stats)
+    file_path, written = write_bronze_file(
+        records, bronze_path, fmt, compression, part=shard_id
+    )
+    return file_path, written, stats
+
+
+def plan_shards(num_records, shard_size=LOADGEN_SHARD_SIZE):
+    """Split num_records into (shard_id, first_id, count) ranges."""
+    shards = []
+    for shard_id in range(math.ceil(num_records / shard_size)):
+        first = shard_id * shard_size
+        shards.append((shard_id, first + 1, min(shard_size, num_records - first)))
+    return shards
+
+
+def generate_to_bronze(num_records=LOADGEN_RECORDS, workers=LOADGEN_WORKERS,
+                       shard_size=LOADGEN_SHARD_SIZE, fmt=None, compression=None,
+                       **options):
+    """
+    Generate num_records synthetic encounters across a process pool and
+    stream them into one multi-part bronze partition (one part per shard).
+    options are passed to iter_shard_encounters (seed, patients,
+    physicians, apps, duplicate_rate, late_rate, as_of).
+    Returns the bronze partition path.
+    """
+    fmt = fmt or BRONZE_FORMAT
+    compression = compression or BRONZE_COMPRESSION
+    shards = plan_shards(num_records, shard_size)
+    bronze_path = create_bronze_partition()
+    print(f"[EXTRACT] Generating {num_records} synthetic encounters from {EHR_SOURCE} "
+          f"in {len(shards)} shard(s) with {workers} worker(s)...")
+
+    started = time.perf_counter()
+    total = 0
+    part_stats = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(write_shard, bronze_path, shard_id, first_id, count,
+                        fmt, compression, options)
+            for shard_id, first_id, count in shards
+        ]
+        for future in futures:
+            file_path, written, stats = future.result()
+            total += written
+            part_stats.append(stats)
+            print(f"[EXTRACT] Wrote {written} records to {file_path}")
+
+    seconds = time.perf_counter() - started
+    register_partition(bronze_path, TENANT, EHR_SOURCE, merge_partition_stats(part_stats))
+    print(f"[EXTRACT] Raw data saved to Bronze layer:")
+    print(f"          Path: {bronze_path}")
+    print(f"          Total records: {total} "
+          f"({int(total / seconds) if seconds > 0 else 0} records/sec)")
+    return bronze_path
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("LOAD-TEST ENCOUNTER GENERATION STARTED")
+    print("=" * 60)
+
+    generate_to_bronze()
+
+    print("\n" + "=" * 60)
+    print("LOAD-TEST ENCOUNTER GENERATION COMPLETED SUCCESSFULLY!")
+    print("=" * 60)
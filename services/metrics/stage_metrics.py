@@ -0,0 +1,391 @@
+import contextvars
+import cProfile
+import json
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from dotenv import load_dotenv
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+load_dotenv()
+
+# true = every instrumented pipeline step records a metrics line
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+METRICS_DIR = os.getenv("METRICS_DIR", "./metrics")
+# One JSON object per finished step, appended by every process
+METRICS_JSONL_PATH = os.getenv(
+    "METRICS_JSONL_PATH", os.path.join(METRICS_DIR, "stage_metrics.jsonl")
+)
+# Folder for node_exporter's textfile collector: one .prom file per
+# (tenant, source, step), rewritten with that step's latest run
+METRICS_TEXTFILE_DIR = os.getenv(
+    "METRICS_TEXTFILE_DIR", os.path.join(METRICS_DIR, "textfile")
+)
+# Opt-in deep dives: cprofile and/or tracemalloc (comma-separated) for
+# the steps in METRICS_PROFILE_STEPS (comma-separated; empty = all). One
+# step is profiled at a time — the first to start. Its dumps cover
+# everything that ran from its start to its end, nested steps included
+METRICS_PROFILE = {p.strip() for p in os.getenv("METRICS_PROFILE", "").split(",") if p.strip()}
+METRICS_PROFILE_STEPS = {
+    s.strip() for s in os.getenv("METRICS_PROFILE_STEPS", "").split(",") if s.strip()
+}
+METRICS_PROFILE_DIR = os.getenv("METRICS_PROFILE_DIR", os.path.join(METRICS_DIR, "profiles"))
+# Allocation sites listed in a tracemalloc dump
+TRACEMALLOC_TOP = 25
+
+PROMETHEUS_PREFIX = "zivian_pipeline_step"
+
+# Run id of a process started outside Airflow (METRICS_RUN_ID overrides it)
+LOCAL_RUN_ID = f"local_{datetime.utcnow():%Y%m%dT%H%M%S}_{uuid.uuid4().hex[:6]}"
+
+_tags = contextvars.ContextVar("metrics_tags", default={})
+_active = threading.local()
+_write_lock = threading.Lock()
+_profiling = threading.Lock()
+
+
+@contextmanager
+def metrics_context(**tags):
+    """
+    Tag every step measured inside the block (run_id, tenant, ehr_source).
+    Tags nest; a step's own tags win.
+    """
+    token = _tags.set(dict(_tags.get(), **{k: v for k, v in tags.items() if v is not None}))
+    try:
+        yield
+    finally:
+        _tags.reset(token)
+
+
+def current_run_id():
+    """
+    METRICS_RUN_ID, else the Airflow DAG run the current task executes for,
+    else this process's local id. Read on every call: Airflow sets
+    AIRFLOW_CTX_DAG_RUN_ID per task, after this module may have been imported.
+    """
+    return (
+        os.getenv("METRICS_RUN_ID")
+        or os.getenv("AIRFLOW_CTX_DAG_RUN_ID")
+        or LOCAL_RUN_ID
+    )
+
+
+def current_tags():
+    """Tags of the surrounding metrics_context, falling back to the process defaults."""
+    tags = {
+        "run_id": current_run_id(),
+        "tenant": os.getenv("TENANT", "zivian"),
+        "ehr_source": os.getenv("EHR_SOURCE", "athenahealth"),
+    }
+    tags.update(_tags.get())
+    return tags
+
+
+def peak_rss_bytes():
+    """High-water mark of this process's resident memory, or None."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _stack():
+    if not hasattr(_active, "stack"):
+        _active.stack = []
+    return _active.stack
+
+
+class StepMetrics:
+    """
+    Measurements of one pipeline step.
+
+    Time is only counted while the step is active (inside `with step:`),
+    and time its nested steps spend active is subtracted — so a step that
+    pulls chunks from another measured step (transform from the bronze
+    read, a load from the transform) reports only its own work as
+    busy_seconds, while wall_seconds spans first activation to finish().
+    Rows and bytes are added by the step itself (or, for bytes_written,
+    by copy_dataframe through count_bytes_written); bad_lines counts the
+    malformed bronze lines the step read past.
+    """
+
+    def __init__(self, step, **tags):
+        self.step = step
+        self.tags = dict(current_tags(), **{k: v for k, v in tags.items() if v is not None})
+        self.rows_in = 0
+        self.rows_out = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.bad_lines = 0
+        self.busy_seconds = 0.0
+        self.started = None
+        self.finished = False
+        self._entered = []
+        self._rss_start = peak_rss_bytes()
+        self._profiler = None
+        self._tracing = False
+        self._profile_lock = False
+        wanted = not METRICS_PROFILE_STEPS or step in METRICS_PROFILE_STEPS
+        # Profiling starts on first activation, so a step that is never
+        # entered (e.g. a generator never resumed) never holds the lock
+        self._profile = METRICS_ENABLED and wanted and bool(METRICS_PROFILE)
+
+    def _start_profiling(self):
+        # One deep dive at a time: nested or concurrent steps aren't profiled
+        if not _profiling.acquire(blocking=False):
+            return
+        self._profile_lock = True
+        if "cprofile" in METRICS_PROFILE:
+            self._profiler = cProfile.Profile()
+        if "tracemalloc" in METRICS_PROFILE and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+
+    def __enter__(self):
+        now = time.perf_counter()
+        if self.started is None:
+            self.started = now
+            if self._profile:
+                self._start_profiling()
+        # [start, time spent in nested steps]
+        self._entered.append([now, 0.0])
+        _stack().append(self)
+        if self._profiler:
+            self._profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._profiler:
+            self._profiler.disable()
+        start, nested = self._entered.pop()
+        elapsed = time.perf_counter() - start
+        self.busy_seconds += elapsed - nested
+        stack = _stack()
+        stack.pop()
+        if stack and stack[-1]._entered:
+            stack[-1]._entered[-1][1] += elapsed
+        return False
+
+    def add(self, rows_in=0, rows_out=0, bytes_read=0, bytes_written=0):
+        self.rows_in += rows_in
+        self.rows_out += rows_out
+        self.bytes_read += bytes_read
+        self.bytes_written += bytes_written
+
+    def record(self, status="ok"):
+        """The step's metrics as one flat dict."""
+        wall = time.perf_counter() - self.started if self.started is not None else 0.0
+        peak = peak_rss_bytes()
+        return dict(
+            self.tags,
+            step=self.step,
+            status=status,
+            finished_at=datetime.utcnow().isoformat(),
+            wall_seconds=round(wall, 4),
+            busy_seconds=round(self.busy_seconds, 4),
+            rows_in=self.rows_in,
+            rows_out=self.rows_out,
+            rows_per_sec=int(self.rows_out / self.busy_seconds) if self.busy_seconds > 0 else 0,
+            bytes_read=self.bytes_read,
+            bytes_written=self.bytes_written,
+            bad_lines=self.bad_lines,
+            peak_rss_bytes=peak,
+            # How far this step pushed the process high-water mark up
+            rss_growth_bytes=(peak - self._rss_start) if peak is not None else None,
+            pid=os.getpid(),
+        )
+
+    def finish(self, status="ok"):
+        """Emit the step's metrics (once) and write any profile it collected."""
+        if self.finished:
+            return None
+        self.finished = True
+        if not METRICS_ENABLED:
+            return None
+        record = self.record(status)
+        record.update(self._dump_profiles())
+        emit(record)
+        return record
+
+    def _dump_profiles(self):
+        if not self._profile_lock:
+            return {}
+        dumps = {}
+        try:
+            base = os.path.join(METRICS_PROFILE_DIR, _file_key(
+                self.tags["run_id"], self.tags["tenant"], self.tags["ehr_source"], self.step
+            ))
+            os.makedirs(METRICS_PROFILE_DIR, exist_ok=True)
+            if self._profiler:
+                self._profiler.dump_stats(base + ".pstats")
+                dumps["cprofile_path"] = base + ".pstats"
+            if self._tracing:
+                # Leave out what the profilers themselves allocated
+                snapshot = tracemalloc.take_snapshot().filter_traces([
+                    tracemalloc.Filter(False, cProfile.__file__),
+                    tracemalloc.Filter(False, tracemalloc.__file__),
+                ])
+                traced_peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                with open(base + ".tracemalloc.txt", "w") as f:
+                    f.write(f"{self.step}: peak traced memory {traced_peak} bytes\n")
+                    for stat in snapshot.statistics("lineno")[:TRACEMALLOC_TOP]:
+                        f.write(f"{stat}\n")
+                dumps["tracemalloc_path"] = base + ".tracemalloc.txt"
+                dumps["traced_peak_bytes"] = traced_peak
+        finally:
+            _profiling.release()
+            self._profile_lock = False
+        return dumps
+
+
+def current_step():
+    """Innermost active step of this thread, or None."""
+    stack = _stack()
+    return stack[-1] if stack else None
+
+
+def count_bytes_read(nbytes):
+    """Credit bytes read (e.g. from bronze files) to the active step, if any."""
+    step = current_step()
+    if step is not None:
+        step.bytes_read += nbytes
+
+
+def count_bytes_written(nbytes):
+    """Credit bytes sent to the database to the active step, if any."""
+    step = current_step()
+    if step is not None:
+        step.bytes_written += nbytes
+
+
+def count_bad_lines(count):
+    """Credit malformed bronze lines read past to the active step, if any."""
+    step = current_step()
+    if step is not None:
+        step.bad_lines += count
+
+
+@contextmanager
+def measure(step, **tags):
+    """
+    Measure a block as one step: yields its StepMetrics for rows / bytes,
+    emits on exit — with status "error" if the block raised.
+    """
+    metrics = StepMetrics(step, **tags)
+    try:
+        with metrics:
+            yield metrics
+    except BaseException:
+        metrics.finish("error")
+        raise
+    metrics.finish()
+
+
+def measured_chunks(step, chunks, bytes_read=0, count_bytes=None, **tags):
+    """
+    Pass chunks through, measuring the time spent producing them as step
+    and counting their rows as rows_out. count_bytes(chunk), if given,
+    adds each chunk's size to bytes_read. Emits once the chunks are
+    exhausted (or the consumer stops early).
+    """
+    metrics = StepMetrics(step, **tags)
+    metrics.add(bytes_read=bytes_read)
+    chunks = iter(chunks)
+    status = "error"
+    try:
+        while True:
+            with metrics:
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    break
+                metrics.add(rows_out=len(chunk),
+                            bytes_read=count_bytes(chunk) if count_bytes else 0)
+            yield chunk
+        status = "ok"
+    except GeneratorExit:
+        status = "ok"
+        raise
+    finally:
+        metrics.finish(status)
+
+
+def _file_key(*parts):
+    return "__".join(re.sub(r"[^A-Za-z0-9_.-]", "_", str(p)) for p in parts)
+
+
+def _label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+PROMETHEUS_GAUGES = [
+    ("busy_seconds", "Seconds the step spent working, nested steps excluded"),
+    ("wall_seconds", "Seconds from the step's first activation to its end"),
+    ("rows_in", "Rows the step consumed"),
+    ("rows_out", "Rows the step produced"),
+    ("rows_per_sec", "rows_out per busy second"),
+    ("bytes_read", "Bytes the step read"),
+    ("bytes_written", "Bytes the step sent to the database"),
+    ("bad_lines", "Malformed bronze lines the step skipped"),
+    ("peak_rss_bytes", "Process peak resident memory when the step ended"),
+]
+
+
+def prometheus_text(record):
+    """Prometheus text exposition of one step record (gauges, latest run)."""
+    labels = ",".join(
+        f'{name}="{_label_value(record[name])}"' for name in ("tenant", "ehr_source", "step")
+    )
+    lines = []
+    for field, help_text in PROMETHEUS_GAUGES:
+        if record.get(field) is None:
+            continue
+        name = f"{PROMETHEUS_PREFIX}_{field}"
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge",
+                  f"{name}{{{labels}}} {record[field]}"]
+    name = f"{PROMETHEUS_PREFIX}_success"
+    lines += [f"# HELP {name} 1 if the step's latest run succeeded",
+              f"# TYPE {name} gauge",
+              f"{name}{{{labels}}} {int(record['status'] == 'ok')}"]
+    name = f"{PROMETHEUS_PREFIX}_finished_timestamp_seconds"
+    lines += [f"# HELP {name} Unix time the step's latest run ended",
+              f"# TYPE {name} gauge",
+              f"{name}{{{labels}}} {time.time():.3f}"]
+    return "\n".join(lines) + "\n"
+
+
+def emit(record):
+    """Append record to the JSON lines log and refresh its textfile."""
+    print(f"[METRICS] {record['step']} ({record['tenant']}/{record['ehr_source']}): "
+          f"{record['status']}, {record['busy_seconds']}s busy, "
+          f"{record['rows_in']} → {record['rows_out']} rows, {record['rows_per_sec']} rows/sec")
+    try:
+        with _write_lock:
+            os.makedirs(os.path.dirname(METRICS_JSONL_PATH) or ".", exist_ok=True)
+            with open(METRICS_JSONL_PATH, "a") as f:
+                f.write(json.dumps(record, default=str) + "\n")
+
+            os.makedirs(METRICS_TEXTFILE_DIR, exist_ok=True)
+            path = os.path.join(METRICS_TEXTFILE_DIR, _file_key(
+                record["tenant"], record["ehr_source"], record["step"]
+            ) + ".prom")
+            # Write aside and rename, so the collector never reads half a file
+            staging = f"{path}.{os.getpid()}.tmp"
+            with open(staging, "w") as f:
+                f.write(prometheus_text(record))
+            os.replace(staging, path)
+    except OSError as e:
+        # Metrics must never fail the load they describe
+        print(f"[METRICS] Could not write metrics: {e}")
@@ -0,0 +1,246 @@
+import contextvars
+import os
+import sys
+import queue
+import threading
+from itertools import islice
+import pandas as pd
+from dotenv import load_dotenv
+
+# Add project root to path so this mode can also run as a plain script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from services.bronze.bronze_files import write_bronze_file
+from services.bronze.bronze_catalog import (
+    new_partition_stats, track_records, register_partition
+)
+from services.extract.extract_encounters import (
+    TENANT, EHR_SOURCE, iter_encounters, create_bronze_partition
+)
+from services.transform.transform_encounters import (
+    SILVER_LOAD_MODE, create_silver_table, create_watermark_table,
+    create_processed_partitions_table, transform_chunks, load_to_silver,
+    merge_chunks_to_silver
+)
+from services.sampling.sampling_encounters import (
+    SAMPLE_RATE, create_gold_table, create_gold_summary_table, sample_chunks,
+    load_to_gold, sample_in_database
+)
+from services.db.engine import get_engine
+
+load_dotenv()
+
+# Encounters per batch handed from stage to stage
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "10000"))
+# Batches a stage may run ahead of the slowest one behind it — the
+# backpressure: a full channel blocks its producer, so at most
+# STREAM_QUEUE_DEPTH batches per channel are ever held in memory
+STREAM_QUEUE_DEPTH = int(os.getenv("STREAM_QUEUE_DEPTH", "4"))
+# How often a blocked stage wakes up to check whether another one failed
+STREAM_POLL_SECONDS = 0.5
+
+_DONE = object()
+
+
+class StageFailed(Exception):
+    """Raised in a stage that was waiting on another stage which failed."""
+
+
+def put_or_abort(channel, item, failed):
+    """Put item on a bounded channel, waiting for room unless a stage has failed."""
+    while True:
+        if failed.is_set():
+            raise StageFailed("another pipeline stage failed")
+        try:
+            channel.put(item, timeout=STREAM_POLL_SECONDS)
+            return
+        except queue.Full:
+            continue
+
+
+def iter_channel(channel, failed):
+    """Yield items from a channel until _DONE, stopping if a stage has failed."""
+    while True:
+        if failed.is_set():
+            raise StageFailed("another pipeline stage failed")
+        try:
+            item = channel.get(timeout=STREAM_POLL_SECONDS)
+        except queue.Empty:
+            continue
+        if item is _DONE:
+            return
+        yield item
+
+
+def wait_for(event, failed):
+    """Block until event is set; raise if a stage fails first."""
+    while not event.wait(STREAM_POLL_SECONDS):
+        if failed.is_set():
+            raise StageFailed("another pipeline stage failed")
+
+
+def iter_batches(records, batch_size):
+    records = iter(records)
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def start_stage(name, target, failed, errors):
+    """
+    Run target in a thread; an exception is recorded and sets failed, so
+    every other stage stops at its next channel operation. The thread
+    inherits the caller's metrics tags.
+    """
+    context = contextvars.copy_context()
+
+    def run():
+        try:
+            context.run(target)
+        except BaseException as e:
+            errors.append((name, e))
+            failed.set()
+
+    thread = threading.Thread(target=run, name=f"stream-{name}", daemon=True)
+    thread.start()
+    return thread
+
+
+def stream_to_gold(engine, num_records=1000, tenant=None, ehr_source=None,
+                   partition=None, sample_rate=SAMPLE_RATE, batch_size=None):
+    """
+    Extract → bronze → silver → gold in one process, without re-reading
+    anything the previous stage just wrote.
+
+    Generated encounters are cut into batches that fan out over bounded
+    channels: one thread tees the raw records into the bronze partition
+    (the audit copy), the caller's thread applies the transform rules and
+    feeds the silver (and gold) loaders. Silver and gold get exactly the
+    rows the staged extract / transform / sample tasks would write:
+
+    - Unscoped, with SILVER_LOAD_MODE=replace: silver and gold are both
+      replaced from the stream; gold is sampled from the cleaned batches
+      instead of being read back out of silver.
+    - With tenant and ehr_source, or SILVER_LOAD_MODE=incremental: the
+      partition is merged into silver (watermark and processed marker
+      included), then that source's gold is re-sampled in the database —
+      gold covers the source's whole silver, not just this partition.
+
+    No DB transaction commits before the bronze file is complete and
+    registered, so a failure while streaming leaves silver and gold as they
+    were. Silver and gold commit separately though, gold after silver: if
+    gold fails once silver has committed, silver (and, when merging, the
+    watermark) holds the new partition while gold still holds the previous
+    sample — rerun the sampling stage to rebuild gold from silver. The
+    bronze file is kept either way. Returns the bronze file path.
+    """
+    batch_size = batch_size or STREAM_BATCH_SIZE
+    tenant_name, source_name = tenant or TENANT, ehr_source or EHR_SOURCE
+    scoped = tenant is not None and ehr_source is not None
+    merge = scoped or SILVER_LOAD_MODE == "incremental"
+    print(f"[STREAM] Streaming {num_records} encounters from {source_name} "
+          f"(batches of {batch_size}, queue depth {STREAM_QUEUE_DEPTH}, "
+          f"{'merge' if merge else 'replace'} mode)...")
+
+    bronze_path = create_bronze_partition(tenant, ehr_source, partition)
+    bronze_q = queue.Queue(maxsize=STREAM_QUEUE_DEPTH)
+    silver_q = queue.Queue(maxsize=STREAM_QUEUE_DEPTH)
+    gold_q = queue.Queue(maxsize=STREAM_QUEUE_DEPTH)
+    failed = threading.Event()
+    silver_committed = threading.Event()
+    errors = []
+    bronze_file = {}
+
+    def write_bronze():
+        stats = new_partition_stats()
+        records = (r for batch in iter_channel(bronze_q, failed) for r in batch)
+        bronze_file["path"], bronze_file["count"] = write_bronze_file(
+            track_records(records, stats), bronze_path
+        )
+        register_partition(bronze_path, tenant_name, source_name, stats)
+
+    def load_silver():
+        chunks = iter_channel(silver_q, failed)
+        if merge:
+            merge_chunks_to_silver(
+                engine, chunks, os.path.basename(bronze_path), tenant_name, source_name
+            )
+        else:
+            load_to_silver(chunks, engine)
+        silver_committed.set()
+
+    def load_gold():
+        def chunks():
+            yield from sample_chunks(iter_channel(gold_q, failed), sample_rate)
+            # Hold the gold transaction open until silver has committed
+            wait_for(silver_committed, failed)
+        load_to_gold(chunks(), engine)
+
+    bronze_thread = start_stage("bronze", write_bronze, failed, errors)
+    db_threads = [start_stage("silver", load_silver, failed, errors)]
+    if not merge:
+        db_threads.append(start_stage("gold", load_gold, failed, errors))
+
+    def raw_chunks():
+        for batch in iter_batches(iter_encounters(num_records), batch_size):
+            put_or_abort(bronze_q, batch, failed)
+            yield pd.DataFrame(batch)
+
+    try:
+        for df_clean in transform_chunks(raw_chunks(), tenant_name, source_name):
+            put_or_abort(silver_q, df_clean, failed)
+            if not merge:
+                # Sampling adds columns — gold gets its own copy of the batch
+                put_or_abort(gold_q, df_clean.copy(), failed)
+        put_or_abort(bronze_q, _DONE, failed)
+        bronze_thread.join()
+        # The loaders only commit once they see _DONE: bronze is on disk first
+        if not failed.is_set():
+            put_or_abort(silver_q, _DONE, failed)
+            if not merge:
+                put_or_abort(gold_q, _DONE, failed)
+    except BaseException as e:
+        if not isinstance(e, StageFailed):
+            errors.append(("transform", e))
+        failed.set()
+    finally:
+        for thread in [bronze_thread] + db_threads:
+            thread.join()
+
+    if errors:
+        stage, error = errors[0]
+        print(f"[STREAM] Stage '{stage}' failed: {error!r}")
+        raise error
+
+    print(f"[STREAM] Raw data teed to Bronze layer:")
+    print(f"         Path: {bronze_file['path']}")
+    print(f"         Total records: {bronze_file['count']}")
+
+    if merge:
+        sample_in_database(engine, sample_rate, tenant, ehr_source)
+    return bronze_file["path"]
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("STREAMING PIPELINE — BRONZE → SILVER → GOLD STARTED")
+    print("=" * 60)
+
+    # Step 1: Connect to database
+    engine = get_engine()
+
+    # Step 2: Create pipeline tables
+    create_silver_table(engine)
+    create_watermark_table(engine)
+    create_processed_partitions_table(engine)
+    create_gold_table(engine)
+    create_gold_summary_table(engine)
+
+    # Steps 3-6: Extract, tee to Bronze, transform, load Silver and Gold
+    stream_to_gold(engine, num_records=1000)
+
+    print("\n" + "=" * 60)
+    print("STREAMING PIPELINE — GOLD LAYER LOAD COMPLETED SUCCESSFULLY!")
+    print("=" * 60)
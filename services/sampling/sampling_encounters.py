@@ -1,112 +1,403 @@
 import os
-import hashlib
+import sys
+import time
+import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from dotenv import load_dotenv
 
+# Add project root to path so this stage can also run as a plain script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from services.db.bulk_load import bulk_load, clear_table, copy_dataframe
+from services.db.engine import advisory_xact_lock, get_engine, read_sql_chunks
+from services.db.schema import ensure_partitions, ensure_table, partition_hook
+from services.db.swap import SWAP_LOADS, swap_into, swap_load
+from services.metrics.stage_metrics import StepMetrics, measure, measured_chunks
+from services.sampling.sampling_engine import (
+    sample_mask, sampling_buckets, sampling_reason
+)
+
 load_dotenv()
 
-# Database connection
-DB_HOST = os.getenv("DB_HOST", "localhost")
-DB_PORT = os.getenv("DB_PORT", "5432")
-DB_NAME = os.getenv("DB_NAME", "zivian_db")
-DB_USER = os.getenv("DB_USER", "postgres")
-DB_PASSWORD = os.getenv("DB_PASSWORD", "postgres123")
+SAMPLE_RATE = float(os.getenv("SAMPLE_RATE", "0.10"))
+
+# pandas   = stream silver through the client in chunks, sample, write gold
+# postgres = fetch only the distinct patient_ids, sample those, and let
+#            Postgres copy the rows across (clinical_notes never leave it)
+SAMPLING_ENGINE = os.getenv("SAMPLING_ENGINE", "pandas")
+# Silver rows held in memory at once while streaming into gold
+SAMPLING_CHUNK_SIZE = int(os.getenv("SAMPLING_CHUNK_SIZE", "50000"))
+# gold_summary runs kept; older ones are deleted as each new one is written
+GOLD_SUMMARY_KEEP_RUNS = int(os.getenv("GOLD_SUMMARY_KEEP_RUNS", "10"))
 
+# Silver columns carried into gold — named, so silver-only columns
+# (transformed_at) are never fetched
+SILVER_COLUMNS = [
+    "tenant", "ehr_source", "encounter_id", "patient_id", "app_id", "physician_id",
+    "date_of_service", "state", "status", "medications", "clinical_notes",
+    "ingestion_timestamp"
+]
 
-def get_db_engine():
-    """Create database connection."""
-    conn_str = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-    return create_engine(conn_str)
+# Postgres NOTIFY channel announcing a finished gold load (the dashboard
+# drops its cache when it hears it)
+GOLD_LOADED_CHANNEL = "gold_loaded"
 
 
 def create_gold_table(engine):
-    """Create gold table in PostgreSQL if it doesn't exist."""
-    create_table_sql = """
-        CREATE TABLE IF NOT EXISTS gold_encounters (
-            encounter_id        VARCHAR(20) PRIMARY KEY,
-            patient_id          VARCHAR(20) NOT NULL,
-            app_id              VARCHAR(20),
-            physician_id        VARCHAR(20),
-            date_of_service     DATE,
-            state               VARCHAR(5),
-            status              VARCHAR(20),
-            medications         TEXT,
-            clinical_notes      TEXT,
-            ingestion_timestamp TIMESTAMP,
-            is_sampled          BOOLEAN DEFAULT FALSE,
-            sampling_reason     VARCHAR(50),
-            gold_loaded_at      TIMESTAMP DEFAULT NOW()
-        );
-    """
-    with engine.begin() as conn:
-        conn.execute(text(create_table_sql))
+    """Create gold table (with its key and indexes) if it doesn't exist."""
+    ensure_table(engine, "gold_encounters")
     print("[SAMPLING] Gold table ready in PostgreSQL")
 
 
-def read_from_silver(engine):
-    """Read completed encounters from Silver layer."""
+def create_gold_summary_table(engine):
+    """Create the pre-aggregated gold summary table if it doesn't exist."""
+    ensure_table(engine, "gold_summary")
+    print("[SAMPLING] Gold summary table ready in PostgreSQL")
+
+
+# Every dimension in one pass over gold; GROUPING() tells the sets apart
+GOLD_SUMMARY_SQL = """
+    INSERT INTO gold_summary (
+        run_id, dimension, dimension_value, total, completed, sampled, silver
+    )
+    SELECT
+        :run_id,
+        CASE
+            WHEN GROUPING(state) = 0 THEN 'state'
+            WHEN GROUPING(physician_id) = 0 THEN 'physician_id'
+            WHEN GROUPING(date_of_service) = 0 THEN 'date_of_service'
+            ELSE 'run'
+        END,
+        CASE
+            WHEN GROUPING(state) = 0 THEN COALESCE(state, '')
+            WHEN GROUPING(physician_id) = 0 THEN COALESCE(physician_id, '')
+            WHEN GROUPING(date_of_service) = 0 THEN COALESCE(CAST(date_of_service AS TEXT), '')
+            ELSE ''
+        END,
+        COUNT(*),
+        COUNT(*) FILTER (WHERE status = 'completed'),
+        COUNT(*) FILTER (WHERE is_sampled),
+        CASE
+            WHEN GROUPING(state, physician_id, date_of_service) = 7
+            THEN (SELECT COUNT(*) FROM silver_encounters)
+        END
+    FROM gold_encounters
+    GROUP BY GROUPING SETS ((), (state), (physician_id), (date_of_service))
+"""
+
+PRUNE_GOLD_SUMMARY_SQL = """
+    DELETE FROM gold_summary
+    WHERE run_id < (
+        SELECT MIN(run_id) FROM (
+            SELECT DISTINCT run_id FROM gold_summary ORDER BY run_id DESC LIMIT :keep
+        ) AS kept
+    )
+"""
+
+
+def summarize_gold(conn):
+    """
+    Write this run's gold_summary rows from the freshly loaded gold table
+    and drop all but the last GOLD_SUMMARY_KEEP_RUNS runs.
+    Meant to run inside the gold load transaction. Returns the run_id.
+    Per-source loads summarize concurrently, so the lock holds a second
+    summary back until the first commits: it then sees that source's rows
+    and gets the later run_id.
+    """
+    advisory_xact_lock(conn, "gold_summary")
+    run_id = conn.execute(text("SELECT nextval('gold_summary_run_id_seq')")).scalar()
+    conn.execute(text(GOLD_SUMMARY_SQL), {"run_id": run_id})
+    conn.execute(text(PRUNE_GOLD_SUMMARY_SQL), {"keep": max(GOLD_SUMMARY_KEEP_RUNS, 1)})
+    return run_id
+
+
+def read_gold_summary(conn, dimension="run"):
+    """
+    Latest run's summary rows for one dimension, as dicts
+    (dimension_value, total, completed, sampled, silver). Empty before the
+    first summarized load.
+    """
+    if conn.execute(text("SELECT to_regclass('gold_summary')")).scalar() is None:
+        return []
+    result = conn.execute(text("""
+        SELECT dimension_value, total, completed, sampled, silver
+        FROM gold_summary
+        WHERE run_id = (SELECT MAX(run_id) FROM gold_summary)
+          AND dimension = :dimension
+        ORDER BY dimension_value
+    """), {"dimension": dimension})
+    return [dict(row._mapping) for row in result]
+
+
+def silver_query(tenant=None, ehr_source=None, columns=None):
+    """SELECT over silver (optionally one tenant's EHR source) and its params."""
+    sql = f"SELECT {', '.join(columns or SILVER_COLUMNS)} FROM silver_encounters"
+    params = {}
+    if tenant and ehr_source:
+        sql += " WHERE tenant = :tenant AND ehr_source = :ehr_source"
+        params = {"tenant": tenant, "ehr_source": ehr_source}
+    return sql, params
+
+
+def iter_silver_chunks(engine, tenant=None, ehr_source=None, chunk_size=None):
+    """
+    Stream silver through a server-side cursor as DataFrames of at most
+    chunk_size rows — all of it, or one tenant's EHR source.
+    """
+    sql, params = silver_query(tenant, ehr_source)
+    chunks = read_sql_chunks(sql, params, chunk_size or SAMPLING_CHUNK_SIZE, engine)
+    # bytes_read counts the frames' in-memory size — what the read cost the worker
+    return measured_chunks(
+        "read_from_silver", chunks, tenant=tenant, ehr_source=ehr_source,
+        count_bytes=lambda chunk: int(chunk.memory_usage(deep=True).sum())
+    )
+
+
+def read_from_silver(engine, tenant=None, ehr_source=None):
+    """
+    Read completed encounters from Silver layer — all of them, or only
+    one tenant's EHR source when both are given.
+    """
     print("[SAMPLING] Reading completed encounters from Silver layer...")
-    df = pd.read_sql("SELECT * FROM silver_encounters", engine)
+    chunks = list(iter_silver_chunks(engine, tenant, ehr_source))
+    df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=SILVER_COLUMNS)
     print(f"[SAMPLING] Total completed encounters available: {len(df)}")
     return df
 
 
-def deterministic_sampling(df, sample_rate=0.10):
+def deterministic_sampling(df, sample_rate=SAMPLE_RATE):
     """
-    Apply deterministic 10% sampling based on patient_id hash.
+    Apply deterministic sampling based on patient_id hash.
     
     How it works:
     - Take patient_id (e.g. PAT-0378)
-    - Convert to a hash number using MD5
-    - If hash % 10 == 0 → patient is selected (always same patients!)
+    - Convert to a hash number using MD5 (once per distinct patient)
+    - If hash % buckets < selected → patient is selected (always same patients!)
+      At 10% that is hash % 10 == 0, the original rule
     - This ensures same patients are always selected every run
     """
-    print(f"\n[SAMPLING] Applying deterministic {int(sample_rate * 100)}% sampling...")
-    print("[SAMPLING] Rule: hash(patient_id) % 10 == 0")
-
-    def is_sampled(patient_id):
-        # Convert patient_id to a number using MD5 hash
-        hash_value = int(hashlib.md5(patient_id.encode()).hexdigest(), 16)
-        return hash_value % 10 == 0
-
-    # Apply sampling rule to each row
-    df["is_sampled"] = df["patient_id"].apply(is_sampled)
-    df["sampling_reason"] = df["is_sampled"].apply(
-        lambda x: "deterministic_10pct" if x else "not_selected"
-    )
+    buckets, selected = sampling_buckets(sample_rate)
+    print(f"\n[SAMPLING] Applying deterministic {sample_rate * 100:g}% sampling...")
+    print(f"[SAMPLING] Rule: hash(patient_id) % {buckets} < {selected}")
 
-    # Split into sampled and not sampled
-    df_sampled = df[df["is_sampled"] == True].copy()
-    df_not_sampled = df[df["is_sampled"] == False].copy()
+    with measure("deterministic_sampling") as step:
+        # Hash each distinct patient once and broadcast the result to every row
+        mask = sample_mask(df["patient_id"], sample_rate)
+        df["is_sampled"] = mask
+        df["sampling_reason"] = np.where(mask, sampling_reason(sample_rate), "not_selected")
+        step.add(rows_in=len(df), rows_out=len(df))
 
+    sampled_count = int(mask.sum())
     print(f"[SAMPLING] Total encounters processed: {len(df)}")
-    print(f"[SAMPLING] Selected for chart review: {len(df_sampled)}")
-    print(f"[SAMPLING] Not selected: {len(df_not_sampled)}")
-    print(f"[SAMPLING] Actual sample rate: {round(len(df_sampled)/len(df)*100, 2)}%")
+    print(f"[SAMPLING] Selected for chart review: {sampled_count}")
+    print(f"[SAMPLING] Not selected: {len(df) - sampled_count}")
+    print(f"[SAMPLING] Actual sample rate: {round(sampled_count/len(df)*100, 2)}%")
 
     return df
 
 
-def load_to_gold(df, engine):
-    """Load all encounters to Gold layer with sampling flags."""
-    print("\n[SAMPLING] Loading data into Gold layer (PostgreSQL)...")
+def sample_chunks(chunks, sample_rate=SAMPLE_RATE):
+    """
+    Chunked version of deterministic_sampling for streamed silver reads.
+    Same rule, applied one chunk at a time — a patient's decision depends
+    only on its own hash, so chunk boundaries don't matter. Totals are
+    logged once the last chunk has been consumed.
+    """
+    buckets, selected = sampling_buckets(sample_rate)
+    print(f"\n[SAMPLING] Applying deterministic {sample_rate * 100:g}% sampling (streaming)...")
+    print(f"[SAMPLING] Rule: hash(patient_id) % {buckets} < {selected}")
+    reason = sampling_reason(sample_rate)
+    total = sampled_count = 0
+    step = StepMetrics("deterministic_sampling")
+    status = "error"
 
-    df.to_sql(
-        "gold_encounters",
-        engine,
-        if_exists="replace",
-        index=False,
-        method="multi"
-    )
-    print(f"[SAMPLING] Successfully loaded {len(df)} records into gold_encounters table")
-    
-    # Show summary
-    sampled_count = len(df[df["is_sampled"] == True])
+    try:
+        for df in chunks:
+            with step:
+                mask = sample_mask(df["patient_id"], sample_rate)
+                df["is_sampled"] = mask
+                df["sampling_reason"] = np.where(mask, reason, "not_selected")
+                step.add(rows_in=len(df), rows_out=len(df))
+            total += len(df)
+            sampled_count += int(mask.sum())
+            yield df
+        status = "ok"
+    except GeneratorExit:
+        # The consumer stopped early (or dropped the generator)
+        status = "ok"
+        raise
+    finally:
+        step.finish(status)
+
+    print(f"[SAMPLING] Total encounters processed: {total}")
+    print(f"[SAMPLING] Selected for chart review: {sampled_count}")
+    print(f"[SAMPLING] Not selected: {total - sampled_count}")
+    if total:
+        print(f"[SAMPLING] Actual sample rate: {round(sampled_count/total*100, 2)}%")
+
+
+def notify_gold_loaded(engine, rows):
+    """Tell listeners (e.g. the dashboard) that gold_encounters changed."""
+    with engine.begin() as conn:
+        conn.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": GOLD_LOADED_CHANNEL, "payload": str(rows)}
+        )
+
+
+def print_gold_summary(total, sampled_count):
     print(f"\n[SAMPLING] SUMMARY:")
-    print(f"           Total records in Gold: {len(df)}")
+    print(f"           Total records in Gold: {total}")
     print(f"           Selected for review:   {sampled_count}")
-    print(f"           Not selected:          {len(df) - sampled_count}")
+    print(f"           Not selected:          {total - sampled_count}")
+
+
+def load_to_gold(df, engine, tenant=None, ehr_source=None):
+    """
+    Load all encounters to Gold layer with sampling flags.
+    Accepts a DataFrame or an iterable of chunks (e.g. from sample_chunks),
+    which are written as they arrive.
+    With tenant and ehr_source, only that source's gold rows are replaced
+    (DELETE + COPY in one transaction), so per-source loads can run side
+    by side and a rerun for one source touches nothing else.
+    """
+    print("\n[SAMPLING] Loading data into Gold layer (PostgreSQL)...")
+
+    counts = {"total": 0, "sampled": 0}
+
+    def counted(chunks):
+        for chunk in chunks:
+            counts["total"] += len(chunk)
+            counts["sampled"] += int(chunk["is_sampled"].sum())
+            yield chunk
+
+    chunks = counted([df] if isinstance(df, pd.DataFrame) else df)
+    run_ids = []
+    summarize = lambda conn: run_ids.append(summarize_gold(conn))
+    with measure("load_to_gold", tenant=tenant, ehr_source=ehr_source) as step:
+        if tenant and ehr_source:
+            stats = bulk_load(
+                chunks, "gold_encounters", engine, if_exists="replace",
+                before_chunk=partition_hook("gold_encounters"), after_load=summarize,
+                scope={"tenant": tenant, "ehr_source": ehr_source}
+            )
+        elif SWAP_LOADS:
+            # The dashboard keeps reading the previous gold until the swap
+            stats = swap_load(chunks, "gold_encounters", engine, after_load=summarize)
+        else:
+            stats = bulk_load(
+                chunks, "gold_encounters", engine, if_exists="replace",
+                before_chunk=partition_hook("gold_encounters"), after_load=summarize
+            )
+        step.add(rows_in=counts["total"], rows_out=counts["total"])
+    notify_gold_loaded(engine, counts["total"])
+    print(f"[SAMPLING] Successfully loaded {counts['total']} records into gold_encounters table")
+    print(f"[SAMPLING] Load method: {stats['method']} — "
+          f"{stats['seconds']}s, {stats['rows_per_sec']} rows/sec")
+    print(f"[SAMPLING] Gold summary written for run {run_ids[0]}")
+    print_gold_summary(counts["total"], counts["sampled"])
+    return stats
+
+
+def insert_gold_in_database(conn, target, sample_rate, scope):
+    """
+    INSERT ... SELECT every silver row of scope into target, flagged from
+    the _sampled_patients temp table. Returns (rows, sampled).
+    """
+    where = " AND ".join(f"s.{column} = :{column}" for column in scope) or "TRUE"
+    columns = ", ".join(SILVER_COLUMNS)
+    dates = conn.execute(text(
+        f"SELECT DISTINCT date_of_service FROM silver_encounters s WHERE {where}"
+    ), scope).scalars().all()
+    ensure_partitions(conn, target, dates)
+    result = conn.execute(text(f"""
+        INSERT INTO {target} ({columns}, is_sampled, sampling_reason)
+        SELECT {", ".join(f"s.{c}" for c in SILVER_COLUMNS)},
+               p.patient_id IS NOT NULL,
+               CASE WHEN p.patient_id IS NOT NULL THEN :reason ELSE 'not_selected' END
+        FROM silver_encounters s
+        LEFT JOIN _sampled_patients p ON p.patient_id = s.patient_id
+        WHERE {where}
+    """), dict(scope, reason=sampling_reason(sample_rate)))
+    sampled_count = conn.execute(text(
+        f"SELECT COUNT(*) FROM {target} s WHERE is_sampled AND {where}"
+    ), scope).scalar()
+    return result.rowcount, sampled_count
+
+
+def sample_in_database(engine, sample_rate=SAMPLE_RATE, tenant=None, ehr_source=None):
+    """
+    Sample on patient_id alone and carry the other columns over in Postgres.
+
+    Only the distinct patient_ids leave the database (streamed through a
+    server-side cursor); the same hash rule picks the sampled ones, which
+    go back into a temp table, and one INSERT ... SELECT writes gold from
+    silver joined to it. Same rows, flags and reasons as the pandas path,
+    and the same replace / scoped-replace / swap semantics as load_to_gold.
+    """
+    buckets, selected = sampling_buckets(sample_rate)
+    print(f"\n[SAMPLING] Applying deterministic {sample_rate * 100:g}% sampling (in-database)...")
+    print(f"[SAMPLING] Rule: hash(patient_id) % {buckets} < {selected}")
+    scope = {"tenant": tenant, "ehr_source": ehr_source} if tenant and ehr_source else {}
+    started = time.perf_counter()
+
+    with measure("sample_in_database", tenant=tenant, ehr_source=ehr_source) as step, \
+            engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TEMP TABLE _sampled_patients (patient_id VARCHAR(20) PRIMARY KEY)
+            ON COMMIT DROP
+        """))
+        sql, params = silver_query(tenant, ehr_source, columns=["DISTINCT patient_id"])
+        patients = 0
+        for chunk in read_sql_chunks(sql, params, SAMPLING_CHUNK_SIZE, conn):
+            patients += len(chunk)
+            picked = chunk[sample_mask(chunk["patient_id"], sample_rate)]
+            copy_dataframe(conn, picked, "_sampled_patients")
+        print(f"[SAMPLING] Distinct patients hashed: {patients}")
+
+        if scope or not SWAP_LOADS:
+            clear_table(conn, "gold_encounters", scope)
+            rows, sampled_count = insert_gold_in_database(
+                conn, "gold_encounters", sample_rate, scope
+            )
+            method = "in-database"
+        else:
+            # The dashboard keeps reading the previous gold until the swap
+            with swap_into(conn, "gold_encounters") as target:
+                rows, sampled_count = insert_gold_in_database(conn, target, sample_rate, scope)
+            method = "swap+in-database"
+        run_id = summarize_gold(conn)
+        step.add(rows_in=rows, rows_out=rows)
+
+    seconds = time.perf_counter() - started
+    notify_gold_loaded(engine, rows)
+    print(f"[SAMPLING] Successfully loaded {rows} records into gold_encounters table")
+    print(f"[SAMPLING] Load method: {method} — {round(seconds, 3)}s, "
+          f"{int(rows / seconds) if seconds > 0 else 0} rows/sec")
+    print(f"[SAMPLING] Gold summary written for run {run_id}")
+    print_gold_summary(rows, sampled_count)
+    return {
+        "rows": rows,
+        "seconds": round(seconds, 3),
+        "rows_per_sec": int(rows / seconds) if seconds > 0 else 0,
+        "method": method,
+    }
+
+
+def sample_to_gold(engine, sample_rate=SAMPLE_RATE, tenant=None, ehr_source=None,
+                   sampling_engine=None):
+    """
+    Sample silver into gold without ever holding silver in memory:
+    SAMPLING_ENGINE=pandas streams it chunk by chunk, postgres keeps the
+    rows in the database. Returns load_to_gold's stats dict.
+    """
+    sampling_engine = sampling_engine or SAMPLING_ENGINE
+    if sampling_engine == "postgres":
+        return sample_in_database(engine, sample_rate, tenant, ehr_source)
+    print("[SAMPLING] Streaming completed encounters from Silver layer...")
+    chunks = iter_silver_chunks(engine, tenant, ehr_source)
+    return load_to_gold(sample_chunks(chunks, sample_rate), engine, tenant, ehr_source)
 
 
 if __name__ == "__main__":
@@ -115,19 +406,15 @@ if __name__ == "__main__":
     print("=" * 60)
 
     # Step 1: Connect to database
-    engine = get_db_engine()
+    engine = get_engine()
 
-    # Step 2: Create gold table
+    # Step 2: Create gold tables
     create_gold_table(engine)
+    create_gold_summary_table(engine)
 
-    # Step 3: Read from Silver
-    df_silver = read_from_silver(engine)
-
-    # Step 4: Apply deterministic sampling
-    df_sampled = deterministic_sampling(df_silver, sample_rate=0.10)
-
-    # Step 5: Load to Gold
-    load_to_gold(df_sampled, engine)
+    # Steps 3-5: Stream Silver, apply deterministic sampling and load to
+    # Gold chunk by chunk (or in-database with SAMPLING_ENGINE=postgres)
+    sample_to_gold(engine, sample_rate=SAMPLE_RATE)
 
     print("\n" + "=" * 60)
     print("STAGE 3 — GOLD LAYER LOAD COMPLETED SUCCESSFULLY!")
@@ -0,0 +1,57 @@
+import hashlib
+import os
+from fractions import Fraction
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# How many patient_id hashes to remember across chunks and runs in one process
+SAMPLING_CACHE_SIZE = int(os.getenv("SAMPLING_CACHE_SIZE", "1000000"))
+
+# Finest rate granularity supported (1 / MAX_BUCKETS)
+MAX_BUCKETS = 1_000_000
+
+
+@lru_cache(maxsize=SAMPLING_CACHE_SIZE)
+def patient_hash(patient_id):
+    """MD5 of a patient_id as an integer — computed once per distinct patient."""
+    return int(hashlib.md5(patient_id.encode()).hexdigest(), 16)
+
+
+def sampling_buckets(sample_rate):
+    """
+    Express a sample rate as "hash % buckets < selected".
+    10% → 1 of 10 buckets, i.e. exactly the original hash % 10 == 0 rule;
+    2.5% → 1 of 40 buckets.
+    """
+    if not 0 <= sample_rate <= 1:
+        raise ValueError(f"sample_rate must be between 0 and 1, got {sample_rate}")
+    fraction = Fraction(str(sample_rate)).limit_denominator(MAX_BUCKETS)
+    return fraction.denominator, fraction.numerator
+
+
+def sampling_reason(sample_rate):
+    """Label stored in gold for selected rows, e.g. deterministic_10pct."""
+    return f"deterministic_{sample_rate * 100:g}pct"
+
+
+def sample_mask(patient_ids, sample_rate):
+    """
+    Boolean selection mask for a Series of patient_ids.
+    Each distinct patient_id is hashed once (and cached across calls);
+    the per-patient decision is then broadcast back to every row with
+    a vectorized take, so cost scales with patients, not encounters.
+    """
+    buckets, selected = sampling_buckets(sample_rate)
+    codes, uniques = pd.factorize(patient_ids)
+    patient_flags = np.fromiter(
+        (patient_hash(p) % buckets < selected for p in uniques),
+        dtype=bool, count=len(uniques)
+    )
+    mask = patient_flags.take(codes) if len(uniques) else np.zeros(len(codes), dtype=bool)
+    # factorize marks missing patient_ids with -1 — never sample those
+    mask[codes == -1] = False
+    return mask
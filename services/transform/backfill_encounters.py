@@ -0,0 +1,171 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from sqlalchemy.exc import OperationalError
+from dotenv import load_dotenv
+
+# Add project root to path so the backfill can also run as a plain script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from services.bronze.bronze_catalog import set_partition_status
+from services.db.bulk_load import ensure_unique_key, upsert_dataframe
+from services.db.engine import get_engine
+from services.db.schema import TABLE_KEYS, table_key
+from services.transform.dedup_index import reset_index
+from services.transform.transform_encounters import (
+    SOURCE_KEY, TENANT, EHR_SOURCE, create_silver_table, create_watermark_table,
+    create_processed_partitions_table, get_processed_partitions,
+    mark_partition_processed, set_watermark, list_bronze_partitions,
+    iter_bronze_chunks, clean_encounters
+)
+
+load_dotenv()
+
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", str(os.cpu_count() or 4)))
+BACKFILL_MAX_RETRIES = int(os.getenv("BACKFILL_MAX_RETRIES", "3"))
+
+DEADLOCK_DETECTED = "40P01"
+
+
+def select_partitions(engine, start=None, end=None, unprocessed_only=False,
+                      service_from=None, service_to=None):
+    """
+    Pick the bronze partitions to backfill.
+    start / end are inclusive partition names (e.g. 2026-02-19T10-00-00);
+    unprocessed_only skips partitions already recorded as loaded into silver;
+    service_from / service_to keep only partitions holding encounters in
+    that date_of_service range (pruned from the bronze catalog, unread).
+    """
+    partitions = list_bronze_partitions(service_from=service_from, service_to=service_to)
+    if start:
+        partitions = [p for p in partitions if p >= start]
+    if end:
+        partitions = [p for p in partitions if p <= end]
+    if unprocessed_only:
+        processed = get_processed_partitions(engine)
+        partitions = [p for p in partitions if p not in processed]
+    return partitions
+
+
+def backfill_partition(partition):
+    """
+    Transform one bronze partition and merge it into silver.
+    Runs in a worker process, on that process's pooled engine. Partitions load
+    concurrently; duplicates across partitions are resolved by the
+    ON CONFLICT (key) merge, where the newer ingestion_timestamp
+    wins regardless of which partition finishes first.
+    Returns (partition, rows_merged, max_ingestion_timestamp).
+    """
+    engine = get_engine()
+    for attempt in range(1, BACKFILL_MAX_RETRIES + 1):
+        try:
+            return _merge_partition(engine, partition)
+        except OperationalError as e:
+            # Concurrent merges touching the same encounter_ids can deadlock;
+            # Postgres aborts one side, which simply retries
+            if getattr(e.orig, "pgcode", None) != DEADLOCK_DETECTED \
+                    or attempt == BACKFILL_MAX_RETRIES:
+                raise
+            print(f"[BACKFILL] Deadlock on {partition}, retrying ({attempt})...")
+
+
+def _merge_partition(engine, partition):
+    seen_ids = set()
+    merged = 0
+    max_ingestion_ts = None
+    with engine.begin() as conn:
+        for df in iter_bronze_chunks(partition):
+            df_clean, _ = clean_encounters(df, seen_ids)
+            if df_clean.empty:
+                continue
+            merged += upsert_dataframe(
+                conn, df_clean, "silver_encounters",
+                key_columns=table_key("silver_encounters"),
+                version_column="ingestion_timestamp",
+                row_key=TABLE_KEYS["silver_encounters"]
+            )
+            chunk_max = df_clean["ingestion_timestamp"].max()
+            if max_ingestion_ts is None or chunk_max > max_ingestion_ts:
+                max_ingestion_ts = chunk_max
+        mark_partition_processed(conn, partition, merged)
+    set_partition_status(TENANT, EHR_SOURCE, [partition])
+    return partition, merged, max_ingestion_ts
+
+
+def run_backfill(engine, partitions, workers=None):
+    """Backfill the given partitions in parallel, then advance the watermark."""
+    workers = workers or BACKFILL_WORKERS
+    if not partitions:
+        print("[BACKFILL] Nothing to backfill")
+        return 0
+
+    print(f"[BACKFILL] Backfilling {len(partitions)} partition(s) for {SOURCE_KEY} "
+          f"with {workers} worker(s)...")
+    started = time.perf_counter()
+    total_merged = 0
+    max_ingestion_ts = None
+
+    # Add the merge key up front, so workers don't race to create it.
+    # Workers don't add date partitions either (that would lock the parent
+    # table under concurrent merges): rows outside the pre-created window
+    # wait in the default partition until a load for their period runs
+    with engine.begin() as conn:
+        ensure_unique_key(conn, "silver_encounters", table_key("silver_encounters"))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(backfill_partition, p): p for p in partitions}
+        for future in as_completed(futures):
+            partition, merged, partition_max = future.result()
+            total_merged += merged
+            if partition_max is not None and (
+                    max_ingestion_ts is None or partition_max > max_ingestion_ts):
+                max_ingestion_ts = partition_max
+            print(f"[BACKFILL] {partition}: merged {merged} records")
+
+    # The watermark only moves forward, so backfilling old partitions is safe
+    with engine.begin() as conn:
+        set_watermark(conn, max(partitions), max_ingestion_ts)
+    # Workers merge past the dedup index (they would race on it), so it is
+    # rebuilt by the next merge
+    reset_index(SOURCE_KEY)
+
+    seconds = time.perf_counter() - started
+    print(f"[BACKFILL] Merged {total_merged} records from {len(partitions)} "
+          f"partition(s) in {round(seconds, 2)}s")
+    return total_merged
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill bronze partitions into silver")
+    parser.add_argument("--start", help="first partition to include, e.g. 2026-02-19T09-45-10")
+    parser.add_argument("--end", help="last partition to include")
+    parser.add_argument("--all-unprocessed", action="store_true",
+                        help="only partitions not yet loaded into silver")
+    parser.add_argument("--service-from", help="only partitions with encounters on or after "
+                                               "this date_of_service, e.g. 2026-02-01")
+    parser.add_argument("--service-to", help="only partitions with encounters on or before "
+                                             "this date_of_service")
+    parser.add_argument("--workers", type=int, default=BACKFILL_WORKERS)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("SILVER BACKFILL STARTED")
+    print("=" * 60)
+
+    engine = get_engine()
+    create_silver_table(engine)
+    create_watermark_table(engine)
+    create_processed_partitions_table(engine)
+
+    partitions = select_partitions(
+        engine, start=args.start, end=args.end,
+        unprocessed_only=args.all_unprocessed,
+        service_from=args.service_from, service_to=args.service_to
+    )
+    run_backfill(engine, partitions, workers=args.workers)
+
+    print("\n" + "=" * 60)
+    print("SILVER BACKFILL COMPLETED SUCCESSFULLY!")
+    print("=" * 60)
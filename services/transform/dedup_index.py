@@ -0,0 +1,271 @@
+import hashlib
+import math
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BRONZE_BASE_PATH = os.getenv("BRONZE_BASE_PATH", "./bronze")
+# true = merges into silver skip encounters whose content is unchanged
+# since they were last loaded, and update the ones that changed
+DEDUP_INDEX = os.getenv("DEDUP_INDEX", "true").lower() == "true"
+# SQLite file holding the exact (encounter_id → content hash) set and each
+# source's Bloom filter
+DEDUP_INDEX_PATH = os.getenv(
+    "DEDUP_INDEX_PATH", os.path.join(BRONZE_BASE_PATH, "_dedup_index.sqlite")
+)
+# Keys per source the Bloom filter is sized for (it is rebuilt twice as
+# large once outgrown) and its target false-positive rate
+DEDUP_BLOOM_CAPACITY = int(os.getenv("DEDUP_BLOOM_CAPACITY", "1000000"))
+DEDUP_BLOOM_ERROR_RATE = float(os.getenv("DEDUP_BLOOM_ERROR_RATE", "0.01"))
+DEDUP_INDEX_TIMEOUT = float(os.getenv("DEDUP_INDEX_TIMEOUT", "30"))
+
+# Exact-set lookups per SQLite statement (stays under its variable limit)
+LOOKUP_BATCH_SIZE = 500
+
+# What makes two versions of an encounter different — ingestion_timestamp
+# changes on every re-extraction, so it is left out
+CONTENT_COLUMNS = [
+    "patient_id", "app_id", "physician_id", "date_of_service",
+    "state", "status", "medications", "clinical_notes"
+]
+
+INDEX_DDL = """
+    CREATE TABLE IF NOT EXISTS dedup_keys (
+        source_key   TEXT NOT NULL,
+        encounter_id TEXT NOT NULL,
+        content_hash INTEGER NOT NULL,
+        ingested_ns  INTEGER NOT NULL,
+        PRIMARY KEY (source_key, encounter_id)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS dedup_sources (
+        source_key   TEXT PRIMARY KEY,
+        silver_epoch TEXT NOT NULL,
+        key_count    INTEGER NOT NULL,
+        capacity     INTEGER NOT NULL,
+        bloom        BLOB NOT NULL,
+        updated_at   TEXT NOT NULL
+    );
+"""
+
+
+def open_index_db(path=None):
+    path = path or DEDUP_INDEX_PATH
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=DEDUP_INDEX_TIMEOUT)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(INDEX_DDL)
+    return conn
+
+
+def content_hashes(df):
+    """Stable 64-bit hash of each row's CONTENT_COLUMNS (same values → same hash)."""
+    content = df[CONTENT_COLUMNS].assign(medications=df["medications"].map(
+        lambda meds: "\x1f".join(meds) if isinstance(meds, list) else meds
+    ))
+    hashes = pd.util.hash_pandas_object(content, index=False)
+    return hashes.to_numpy().view(np.int64)
+
+
+def ingested_ns(df):
+    """ingestion_timestamp of each row as int64 nanoseconds."""
+    return df["ingestion_timestamp"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+
+def silver_epoch(conn):
+    """
+    Identity of the current silver table. It changes whenever silver is
+    rebuilt under the index (swap rollback, recreated database), which
+    invalidates every entry recorded against the old table.
+    """
+    return str(conn.execute(text("SELECT CAST(to_regclass('silver_encounters') AS oid)")).scalar())
+
+
+def bloom_size(capacity, error_rate=None):
+    """(bits, hash functions) for a Bloom filter of capacity keys."""
+    error_rate = error_rate or DEDUP_BLOOM_ERROR_RATE
+    bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+    return bits, max(1, round(bits / capacity * math.log(2)))
+
+
+def bloom_positions(keys, bits, hash_count):
+    """Bit positions of each key, shape (len(keys), hash_count) — double hashing."""
+    digests = [hashlib.blake2b(k.encode(), digest_size=16).digest() for k in keys]
+    pairs = np.frombuffer(b"".join(digests), dtype=np.uint64).reshape(-1, 2)
+    steps = np.arange(hash_count, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        return (pairs[:, :1] + steps * pairs[:, 1:]) % np.uint64(bits)
+
+
+class DedupIndex:
+    """
+    Seen-key index of one source's encounters in silver.
+
+    A Bloom filter answers "never seen" for most new encounter_ids without
+    touching disk; only its hits are looked up in the exact on-disk set,
+    which holds each encounter's content hash and the newest
+    ingestion_timestamp seen for it. split() sorts a clean chunk into new,
+    changed and unchanged rows and queues the index updates; commit()
+    persists them — call it only after silver has committed.
+
+    An unchanged re-send only moves the index's timestamp, not silver's
+    (ingestion_timestamp in silver is when the content last changed), so
+    versions older than the newest one seen are dropped here, just as the
+    version check of the merge would have dropped them.
+    """
+
+    def __init__(self, source_key, epoch, path=None):
+        self.source_key = source_key
+        self.epoch = epoch
+        self.path = path or DEDUP_INDEX_PATH
+        self.pending = {}
+        self.pending_new = []
+        self.counts = {"new": 0, "changed": 0, "unchanged": 0, "stale": 0}
+        with closing(open_index_db(self.path)) as db:
+            row = db.execute(
+                "SELECT silver_epoch, key_count, capacity, bloom FROM dedup_sources "
+                "WHERE source_key = ?", (source_key,)
+            ).fetchone()
+        if row and row[0] == epoch:
+            self.key_count, self.capacity = row[1], row[2]
+            self.bloom = np.frombuffer(row[3], dtype=np.uint8).copy()
+        else:
+            if row:
+                print(f"[DEDUP] Silver was rebuilt — discarding the index of {source_key}")
+                reset_index(source_key, self.path)
+            self.key_count, self.capacity = 0, DEDUP_BLOOM_CAPACITY
+            self.bloom = np.zeros(math.ceil(bloom_size(self.capacity)[0] / 8), dtype=np.uint8)
+        self.bits, self.hash_count = bloom_size(self.capacity)
+
+    def might_contain(self, keys):
+        if not len(keys):
+            return np.zeros(0, dtype=bool)
+        positions = bloom_positions(keys, self.bits, self.hash_count)
+        bytes_, offsets = positions // np.uint64(8), positions % np.uint64(8)
+        hits = (self.bloom[bytes_.astype(np.int64)] >> offsets.astype(np.uint8)) & 1
+        return hits.all(axis=1)
+
+    def _add_to_bloom(self, keys):
+        if not keys:
+            return
+        positions = bloom_positions(keys, self.bits, self.hash_count).ravel()
+        np.bitwise_or.at(
+            self.bloom, (positions // np.uint64(8)).astype(np.int64),
+            (np.uint8(1) << (positions % np.uint64(8)).astype(np.uint8))
+        )
+
+    def lookup(self, keys):
+        """{encounter_id: (content_hash, ingested_ns)} for the keys in the exact set."""
+        found = {}
+        with closing(open_index_db(self.path)) as db:
+            for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+                batch = keys[start:start + LOOKUP_BATCH_SIZE]
+                rows = db.execute(
+                    f"SELECT encounter_id, content_hash, ingested_ns FROM dedup_keys "
+                    f"WHERE source_key = ? AND encounter_id IN ({', '.join('?' * len(batch))})",
+                    [self.source_key, *batch]
+                )
+                found.update((row[0], (row[1], row[2])) for row in rows)
+        return found
+
+    def split(self, df):
+        """(new_rows, changed_rows) of a clean chunk; unchanged and stale rows are dropped."""
+        keys = df["encounter_id"].astype(str).to_numpy()
+        hashes = content_hashes(df)
+        ingested = ingested_ns(df)
+        candidates = keys[self.might_contain(keys)].tolist()
+        known = self.lookup(candidates) if candidates else {}
+        is_known = np.array([k in known for k in keys], dtype=bool)
+        known_hash = np.array([known.get(k, (0, 0))[0] for k in keys], dtype=np.int64)
+        known_ingested = np.array([known.get(k, (0, 0))[1] for k in keys], dtype=np.int64)
+
+        is_stale = is_known & (ingested < known_ingested)
+        is_changed = is_known & ~is_stale & (hashes != known_hash)
+        is_unchanged = is_known & ~is_stale & (hashes == known_hash)
+        self.counts["new"] += int((~is_known).sum())
+        self.counts["changed"] += int(is_changed.sum())
+        self.counts["unchanged"] += int(is_unchanged.sum())
+        self.counts["stale"] += int(is_stale.sum())
+
+        # Unchanged re-sends still advance the newest-seen timestamp
+        queued = ~is_known | is_changed | (is_unchanged & (ingested > known_ingested))
+        self.pending_new.extend(keys[~is_known].tolist())
+        self.pending.update(zip(
+            keys[queued].tolist(), zip(hashes[queued].tolist(), ingested[queued].tolist())
+        ))
+        return df[~is_known], df[is_changed]
+
+    def commit(self):
+        """Persist the keys queued by split() and the grown Bloom filter."""
+        self.key_count += len(self.pending_new)
+        if self.key_count > self.capacity:
+            self._rebuild(self.capacity * 2, self.pending_new)
+        else:
+            self._add_to_bloom(self.pending_new)
+        with closing(open_index_db(self.path)) as db, db:
+            db.executemany(
+                "INSERT OR REPLACE INTO dedup_keys "
+                "(source_key, encounter_id, content_hash, ingested_ns) VALUES (?, ?, ?, ?)",
+                [(self.source_key, k, h, ns) for k, (h, ns) in self.pending.items()]
+            )
+            db.execute(
+                "INSERT OR REPLACE INTO dedup_sources "
+                "(source_key, silver_epoch, key_count, capacity, bloom, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (self.source_key, self.epoch, self.key_count, self.capacity,
+                 self.bloom.tobytes(), datetime.utcnow().isoformat())
+            )
+        self.pending = {}
+        self.pending_new = []
+
+    def _rebuild(self, capacity, new_keys):
+        while capacity < self.key_count:
+            capacity *= 2
+        self.capacity = capacity
+        self.bits, self.hash_count = bloom_size(capacity)
+        self.bloom = np.zeros(math.ceil(self.bits / 8), dtype=np.uint8)
+        with closing(open_index_db(self.path)) as db:
+            rows = db.execute(
+                "SELECT encounter_id FROM dedup_keys WHERE source_key = ?", (self.source_key,)
+            )
+            while True:
+                batch = [r[0] for r in rows.fetchmany(100000)]
+                if not batch:
+                    break
+                self._add_to_bloom(batch)
+        self._add_to_bloom(new_keys)
+        print(f"[DEDUP] Bloom filter of {self.source_key} grown to {capacity} keys")
+
+    def log_counts(self):
+        print(f"[DEDUP] {self.counts['new']} new, {self.counts['changed']} changed, "
+              f"{self.counts['unchanged']} unchanged and {self.counts['stale']} stale "
+              f"duplicate(s) skipped")
+
+
+def open_dedup_index(conn, source_key):
+    """The source's index, or None with DEDUP_INDEX=false."""
+    if not DEDUP_INDEX:
+        return None
+    return DedupIndex(source_key, silver_epoch(conn))
+
+
+def reset_index(source_key=None, path=None):
+    """
+    Forget what the index knows — for one source, or all of them — after
+    silver was loaded by a path that doesn't maintain it (replace loads,
+    in-database ELT merges, backfills). The next merge then treats every
+    row as new, which the ON CONFLICT merge keeps correct.
+    """
+    with closing(open_index_db(path)) as db, db:
+        if source_key is None:
+            db.execute("DELETE FROM dedup_keys")
+            db.execute("DELETE FROM dedup_sources")
+        else:
+            db.execute("DELETE FROM dedup_keys WHERE source_key = ?", (source_key,))
+            db.execute("DELETE FROM dedup_sources WHERE source_key = ?", (source_key,))
@@ -0,0 +1,296 @@
+import io
+import os
+import sys
+import time
+from sqlalchemy import text
+from dotenv import load_dotenv
+
+# Add project root to path so this stage can also run as a plain script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from services.bronze.bronze_catalog import record_bad_lines, set_partition_status
+from services.bronze.bronze_files import find_bronze_files, open_ndjson_reader, parse_ndjson_line
+from services.db.bulk_load import COPY_BATCH_SIZE, delete_moved_rows, ensure_unique_key
+from services.db.engine import get_engine
+from services.db.schema import TABLE_KEYS, ensure_partitions, table_key
+from services.db.swap import SWAP_LOADS, swap_into
+from services.metrics.stage_metrics import count_bytes_read, count_bytes_written, measure
+from services.transform.dedup_index import reset_index
+from services.transform.transform_encounters import (
+    SILVER_LOAD_MODE, SOURCE_KEY, TENANT, EHR_SOURCE, source_key, create_silver_table,
+    create_watermark_table, create_processed_partitions_table, get_watermark,
+    set_watermark, mark_partition_processed, get_bronze_encounters_path,
+    list_bronze_partitions
+)
+
+load_dotenv()
+
+STAGING_TABLE = "bronze_encounters_staging"
+# Typed silver rows of an incremental merge into a partitioned silver
+MERGE_TABLE = "silver_encounters_merge"
+
+# Raw lines go through COPY csv with quote/delimiter bytes that never appear
+# in JSON text (json.dumps escapes control characters), so every line lands
+# verbatim in one column without COPY's backslash processing
+COPY_RAW_LINES_SQL = (
+    f"COPY {STAGING_TABLE} (doc) FROM STDIN "
+    f"WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')"
+)
+
+# The transform_data rules as one set-based statement:
+# completed only → dedup on encounter_id (first line wins) → drop rows
+# missing encounter_id / patient_id → cast dates → medications as TEXT[] →
+# stamp the source (:tenant, :ehr_source)
+SILVER_SELECT_SQL = f"""
+    WITH completed AS (
+        SELECT DISTINCT ON (doc->>'encounter_id') doc
+        FROM {STAGING_TABLE}
+        WHERE doc->>'status' = 'completed'
+        ORDER BY doc->>'encounter_id', line_no
+    )
+    SELECT
+        CAST(:tenant AS VARCHAR),
+        CAST(:ehr_source AS VARCHAR),
+        doc->>'encounter_id',
+        doc->>'patient_id',
+        doc->>'app_id',
+        doc->>'physician_id',
+        CAST(doc->>'date_of_service' AS DATE),
+        doc->>'state',
+        doc->>'status',
+        CASE jsonb_typeof(doc->'medications')
+            WHEN 'array' THEN ARRAY(
+                SELECT m.value
+                FROM jsonb_array_elements_text(doc->'medications')
+                     WITH ORDINALITY AS m(value, position)
+                ORDER BY m.position
+            )
+            ELSE string_to_array(doc->>'medications', ',')
+        END,
+        doc->>'clinical_notes',
+        CAST(doc->>'ingestion_timestamp' AS TIMESTAMP)
+    FROM completed
+    WHERE doc->>'encounter_id' IS NOT NULL
+      AND doc->>'patient_id' IS NOT NULL
+"""
+
+SILVER_INSERT_COLUMNS = """
+    tenant, ehr_source, encounter_id, patient_id, app_id, physician_id, date_of_service,
+    state, status, medications, clinical_notes, ingestion_timestamp
+"""
+
+
+def create_staging_table(conn):
+    """Session-local JSONB landing table, dropped when the transaction ends."""
+    conn.execute(text(f"""
+        CREATE TEMP TABLE {STAGING_TABLE} (
+            line_no     BIGSERIAL,
+            doc         JSONB NOT NULL
+        ) ON COMMIT DROP
+    """))
+
+
+def _copy_file_lines(cursor, file_path, batch_size, bad_lines):
+    if file_path.endswith(".parquet"):
+        raise ValueError(
+            f"In-database ELT reads NDJSON bronze only, got {file_path} — "
+            f"use TRANSFORM_ENGINE=pandas for Parquet partitions"
+        )
+    print(f"[TRANSFORM] Staging Bronze file: {file_path}")
+    count_bytes_read(os.path.getsize(file_path))
+
+    def send(lines):
+        payload = "".join(lines).encode("utf-8")
+        count_bytes_written(len(payload))
+        cursor.copy_expert(COPY_RAW_LINES_SQL, io.BytesIO(payload))
+
+    staged = 0
+    batch = []
+    with open_ndjson_reader(file_path) as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            # Parsed only to validate: one bad line would fail the whole
+            # COPY batch's ::jsonb cast
+            if parse_ndjson_line(line, file_path, line_no, bad_lines) is None:
+                continue
+            batch.append(line + "\n")
+            if len(batch) >= batch_size:
+                send(batch)
+                staged += len(batch)
+                batch = []
+    if batch:
+        send(batch)
+        staged += len(batch)
+    return staged
+
+
+def copy_raw_lines(conn, partitions, batch_size=None, bronze_path=None):
+    """
+    COPY the raw NDJSON lines of each partition into the staging table.
+    Lines are passed through untouched — no pandas, json.loads only to
+    validate them — in batches of batch_size lines. Malformed lines follow
+    the Python reader's BRONZE_MAX_BAD_LINES policy: past the threshold
+    the load fails, tolerated ones are recorded in the bronze catalog.
+    Partition names are resolved under bronze_path (default: the
+    configured source). Returns the number of lines staged.
+    """
+    batch_size = batch_size or COPY_BATCH_SIZE
+    bronze_path = bronze_path or get_bronze_encounters_path()
+    cursor = conn.connection.cursor()
+    staged = 0
+    try:
+        for partition in partitions:
+            partition_path = os.path.join(bronze_path, partition)
+            bad_lines = {}
+            for file_path in find_bronze_files(partition_path):
+                staged += _copy_file_lines(cursor, file_path, batch_size, bad_lines)
+            if bad_lines:
+                record_bad_lines(partition_path, bad_lines["bad_lines"])
+    finally:
+        cursor.close()
+    return staged
+
+
+def insert_silver(conn, target, dates, source):
+    """INSERT ... SELECT the staged lines into target (silver or its staging copy)."""
+    ensure_partitions(conn, target, dates)
+    return conn.execute(text(f"""
+        INSERT INTO {target} ({SILVER_INSERT_COLUMNS})
+        {SILVER_SELECT_SQL}
+    """), source)
+
+
+def load_to_silver_in_database(engine, partitions, mode=None,
+                               tenant=TENANT, ehr_source=EHR_SOURCE):
+    """
+    Run the silver transform inside Postgres.
+
+    - replace     → TRUNCATE + INSERT ... SELECT (into a staging copy that
+                    is swapped in with SWAP_LOADS=true); same result as
+                    load_to_silver
+    - incremental → INSERT ... SELECT ... ON CONFLICT (key) DO UPDATE,
+                    newer ingestion_timestamp wins, watermark advanced in the
+                    same transaction; with partitioning, an encounter whose
+                    date_of_service changed replaces its old row
+    For incremental loads pass partitions newest first, so the dedup keeps
+    the latest version of an encounter. partitions are bronze folders of
+    tenant's ehr_source. Returns the number of silver rows written.
+    """
+    mode = mode or SILVER_LOAD_MODE
+    started = time.perf_counter()
+    source = {"tenant": tenant, "ehr_source": ehr_source}
+
+    with measure("elt_to_silver", tenant=tenant, ehr_source=ehr_source) as step, \
+            engine.begin() as conn:
+        create_staging_table(conn)
+        staged = copy_raw_lines(
+            conn, partitions, bronze_path=get_bronze_encounters_path(tenant, ehr_source)
+        )
+        print(f"[TRANSFORM] Raw lines staged in Postgres: {staged}")
+
+        staged_dates = conn.execute(text(f"""
+            SELECT DISTINCT CAST(doc->>'date_of_service' AS DATE)
+            FROM {STAGING_TABLE} WHERE doc->>'status' = 'completed'
+        """)).scalars().all()
+
+        if mode == "incremental":
+            ensure_partitions(conn, "silver_encounters", staged_dates)
+            key = table_key("silver_encounters")
+            ensure_unique_key(conn, "silver_encounters", key)
+            rows_sql = SILVER_SELECT_SQL
+            if key != TABLE_KEYS["silver_encounters"]:
+                # The key includes date_of_service: land the rows typed first,
+                # so an encounter whose date changed replaces its old row
+                # instead of being inserted beside it
+                conn.execute(text(
+                    f"CREATE TEMP TABLE {MERGE_TABLE} "
+                    f"(LIKE silver_encounters INCLUDING DEFAULTS) ON COMMIT DROP"
+                ))
+                conn.execute(text(f"""
+                    INSERT INTO {MERGE_TABLE} ({SILVER_INSERT_COLUMNS})
+                    {SILVER_SELECT_SQL}
+                """), source)
+                delete_moved_rows(
+                    conn, "silver_encounters", MERGE_TABLE, TABLE_KEYS["silver_encounters"],
+                    key, version_column="ingestion_timestamp"
+                )
+                rows_sql = f"SELECT {SILVER_INSERT_COLUMNS} FROM {MERGE_TABLE}"
+            result = conn.execute(text(f"""
+                INSERT INTO silver_encounters ({SILVER_INSERT_COLUMNS})
+                {rows_sql}
+                ORDER BY 3
+                ON CONFLICT ({", ".join(key)}) DO UPDATE SET
+                    patient_id = EXCLUDED.patient_id,
+                    app_id = EXCLUDED.app_id,
+                    physician_id = EXCLUDED.physician_id,
+                    date_of_service = EXCLUDED.date_of_service,
+                    state = EXCLUDED.state,
+                    status = EXCLUDED.status,
+                    medications = EXCLUDED.medications,
+                    clinical_notes = EXCLUDED.clinical_notes,
+                    ingestion_timestamp = EXCLUDED.ingestion_timestamp
+                WHERE silver_encounters.ingestion_timestamp IS NULL
+                   OR silver_encounters.ingestion_timestamp <= EXCLUDED.ingestion_timestamp
+            """), source)
+            max_ingestion_ts = conn.execute(text(
+                f"SELECT MAX(CAST(doc->>'ingestion_timestamp' AS TIMESTAMP)) FROM {STAGING_TABLE}"
+            )).scalar()
+            watermark_key = source_key(tenant, ehr_source)
+            set_watermark(conn, max(partitions), max_ingestion_ts, source_key=watermark_key)
+            for partition in partitions:
+                mark_partition_processed(conn, partition, source_key=watermark_key)
+        elif SWAP_LOADS:
+            # Build the new silver beside the live one and swap it in
+            with swap_into(conn, "silver_encounters") as target:
+                result = insert_silver(conn, target, staged_dates, source)
+        else:
+            conn.execute(text("TRUNCATE TABLE silver_encounters"))
+            result = insert_silver(conn, "silver_encounters", staged_dates, source)
+        step.add(rows_in=staged, rows_out=result.rowcount)
+
+    if mode == "incremental":
+        set_partition_status(tenant, ehr_source, partitions)
+    # Rows changed in the database, out of the dedup index's sight
+    reset_index(source_key(tenant, ehr_source) if mode == "incremental" else None)
+    seconds = time.perf_counter() - started
+    written = result.rowcount
+    print(f"[TRANSFORM] Successfully loaded {written} records into silver_encounters table")
+    print(f"[TRANSFORM] Load method: in-database ELT — {round(seconds, 3)}s, "
+          f"{int(staged / seconds) if seconds > 0 else 0} raw lines/sec")
+    return written
+
+
+def run_in_database_transform(engine, mode=None):
+    """Pick the bronze partitions for the load mode and run the ELT load."""
+    mode = mode or SILVER_LOAD_MODE
+    if mode == "incremental":
+        create_watermark_table(engine)
+        create_processed_partitions_table(engine)
+        last_partition, _ = get_watermark(engine)
+        partitions = list_bronze_partitions(after=last_partition, non_empty=True)
+        if not partitions:
+            print("[TRANSFORM] No new Bronze partitions since last watermark")
+            return None
+        # Newest partition first, so dedup keeps the latest version
+        partitions.reverse()
+        print(f"[TRANSFORM] Incremental ELT load for {SOURCE_KEY}: "
+              f"{len(partitions)} new partition(s)")
+    else:
+        partitions = list_bronze_partitions()[-1:]
+    return load_to_silver_in_database(engine, partitions, mode)
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("STAGE 2 — IN-DATABASE TRANSFORM TO SILVER LAYER STARTED")
+    print("=" * 60)
+
+    engine = get_engine()
+    create_silver_table(engine)
+    run_in_database_transform(engine)
+
+    print("\n" + "=" * 60)
+    print("STAGE 2 — SILVER LAYER LOAD COMPLETED SUCCESSFULLY!")
+    print("=" * 60)
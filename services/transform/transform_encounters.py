@@ -1,120 +1,445 @@
-import json
 import os
-import glob
+import sys
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from dotenv import load_dotenv
-from datetime import datetime
 
-load_dotenv()
+# Add project root to path so this stage can also run as a plain script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from services.bronze.bronze_catalog import catalog_partitions, record_bad_lines, set_partition_status
+from services.bronze.bronze_files import find_bronze_files, iter_bronze_file
+from services.db.bulk_load import bulk_load, update_dataframe, upsert_dataframe
+from services.db.engine import get_engine
+from services.db.schema import (
+    TABLE_KEYS, ensure_partitions, ensure_table, partition_hook, table_key
+)
+from services.db.swap import SWAP_LOADS, swap_load
+from services.metrics.stage_metrics import (
+    StepMetrics, measure, measured_chunks, metrics_context
+)
+from services.transform.dedup_index import open_dedup_index, reset_index
 
-# Database connection
-DB_HOST = os.getenv("DB_HOST", "localhost")
-DB_PORT = os.getenv("DB_PORT", "5432")
-DB_NAME = os.getenv("DB_NAME", "zivian_db")
-DB_USER = os.getenv("DB_USER", "postgres")
-DB_PASSWORD = os.getenv("DB_PASSWORD", "postgres123")
+load_dotenv()
 
 BRONZE_BASE_PATH = os.getenv("BRONZE_BASE_PATH", "./bronze")
 TENANT = os.getenv("TENANT", "zivian")
 ENVIRONMENT = os.getenv("ENVIRONMENT", "dev")
 EHR_SOURCE = os.getenv("EHR_SOURCE", "athenahealth")
 
-def get_db_engine():
-    """Create database connection."""
-    conn_str = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-    return create_engine(conn_str)
+# replace = rebuild silver from the latest bronze folder (original behaviour)
+# incremental = upsert only bronze partitions newer than the watermark
+SILVER_LOAD_MODE = os.getenv("SILVER_LOAD_MODE", "replace")
+SOURCE_KEY = f"{TENANT}/{ENVIRONMENT}/{EHR_SOURCE}/encounters"
 
+# pandas = transform in Python (default)
+# postgres = COPY raw lines into Postgres and transform there (elt_encounters.py)
+TRANSFORM_ENGINE = os.getenv("TRANSFORM_ENGINE", "pandas")
+
+# Max records held in memory at once while streaming a bronze file
+BRONZE_CHUNK_SIZE = int(os.getenv("BRONZE_CHUNK_SIZE", "50000"))
 
 def create_silver_table(engine):
-    """Create silver table in PostgreSQL if it doesn't exist."""
-    create_table_sql = """
-        CREATE TABLE IF NOT EXISTS silver_encounters (
-            encounter_id        VARCHAR(20) PRIMARY KEY,
-            patient_id          VARCHAR(20) NOT NULL,
-            app_id              VARCHAR(20),
-            physician_id        VARCHAR(20),
-            date_of_service     DATE,
-            state               VARCHAR(5),
-            status              VARCHAR(20),
-            medications         TEXT,
-            clinical_notes      TEXT,
-            ingestion_timestamp TIMESTAMP,
-            transformed_at      TIMESTAMP DEFAULT NOW()
-        );
-    """
-    with engine.begin() as conn:
-        conn.execute(text(create_table_sql))
+    """Create silver table (with its key and indexes) if it doesn't exist."""
+    ensure_table(engine, "silver_encounters")
     print("[TRANSFORM] Silver table ready in PostgreSQL")
 
 
+def create_watermark_table(engine):
+    """Create the per-source high-water mark table used by incremental loads."""
+    ensure_table(engine, "pipeline_watermarks")
+
+
+def get_watermark(engine, source_key=SOURCE_KEY):
+    """Return (last_partition, last_ingestion_ts) for a source, or (None, None)."""
+    with engine.connect() as conn:
+        row = conn.execute(text("""
+            SELECT last_partition, last_ingestion_ts
+            FROM pipeline_watermarks WHERE source_key = :source_key
+        """), {"source_key": source_key}).first()
+    return (row[0], row[1]) if row else (None, None)
+
+
+def set_watermark(conn, last_partition, last_ingestion_ts, source_key=SOURCE_KEY):
+    """Advance the watermark. Runs inside the caller's load transaction."""
+    conn.execute(text("""
+        INSERT INTO pipeline_watermarks (source_key, last_partition, last_ingestion_ts)
+        VALUES (:source_key, :last_partition, :last_ingestion_ts)
+        ON CONFLICT (source_key) DO UPDATE SET
+            last_partition = GREATEST(
+                pipeline_watermarks.last_partition, EXCLUDED.last_partition
+            ),
+            last_ingestion_ts = GREATEST(
+                pipeline_watermarks.last_ingestion_ts, EXCLUDED.last_ingestion_ts
+            ),
+            updated_at = NOW()
+    """), {
+        "source_key": source_key,
+        "last_partition": last_partition,
+        "last_ingestion_ts": last_ingestion_ts,
+    })
+
+
+def create_processed_partitions_table(engine):
+    """Create the table recording which bronze partitions reached silver."""
+    ensure_table(engine, "silver_processed_partitions")
+
+
+def get_processed_partitions(engine, source_key=SOURCE_KEY):
+    """Names of the bronze partitions already loaded into silver."""
+    with engine.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT partition_name FROM silver_processed_partitions
+            WHERE source_key = :source_key
+        """), {"source_key": source_key})
+        return {row[0] for row in rows}
+
+
+def mark_partition_processed(conn, partition, row_count=None, source_key=SOURCE_KEY):
+    """Record a loaded partition. Runs inside the caller's load transaction."""
+    conn.execute(text("""
+        INSERT INTO silver_processed_partitions (source_key, partition_name, row_count)
+        VALUES (:source_key, :partition_name, :row_count)
+        ON CONFLICT (source_key, partition_name) DO UPDATE SET
+            row_count = EXCLUDED.row_count,
+            processed_at = NOW()
+    """), {"source_key": source_key, "partition_name": partition, "row_count": row_count})
+
+
+def source_key(tenant=TENANT, ehr_source=EHR_SOURCE):
+    """Watermark / processed-partition key of one tenant's EHR source."""
+    return f"{tenant}/{ENVIRONMENT}/{ehr_source}/encounters"
+
+
+def get_bronze_encounters_path(tenant=TENANT, ehr_source=EHR_SOURCE):
+    """Bronze folder holding one sub-folder per extraction timestamp."""
+    return os.path.join(
+        BRONZE_BASE_PATH, tenant, ENVIRONMENT, ehr_source, "encounters"
+    )
+
+
+def list_bronze_partitions(tenant=TENANT, ehr_source=EHR_SOURCE, **filters):
+    """
+    Bronze timestamp partitions, oldest first, as registered in the bronze
+    catalog — no folder is listed. filters prune on the catalog metadata
+    (after, non_empty, service_from / service_to; see catalog_partitions).
+    """
+    return [
+        entry["partition"]
+        for entry in catalog_partitions(tenant, ehr_source, ENVIRONMENT, **filters)
+    ]
+
+
+def iter_bronze_path_chunks(partition_path, chunk_size=None):
+    """
+    Stream the bronze partition folder at partition_path as DataFrame chunks.
+    At most chunk_size parsed records are held in memory at a time,
+    so peak memory no longer grows with the file size.
+    NDJSON and Parquet partitions, single-file or multi-part, are
+    detected automatically. Malformed lines past BRONZE_MAX_BAD_LINES fail
+    the read; tolerated ones are recorded in the bronze catalog.
+    """
+    chunk_size = chunk_size or BRONZE_CHUNK_SIZE
+    file_paths = find_bronze_files(partition_path)
+
+    def chunks():
+        bad_lines = {}
+        for file_path in file_paths:
+            print(f"[TRANSFORM] Reading Bronze file: {file_path}")
+            yield from iter_bronze_file(file_path, chunk_size, bad_lines=bad_lines)
+        if bad_lines:
+            record_bad_lines(partition_path, bad_lines["bad_lines"])
+
+    bytes_read = sum(os.path.getsize(file_path) for file_path in file_paths)
+    yield from measured_chunks("read_bronze_file", chunks(), bytes_read=bytes_read)
+
+
+def iter_bronze_chunks(partition, chunk_size=None):
+    """Stream one bronze timestamp partition (by name) as DataFrame chunks."""
+    partition_path = os.path.join(get_bronze_encounters_path(), partition)
+    return iter_bronze_path_chunks(partition_path, chunk_size)
+
+
+def read_bronze_partition(partition):
+    """Read one bronze timestamp partition into a single DataFrame."""
+    chunks = list(iter_bronze_chunks(partition))
+    return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+
+
 def read_latest_bronze_file():
     """Read the latest NDJSON file from Bronze layer."""
-    bronze_path = os.path.join(
-        BRONZE_BASE_PATH, TENANT, ENVIRONMENT, EHR_SOURCE, "encounters"
-    )
-    
     # Get latest folder by timestamp
-    folders = sorted(os.listdir(bronze_path), reverse=True)
-    latest_folder = folders[0]
-    file_path = os.path.join(bronze_path, latest_folder, "encounters_raw.ndjson")
-    
-    print(f"[TRANSFORM] Reading Bronze file: {file_path}")
-    
-    records = []
-    with open(file_path, "r") as f:
-        for line in f:
-            records.append(json.loads(line.strip()))
-    
-    df = pd.DataFrame(records)
+    latest_folder = list_bronze_partitions()[-1]
+    df = read_bronze_partition(latest_folder)
     print(f"[TRANSFORM] Total raw records read: {len(df)}")
     return df
 
 
-def transform_data(df):
-    """Clean, validate and transform the data."""
-    print("[TRANSFORM] Applying transformations...")
+def iter_latest_bronze_chunks(chunk_size=None):
+    """Stream the latest bronze partition as DataFrame chunks."""
+    latest_folder = list_bronze_partitions()[-1]
+    return iter_bronze_chunks(latest_folder, chunk_size)
 
+
+def clean_encounters(df, seen_ids=None, tenant=TENANT, ehr_source=EHR_SOURCE):
+    """
+    Apply the silver rules to one frame, without logging.
+    When seen_ids is given, encounter_ids already in it are dropped and the
+    new ones are added, so duplicates are removed across chunks too.
+    Rows are stamped with the tenant and EHR source they were read for.
+    Returns (clean_df, completed_count).
+    """
     # 1. Filter only completed encounters (as per technical document)
     df_completed = df[df["status"] == "completed"].copy()
-    print(f"[TRANSFORM] Completed encounters: {len(df_completed)}")
-    print(f"[TRANSFORM] Removed cancelled/pending: {len(df) - len(df_completed)}")
+    completed_count = len(df_completed)
 
     # 2. Drop duplicates based on encounter_id
     df_completed = df_completed.drop_duplicates(subset=["encounter_id"])
+    if seen_ids is not None:
+        df_completed = df_completed[~df_completed["encounter_id"].isin(seen_ids)]
+        seen_ids.update(df_completed["encounter_id"])
 
     # 3. Convert date column to proper format
     df_completed["date_of_service"] = pd.to_datetime(df_completed["date_of_service"])
 
-    # 4. Convert medications list to string for storage
+    # 4. Keep medications as a list — stored as TEXT[] (a comma-joined
+    # string from an older source is split)
     df_completed["medications"] = df_completed["medications"].apply(
-        lambda x: ",".join(x) if isinstance(x, list) else x
+        lambda x: list(x) if isinstance(x, (list, tuple))
+        else (x.split(",") if x else []) if isinstance(x, str) else None
     )
 
     # 5. Convert ingestion_timestamp to datetime
+    # isoformat() drops the fraction when microseconds are 0, so don't let
+    # pandas lock onto the first row's format
     df_completed["ingestion_timestamp"] = pd.to_datetime(
-        df_completed["ingestion_timestamp"]
+        df_completed["ingestion_timestamp"], format="ISO8601"
     )
 
     # 6. Drop rows where critical fields are missing
     df_completed = df_completed.dropna(subset=["encounter_id", "patient_id"])
 
+    # 7. Stamp the source — encounter_ids are only unique within it
+    df_completed["tenant"] = tenant
+    df_completed["ehr_source"] = ehr_source
+
+    return df_completed, completed_count
+
+
+def transform_data(df, tenant=TENANT, ehr_source=EHR_SOURCE):
+    """Clean, validate and transform the data."""
+    print("[TRANSFORM] Applying transformations...")
+
+    with measure("transform_data", tenant=tenant, ehr_source=ehr_source) as step:
+        df_completed, completed_count = clean_encounters(df, tenant=tenant, ehr_source=ehr_source)
+        step.add(rows_in=len(df), rows_out=len(df_completed))
+    print(f"[TRANSFORM] Completed encounters: {completed_count}")
+    print(f"[TRANSFORM] Removed cancelled/pending: {len(df) - completed_count}")
+
     print(f"[TRANSFORM] Final clean records: {len(df_completed)}")
     return df_completed
 
 
+def transform_chunks(chunks, tenant=TENANT, ehr_source=EHR_SOURCE):
+    """
+    Chunked version of transform_data for streaming reads.
+    Same rules, applied one chunk at a time; duplicate encounter_ids are
+    dropped across chunks (first occurrence wins, as in transform_data).
+    Totals are logged once the last chunk has been consumed.
+    """
+    print("[TRANSFORM] Applying transformations (streaming)...")
+    seen_ids = set()
+    total_raw = total_completed = total_clean = 0
+    # Only the cleaning counts as this step — reading the chunks is the
+    # upstream step's time, writing them the consumer's
+    step = StepMetrics("transform_data", tenant=tenant, ehr_source=ehr_source)
+    status = "error"
+
+    try:
+        for df in chunks:
+            with step:
+                df_clean, completed_count = clean_encounters(df, seen_ids, tenant, ehr_source)
+                step.add(rows_in=len(df), rows_out=len(df_clean))
+            total_raw += len(df)
+            total_completed += completed_count
+            total_clean += len(df_clean)
+            yield df_clean
+        status = "ok"
+    except GeneratorExit:
+        # The consumer stopped early (or dropped the generator)
+        status = "ok"
+        raise
+    finally:
+        step.finish(status)
+
+    print(f"[TRANSFORM] Total raw records read: {total_raw}")
+    print(f"[TRANSFORM] Completed encounters: {total_completed}")
+    print(f"[TRANSFORM] Removed cancelled/pending: {total_raw - total_completed}")
+    print(f"[TRANSFORM] Final clean records: {total_clean}")
+
+
 def load_to_silver(df, engine):
-    """Load transformed data into PostgreSQL Silver table."""
+    """
+    Load transformed data into PostgreSQL Silver table.
+    Accepts a DataFrame or an iterable of chunks (e.g. from transform_chunks).
+    """
     print("[TRANSFORM] Loading data into Silver layer (PostgreSQL)...")
 
-    df.to_sql(
-        "silver_encounters",
-        engine,
-        if_exists="replace",
-        index=False,
-        method="multi"
-    )
-    print(f"[TRANSFORM] Successfully loaded {len(df)} records into silver_encounters table")
+    with measure("load_to_silver") as step:
+        if SWAP_LOADS:
+            # Readers keep the previous silver until the new one is swapped in
+            stats = swap_load(df, "silver_encounters", engine)
+        else:
+            stats = bulk_load(
+                df, "silver_encounters", engine, if_exists="replace",
+                before_chunk=partition_hook("silver_encounters")
+            )
+        step.add(rows_in=stats["rows"], rows_out=stats["rows"])
+    # Silver was rebuilt without the dedup index — start it over
+    reset_index()
+    print(f"[TRANSFORM] Successfully loaded {stats['rows']} records into silver_encounters table")
+    print(f"[TRANSFORM] Load method: {stats['method']} — "
+          f"{stats['seconds']}s, {stats['rows_per_sec']} rows/sec")
+    return stats
+
+
+def merge_clean_chunk(conn, df_clean, index=None):
+    """
+    Merge one clean chunk into silver inside the caller's transaction.
+    With a dedup index, unchanged re-sent encounters are dropped before
+    they reach the database, new ones are upserted and changed ones go
+    through an UPDATE on the source key (which also moves a row whose
+    date_of_service changed). Returns the number of rows written.
+    """
+    if index is None:
+        new_rows, changed_rows = df_clean, df_clean.iloc[0:0]
+    else:
+        new_rows, changed_rows = index.split(df_clean)
+    written = 0
+    if not new_rows.empty:
+        ensure_partitions(conn, "silver_encounters", new_rows["date_of_service"])
+        written += upsert_dataframe(
+            conn, new_rows, "silver_encounters",
+            key_columns=table_key("silver_encounters"),
+            version_column="ingestion_timestamp",
+            row_key=TABLE_KEYS["silver_encounters"]
+        )
+    if not changed_rows.empty:
+        ensure_partitions(conn, "silver_encounters", changed_rows["date_of_service"])
+        written += update_dataframe(
+            conn, changed_rows, "silver_encounters",
+            key_columns=TABLE_KEYS["silver_encounters"],
+            version_column="ingestion_timestamp"
+        )
+    return written
+
+
+def load_incremental_to_silver(engine):
+    """
+    Incremental silver load driven by a per-source high-water mark.
+
+    - Only bronze partitions newer than the watermark are read, in chunks
+    - Records are merged with INSERT ... ON CONFLICT (key) DO UPDATE,
+      where a newer ingestion_timestamp wins
+    - The watermark advances in the same transaction as the merge
+    So load time scales with the daily delta, not with the silver table size.
+    """
+    create_watermark_table(engine)
+    create_processed_partitions_table(engine)
+    last_partition, last_ingestion_ts = get_watermark(engine)
+    print(f"[TRANSFORM] Incremental load for {SOURCE_KEY}")
+    print(f"[TRANSFORM] Watermark: partition={last_partition}, "
+          f"ingestion_timestamp={last_ingestion_ts}")
+
+    # Empty partitions are pruned from the catalog without opening them
+    new_partitions = list_bronze_partitions(after=last_partition, non_empty=True)
+    if not new_partitions:
+        print("[TRANSFORM] No new Bronze partitions since last watermark")
+        return None
+    print(f"[TRANSFORM] New Bronze partitions: {len(new_partitions)}")
+
+    # Newest partition first, so cross-chunk dedup keeps the latest version
+    def iter_new_chunks():
+        for partition in reversed(new_partitions):
+            yield from iter_bronze_chunks(partition)
+
+    merged = 0
+    max_ingestion_ts = last_ingestion_ts
+    with measure("merge_to_silver") as step, engine.begin() as conn:
+        index = open_dedup_index(conn, SOURCE_KEY)
+        for df_clean in transform_chunks(iter_new_chunks()):
+            if df_clean.empty:
+                continue
+            merged += merge_clean_chunk(conn, df_clean, index)
+            step.add(rows_in=len(df_clean))
+            chunk_max = df_clean["ingestion_timestamp"].max()
+            if max_ingestion_ts is None or chunk_max > max_ingestion_ts:
+                max_ingestion_ts = chunk_max
+        set_watermark(conn, new_partitions[-1], max_ingestion_ts)
+        for partition in new_partitions:
+            mark_partition_processed(conn, partition)
+        step.add(rows_out=merged)
+    set_partition_status(TENANT, EHR_SOURCE, new_partitions)
+    if index:
+        index.commit()
+        index.log_counts()
+    print(f"[TRANSFORM] Merged {merged} records into silver_encounters table")
+    print(f"[TRANSFORM] Watermark advanced to partition {new_partitions[-1]}")
+    return merged
+
+
+
+def merge_chunks_to_silver(engine, clean_chunks, partition, tenant=TENANT, ehr_source=EHR_SOURCE):
+    """
+    Merge cleaned chunks of one bronze partition into silver in a single
+    transaction: rows are merged on the (tenant, ehr_source, encounter_id)
+    key with the newer ingestion_timestamp winning (see merge_clean_chunk),
+    and the partition is recorded (and the watermark advanced) in the same
+    transaction.
+    Returns the number of rows merged.
+    """
+    key = source_key(tenant, ehr_source)
+    merged = 0
+    max_ingestion_ts = None
+    with measure("merge_to_silver", tenant=tenant, ehr_source=ehr_source) as step, \
+            engine.begin() as conn:
+        index = open_dedup_index(conn, key)
+        for df_clean in clean_chunks:
+            if df_clean.empty:
+                continue
+            merged += merge_clean_chunk(conn, df_clean, index)
+            step.add(rows_in=len(df_clean))
+            chunk_max = df_clean["ingestion_timestamp"].max()
+            if max_ingestion_ts is None or chunk_max > max_ingestion_ts:
+                max_ingestion_ts = chunk_max
+        set_watermark(conn, partition, max_ingestion_ts, source_key=key)
+        mark_partition_processed(conn, partition, merged, source_key=key)
+        step.add(rows_out=merged)
+    set_partition_status(tenant, ehr_source, [partition])
+    if index:
+        index.commit()
+        index.log_counts()
+    print(f"[TRANSFORM] Merged {merged} records into silver_encounters table")
+    return merged
+
+
+def load_partition_to_silver(engine, partition_path, tenant=TENANT, ehr_source=EHR_SOURCE):
+    """
+    Merge exactly one bronze partition of one tenant's EHR source into silver.
+
+    The partition is named by path (the orchestrator passes the folder its
+    extract wrote), never picked as "latest", so concurrent runs for other
+    sources or intervals can't swap it out. Running it again for the same
+    folder leaves silver unchanged (see merge_chunks_to_silver), so retries
+    only redo this partition.
+    """
+    partition = os.path.basename(os.path.normpath(partition_path))
+    print(f"[TRANSFORM] Partition-scoped load of {source_key(tenant, ehr_source)} @ {partition}")
+    with metrics_context(tenant=tenant, ehr_source=ehr_source):
+        clean_chunks = transform_chunks(
+            iter_bronze_path_chunks(partition_path), tenant, ehr_source
+        )
+        return merge_chunks_to_silver(engine, clean_chunks, partition, tenant, ehr_source)
 
 
 if __name__ == "__main__":
@@ -123,19 +448,27 @@ if __name__ == "__main__":
     print("=" * 60)
 
     # Step 1: Connect to database
-    engine = get_db_engine()
+    engine = get_engine()
 
     # Step 2: Create silver table
     create_silver_table(engine)
 
-    # Step 3: Read from Bronze
-    df_raw = read_latest_bronze_file()
+    if TRANSFORM_ENGINE == "postgres":
+        # Steps 3-5: Stage raw lines and transform inside Postgres
+        from services.transform.elt_encounters import run_in_database_transform
+        run_in_database_transform(engine)
+    elif SILVER_LOAD_MODE == "incremental":
+        # Steps 3-5: Read new partitions, transform and merge into Silver
+        load_incremental_to_silver(engine)
+    else:
+        # Step 3: Stream the latest Bronze file in chunks
+        raw_chunks = iter_latest_bronze_chunks()
 
-    # Step 4: Transform
-    df_clean = transform_data(df_raw)
+        # Step 4: Transform each chunk
+        clean_chunks = transform_chunks(raw_chunks)
 
-    # Step 5: Load to Silver
-    load_to_silver(df_clean, engine)
+        # Step 5: Load to Silver as the chunks arrive
+        load_to_silver(clean_chunks, engine)
 
     print("\n" + "=" * 60)
     print("STAGE 2 — SILVER LAYER LOAD COMPLETED SUCCESSFULLY!")
@@ -0,0 +1,51 @@
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+# Add project root to path so the tests import services.* like the stages do
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from services.db import engine as db_engine
+
+
+def database_url(name):
+    return (f"postgresql://{db_engine.DB_USER}:{db_engine.DB_PASSWORD}@"
+            f"{db_engine.DB_HOST}:{db_engine.DB_PORT}/{name}")
+
+
+@pytest.fixture(scope="session")
+def scratch_database():
+    """
+    scratch_database(name) creates an empty database (never the pipeline's
+    own) and returns an engine on it; every one is dropped once the session
+    ends. Tests using it skip when no Postgres is reachable.
+    """
+    maintenance = create_engine(database_url("postgres"), isolation_level="AUTOCOMMIT")
+    created = []
+
+    def create(name):
+        for other, engine in created:
+            if other == name:
+                engine.dispose()
+        try:
+            with maintenance.connect() as conn:
+                conn.execute(text(f'DROP DATABASE IF EXISTS "{name}"'))
+                conn.execute(text(f'CREATE DATABASE "{name}"'))
+        except OperationalError as e:
+            pytest.skip(f"no database reachable: {e.orig}")
+        engine = create_engine(database_url(name))
+        created.append((name, engine))
+        return engine
+
+    yield create
+
+    for _, engine in created:
+        engine.dispose()
+    if created:
+        with maintenance.connect() as conn:
+            for name in {name for name, _ in created}:
+                conn.execute(text(f'DROP DATABASE IF EXISTS "{name}"'))
+    maintenance.dispose()
@@ -0,0 +1,99 @@
+import os
+
+import pytest
+
+from services.bronze import bronze_catalog
+from services.bronze.bronze_catalog import (
+    STATUS_PROCESSED, catalog_partitions, register_partition, scan_partition_stats,
+    set_partition_status
+)
+from services.bronze.bronze_files import write_bronze_file
+
+TENANT, SOURCE = "zivian", "athenahealth"
+
+
+@pytest.fixture(autouse=True)
+def bronze_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(bronze_catalog, "BRONZE_BASE_PATH", str(tmp_path))
+    monkeypatch.setattr(bronze_catalog, "BRONZE_CATALOG_PATH", str(tmp_path / "_catalog.sqlite"))
+    return tmp_path
+
+
+def write_partition(bronze_dir, partition, dates):
+    path = os.path.join(
+        bronze_catalog.source_partitions_path(TENANT, SOURCE), partition
+    )
+    os.makedirs(path)
+    records = [
+        {"encounter_id": f"E{i}", "date_of_service": day,
+         "ingestion_timestamp": f"{partition}T00:00:00"}
+        for i, day in enumerate(dates)
+    ]
+    write_bronze_file(records, path, "ndjson", "none")
+    return path
+
+
+@pytest.fixture
+def partitions(bronze_dir):
+    layout = {
+        "2026-10-01": ["2026-01-10", "2026-02-20"],
+        "2026-10-02": [],
+        "2026-10-03": ["2026-05-01", "2026-05-31"],
+        "2026-10-04": ["2026-09-15"],
+    }
+    for partition, dates in layout.items():
+        path = write_partition(bronze_dir, partition, dates)
+        register_partition(path, TENANT, SOURCE, scan_partition_stats(path))
+    return list(layout)
+
+
+def names(entries):
+    return [entry["partition"] for entry in entries]
+
+
+def test_all_partitions_oldest_first(partitions):
+    assert names(catalog_partitions(TENANT, SOURCE)) == partitions
+
+
+def test_after_prunes_up_to_the_watermark(partitions):
+    assert names(catalog_partitions(TENANT, SOURCE, after="2026-10-02")) == [
+        "2026-10-03", "2026-10-04"
+    ]
+
+
+def test_non_empty_skips_partitions_without_records(partitions):
+    assert "2026-10-02" not in names(catalog_partitions(TENANT, SOURCE, non_empty=True))
+
+
+def test_service_range_keeps_overlapping_partitions(partitions):
+    entries = catalog_partitions(
+        TENANT, SOURCE, service_from="2026-02-01", service_to="2026-05-01"
+    )
+    assert names(entries) == ["2026-10-01", "2026-10-03"]
+
+
+def test_service_range_bounds_are_inclusive(partitions):
+    assert names(catalog_partitions(TENANT, SOURCE, service_from="2026-09-15")) == ["2026-10-04"]
+    assert names(catalog_partitions(TENANT, SOURCE, service_to="2026-01-10")) == ["2026-10-01"]
+
+
+def test_statuses(partitions):
+    set_partition_status(TENANT, SOURCE, ["2026-10-01", "2026-10-03"], STATUS_PROCESSED)
+    entries = catalog_partitions(TENANT, SOURCE, statuses=["registered"])
+    assert names(entries) == ["2026-10-02", "2026-10-04"]
+
+
+def test_other_sources_are_not_listed(partitions):
+    assert catalog_partitions(TENANT, "epic") == []
+
+
+def test_uncatalogued_folders_are_synced_once(bronze_dir):
+    write_partition(bronze_dir, "2026-09-30", ["2026-03-03"])
+    entries = catalog_partitions(TENANT, SOURCE)
+    assert names(entries) == ["2026-09-30"]
+    assert entries[0]["record_count"] == 1
+    assert entries[0]["min_date_of_service"] == "2026-03-03"
+
+    # Later folders are picked up by register_partition, not by listing
+    write_partition(bronze_dir, "2026-10-01", ["2026-03-04"])
+    assert names(catalog_partitions(TENANT, SOURCE)) == ["2026-09-30"]
@@ -0,0 +1,89 @@
+import json
+import sqlite3
+from contextlib import closing
+
+import pytest
+
+from services.bronze import bronze_catalog, bronze_files
+from services.bronze.bronze_catalog import (
+    catalog_partitions, open_catalog, record_bad_lines, register_partition,
+    scan_partition_stats
+)
+from services.bronze.bronze_files import iter_bronze_file
+from services.metrics.stage_metrics import StepMetrics
+
+TENANT, SOURCE = "zivian", "athenahealth"
+
+
+@pytest.fixture(autouse=True)
+def bronze_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(bronze_catalog, "BRONZE_BASE_PATH", str(tmp_path))
+    monkeypatch.setattr(bronze_catalog, "BRONZE_CATALOG_PATH", str(tmp_path / "_catalog.sqlite"))
+    monkeypatch.setattr(bronze_files, "BRONZE_MAX_BAD_LINES", 0)
+    return tmp_path
+
+
+@pytest.fixture
+def partition_path(bronze_dir):
+    """A partition whose second line was cut off by an interrupted write."""
+    path = bronze_dir / TENANT / "dev" / SOURCE / "encounters" / "2026-10-01"
+    path.mkdir(parents=True)
+    lines = [
+        json.dumps({"encounter_id": "E1", "date_of_service": "2026-09-01"}),
+        '{"encounter_id": "E2", "notes": "}',
+        json.dumps({"encounter_id": "E3", "date_of_service": "2026-09-02"}),
+    ]
+    (path / "encounters_raw.ndjson").write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+def read_ids(file_path, bad_lines=None):
+    chunks = iter_bronze_file(file_path, 10, bad_lines=bad_lines)
+    return [i for chunk in chunks for i in chunk["encounter_id"]]
+
+
+def test_a_malformed_line_fails_the_read_by_default(partition_path):
+    with pytest.raises(ValueError, match="line 2"):
+        read_ids(partition_path + "/encounters_raw.ndjson")
+
+
+@pytest.mark.parametrize("line", ["[1, 2]", '"E4"', '{"score": NaN}'])
+def test_non_object_lines_are_malformed(bronze_dir, line):
+    file_path = bronze_dir / "encounters_raw.ndjson"
+    file_path.write_text(line + "\n")
+    with pytest.raises(ValueError):
+        read_ids(str(file_path))
+
+
+def test_bad_lines_within_the_threshold_are_counted(partition_path, monkeypatch):
+    monkeypatch.setattr(bronze_files, "BRONZE_MAX_BAD_LINES", 1)
+    bad_lines = {}
+    assert read_ids(partition_path + "/encounters_raw.ndjson", bad_lines) == ["E1", "E3"]
+    assert bad_lines == {"bad_lines": 1}
+
+
+def test_bad_lines_are_credited_to_the_active_step(partition_path, monkeypatch):
+    monkeypatch.setattr(bronze_files, "BRONZE_MAX_BAD_LINES", 1)
+    step = StepMetrics("read_bronze_file")
+    with step:
+        read_ids(partition_path + "/encounters_raw.ndjson")
+    assert step.record()["bad_lines"] == 1
+
+
+def test_bad_lines_are_recorded_in_the_catalog(partition_path, monkeypatch):
+    monkeypatch.setattr(bronze_files, "BRONZE_MAX_BAD_LINES", 1)
+    register_partition(partition_path, TENANT, SOURCE, scan_partition_stats(partition_path))
+    [entry] = catalog_partitions(TENANT, SOURCE)
+    assert (entry["record_count"], entry["bad_lines"]) == (2, 1)
+
+    record_bad_lines(partition_path, 0)
+    assert catalog_partitions(TENANT, SOURCE)[0]["bad_lines"] == 0
+
+
+def test_catalogs_without_bad_lines_are_migrated(bronze_dir):
+    conn = sqlite3.connect(bronze_catalog.BRONZE_CATALOG_PATH)
+    conn.execute("CREATE TABLE bronze_partitions (tenant TEXT, partition TEXT)")
+    conn.close()
+    with closing(open_catalog()) as conn:
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(bronze_partitions)")}
+    assert "bad_lines" in columns
@@ -0,0 +1,100 @@
+import struct
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+from services.db import schema
+from services.db.bulk_load import NULL_FIELD, _array_literal, _encode_text_array, upsert_dataframe
+from services.db.schema import TABLE_KEYS, ensure_partitions, ensure_table, table_key
+
+
+def test_encode_text_array_header_and_elements():
+    encoded = _encode_text_array(["NDC-1", "NDC-22"])
+    # ndim 1, no nulls, text oid, one dimension of 2 elements starting at 1
+    assert encoded[:20] == struct.pack("!iiiii", 1, 0, 25, 2, 1)
+    assert encoded[20:] == (
+        struct.pack("!i", 5) + b"NDC-1" + struct.pack("!i", 6) + b"NDC-22"
+    )
+
+
+def test_encode_text_array_empty():
+    assert _encode_text_array([]) == struct.pack("!iii", 0, 0, 25)
+    assert _encode_text_array("") == struct.pack("!iii", 0, 0, 25)
+
+
+def test_encode_text_array_null_element_sets_flag():
+    encoded = _encode_text_array(["a", None])
+    assert struct.unpack("!iiiii", encoded[:20]) == (1, 1, 25, 2, 1)
+    assert encoded.endswith(NULL_FIELD)
+
+
+def test_encode_text_array_accepts_numpy_and_legacy_strings():
+    assert _encode_text_array(np.array(["a", "b"])) == _encode_text_array(["a", "b"])
+    assert _encode_text_array("a,b") == _encode_text_array(["a", "b"])
+
+
+def test_encode_text_array_utf8_length_in_bytes():
+    encoded = _encode_text_array(["é"])
+    assert encoded[20:] == struct.pack("!i", 2) + "é".encode("utf-8")
+
+
+def test_array_literal_quotes_every_element():
+    assert _array_literal(["NDC-1", "NDC-2"]) == '{"NDC-1","NDC-2"}'
+    assert _array_literal([]) == "{}"
+
+
+def test_array_literal_escapes_quotes_and_backslashes():
+    assert _array_literal(['say "hi"', "back\\slash"]) == '{"say \\"hi\\"","back\\\\slash"}'
+
+
+def test_array_literal_nulls():
+    assert _array_literal(None) is None
+    assert _array_literal(["a", None]) == '{"a",NULL}'
+
+
+def test_array_literal_keeps_commas_and_braces_inside_elements():
+    assert _array_literal(np.array(["a,b", "{c}"])) == '{"a,b","{c}"}'
+
+
+@pytest.fixture
+def partitioned_silver(scratch_database, monkeypatch):
+    monkeypatch.setattr(schema, "TABLE_PARTITIONING", "month")
+    engine = scratch_database("zivian_merge_test")
+    ensure_table(engine, "silver_encounters")
+    return engine
+
+
+def merge(engine, day, ingested, notes):
+    df = pd.DataFrame([{
+        "tenant": "zivian", "ehr_source": "athenahealth", "encounter_id": "ENC-1",
+        "patient_id": "PAT-1", "date_of_service": pd.Timestamp(day).date(),
+        "status": "completed", "medications": ["NDC-1"], "clinical_notes": notes,
+        "ingestion_timestamp": pd.Timestamp(ingested),
+    }])
+    with engine.begin() as conn:
+        ensure_partitions(conn, "silver_encounters", df["date_of_service"])
+        upsert_dataframe(
+            conn, df, "silver_encounters", key_columns=table_key("silver_encounters"),
+            version_column="ingestion_timestamp", row_key=TABLE_KEYS["silver_encounters"]
+        )
+
+
+def silver_rows(engine):
+    with engine.connect() as conn:
+        return [tuple(row) for row in conn.execute(text(
+            "SELECT CAST(date_of_service AS TEXT), clinical_notes FROM silver_encounters"
+        ))]
+
+
+def test_upsert_moves_a_row_whose_date_changed(partitioned_silver):
+    merge(partitioned_silver, "2026-01-31", "2026-02-01", "first")
+    merge(partitioned_silver, "2026-02-03", "2026-02-04", "rescheduled")
+    assert silver_rows(partitioned_silver) == [("2026-02-03", "rescheduled")]
+
+
+def test_upsert_keeps_a_newer_row_on_another_date(partitioned_silver):
+    merge(partitioned_silver, "2026-02-03", "2026-02-04", "rescheduled")
+    merge(partitioned_silver, "2026-01-31", "2026-02-01", "late replay")
+    assert silver_rows(partitioned_silver) == [("2026-02-03", "rescheduled")]
@@ -0,0 +1,83 @@
+from datetime import date
+
+import pytest
+
+from services.dashboard import (
+    CHARTS_MAX_PAGE_SIZE, CHARTS_PAGE_SIZE, SEARCH_MAX_QUERY_LENGTH,
+    parse_chart_query, parse_search_query
+)
+
+
+def test_chart_query_defaults():
+    assert parse_chart_query({}) == ({}, None, CHARTS_PAGE_SIZE)
+
+
+def test_chart_query_filters():
+    filters, _, _ = parse_chart_query({
+        "state": " CA ", "physician_id": "PHY-001", "date_from": "2026-01-01",
+        "date_to": "2026-03-31", "medication": "NDC-0069-0001", "unknown": "x",
+    })
+    assert filters == {
+        "state": "CA", "physician_id": "PHY-001", "date_from": date(2026, 1, 1),
+        "date_to": date(2026, 3, 31), "medication": "NDC-0069-0001",
+    }
+
+
+def test_chart_query_blank_filters_are_ignored():
+    filters, _, _ = parse_chart_query({"state": "  ", "medication": ""})
+    assert filters == {}
+
+
+def test_chart_query_cursor():
+    _, cursor, limit = parse_chart_query({
+        "cursor": "2026-03-01|ENC-00042|zivian|athenahealth", "limit": "10"
+    })
+    assert cursor == (date(2026, 3, 1), "ENC-00042", "zivian", "athenahealth")
+    assert limit == 10
+
+
+def test_chart_query_cursor_without_date():
+    _, cursor, _ = parse_chart_query({"cursor": "|ENC-00042|zivian|athenahealth"})
+    assert cursor == (None, "ENC-00042", "zivian", "athenahealth")
+
+
+@pytest.mark.parametrize("args", [
+    {"cursor": "2026-03-01|ENC-00042|zivian"},
+    {"cursor": "2026-03-01||zivian|athenahealth"},
+    {"cursor": "yesterday|ENC-00042|zivian|athenahealth"},
+    {"date_from": "01/02/2026"},
+    {"limit": "0"},
+    {"limit": str(CHARTS_MAX_PAGE_SIZE + 1)},
+    {"limit": "ten"},
+])
+def test_chart_query_rejects(args):
+    with pytest.raises(ValueError):
+        parse_chart_query(args)
+
+
+def test_search_query():
+    terms, filters, cursor, limit = parse_search_query({
+        "q": "  chest pain ", "state": "NY", "limit": "25"
+    })
+    assert (terms, filters, cursor, limit) == ("chest pain", {"state": "NY"}, None, 25)
+
+
+def test_search_query_cursor():
+    _, _, cursor, _ = parse_search_query({
+        "q": "pain", "cursor": "0.0607927|ENC-00042|zivian|athenahealth"
+    })
+    assert cursor == (0.0607927, "ENC-00042", "zivian", "athenahealth")
+
+
+@pytest.mark.parametrize("args, message", [
+    ({}, "q is required"),
+    ({"q": "   "}, "q is required"),
+    ({"q": "x" * (SEARCH_MAX_QUERY_LENGTH + 1)}, "at most"),
+    ({"q": "pain", "cursor": "|ENC-00042|zivian|athenahealth"}, "invalid cursor"),
+    ({"q": "pain", "cursor": "0.5|ENC-00042|zivian"}, "invalid cursor"),
+    ({"q": "pain", "cursor": "high|ENC-00042|zivian|athenahealth"}, None),
+    ({"q": "pain", "limit": "0"}, "limit"),
+])
+def test_search_query_rejects(args, message):
+    with pytest.raises(ValueError, match=message):
+        parse_search_query(args)
@@ -0,0 +1,98 @@
+import pandas as pd
+import pytest
+
+from services.transform import dedup_index
+from services.transform.dedup_index import DedupIndex
+
+
+def encounters(ids, notes="note", ingested="2026-10-01T00:00:00"):
+    return pd.DataFrame({
+        "encounter_id": ids,
+        "patient_id": "PAT-0001",
+        "app_id": "APP-001",
+        "physician_id": "PHY-001",
+        "date_of_service": pd.Timestamp("2026-09-01"),
+        "state": "CA",
+        "status": "completed",
+        "medications": [["NDC-0069-0001"] for _ in ids],
+        "clinical_notes": notes,
+        "ingestion_timestamp": pd.Timestamp(ingested),
+    })
+
+
+@pytest.fixture(autouse=True)
+def small_bloom(monkeypatch):
+    monkeypatch.setattr(dedup_index, "DEDUP_BLOOM_CAPACITY", 1000)
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    return str(tmp_path / "dedup.sqlite")
+
+
+def loaded_index(index_path, df, epoch="1"):
+    index = DedupIndex("zivian/dev/athenahealth/encounters", epoch, index_path)
+    index.split(df)
+    index.commit()
+    return DedupIndex("zivian/dev/athenahealth/encounters", epoch, index_path)
+
+
+def test_split_empty_index_everything_is_new(index_path):
+    index = DedupIndex("src", "1", index_path)
+    new, changed = index.split(encounters(["E1", "E2"]))
+    assert list(new["encounter_id"]) == ["E1", "E2"]
+    assert changed.empty
+    assert index.counts == {"new": 2, "changed": 0, "unchanged": 0, "stale": 0}
+
+
+def test_split_drops_unchanged_resend(index_path):
+    index = loaded_index(index_path, encounters(["E1", "E2"]))
+    new, changed = index.split(encounters(["E1", "E2"], ingested="2026-10-02T00:00:00"))
+    assert new.empty and changed.empty
+    assert index.counts["unchanged"] == 2
+
+
+def test_split_returns_changed_content(index_path):
+    index = loaded_index(index_path, encounters(["E1", "E2"]))
+    df = encounters(["E1", "E2", "E3"], ingested="2026-10-02T00:00:00")
+    df.loc[df["encounter_id"] == "E2", "clinical_notes"] = "amended note"
+    new, changed = index.split(df)
+    assert list(new["encounter_id"]) == ["E3"]
+    assert list(changed["encounter_id"]) == ["E2"]
+
+
+def test_split_medications_order_is_content(index_path):
+    index = loaded_index(index_path, encounters(["E1"]))
+    df = encounters(["E1"], ingested="2026-10-02T00:00:00")
+    df["medications"] = [["NDC-0069-0001", "NDC-0069-0002"]]
+    _, changed = index.split(df)
+    assert list(changed["encounter_id"]) == ["E1"]
+
+
+def test_split_drops_stale_versions(index_path):
+    index = loaded_index(index_path, encounters(["E1"], ingested="2026-10-05T00:00:00"))
+    new, changed = index.split(encounters(["E1"], notes="older", ingested="2026-10-01T00:00:00"))
+    assert new.empty and changed.empty
+    assert index.counts["stale"] == 1
+
+
+def test_split_is_not_persisted_before_commit(index_path):
+    index = DedupIndex("src", "1", index_path)
+    index.split(encounters(["E1"]))
+    new, _ = DedupIndex("src", "1", index_path).split(encounters(["E1"]))
+    assert list(new["encounter_id"]) == ["E1"]
+
+
+def test_new_silver_epoch_discards_the_index(index_path):
+    loaded_index(index_path, encounters(["E1"]))
+    index = DedupIndex("zivian/dev/athenahealth/encounters", "2", index_path)
+    new, _ = index.split(encounters(["E1"]))
+    assert list(new["encounter_id"]) == ["E1"]
+
+
+def test_bloom_filter_grows_past_capacity(index_path):
+    ids = [f"E{i}" for i in range(2500)]
+    index = loaded_index(index_path, encounters(ids))
+    assert index.capacity >= 2500
+    new, changed = index.split(encounters(ids, ingested="2026-10-02T00:00:00"))
+    assert new.empty and changed.empty
@@ -0,0 +1,41 @@
+import json
+
+import pytest
+
+from services.bronze import bronze_files
+from services.transform import elt_encounters
+
+
+class RecordingCursor:
+    def __init__(self):
+        self.lines = []
+
+    def copy_expert(self, sql, payload):
+        self.lines += payload.read().decode("utf-8").splitlines()
+
+
+@pytest.fixture
+def file_path(tmp_path, monkeypatch):
+    """A bronze file whose second line was cut off right after a brace."""
+    monkeypatch.setattr(bronze_files, "BRONZE_MAX_BAD_LINES", 0)
+    lines = [
+        json.dumps({"encounter_id": "E1", "notes": "ok"}),
+        '{"encounter_id": "E2", "notes": "{dose: 2}',
+        json.dumps({"encounter_id": "E3", "notes": "ok"}),
+    ]
+    path = tmp_path / "encounters_raw.ndjson"
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+def test_a_truncated_line_ending_in_a_brace_fails_the_load(file_path):
+    with pytest.raises(ValueError, match="line 2"):
+        elt_encounters._copy_file_lines(RecordingCursor(), file_path, 10, {})
+
+
+def test_tolerated_bad_lines_are_not_staged(file_path, monkeypatch):
+    monkeypatch.setattr(bronze_files, "BRONZE_MAX_BAD_LINES", 1)
+    cursor, bad_lines = RecordingCursor(), {}
+    assert elt_encounters._copy_file_lines(cursor, file_path, 2, bad_lines) == 2
+    assert [json.loads(line)["encounter_id"] for line in cursor.lines] == ["E1", "E3"]
+    assert bad_lines == {"bad_lines": 1}
@@ -0,0 +1,57 @@
+import os
+
+import pytest
+from sqlalchemy import text
+
+from services.db.schema import check_query_plans, ensure_table, review_queries
+
+# Scratch database the plan checks build their gold table in — created
+# (and dropped) by the test
+PLAN_TEST_DB_NAME = os.getenv("PLAN_TEST_DB_NAME", "zivian_plan_test")
+PLAN_TEST_ROWS = 20000
+
+# Generated-like gold: ~10% of patients sampled, each of the 5 NDCs on ~40%
+# of charts, 8 states, dates over the last two months, a few matching notes
+SEED_GOLD_SQL = """
+    INSERT INTO gold_encounters (
+        tenant, ehr_source, encounter_id, patient_id, app_id, physician_id,
+        date_of_service, state, status, medications, clinical_notes,
+        ingestion_timestamp, is_sampled, sampling_reason
+    )
+    SELECT
+        'zivian', 'athenahealth', 'ENC-' || lpad(i::text, 6, '0'),
+        'PAT-' || lpad((h % 500)::text, 4, '0'), 'APP-001',
+        'PHY-' || lpad((h % 100)::text, 3, '0'),
+        CURRENT_DATE - (h % 60),
+        (ARRAY['AZ', 'CA', 'FL', 'GA', 'IL', 'NY', 'TX', 'WA'])[h % 8 + 1],
+        'completed',
+        (ARRAY[
+            'NDC-0069-000' || (m % 5 + 1),
+            'NDC-0069-000' || ((m + 2) % 5 + 1),
+            'NDC-0069-000' || ((m + 4) % 5 + 1)
+        ])[1:m % 3 + 1],
+        CASE WHEN h % 50 = 0 THEN 'Patient reports chest pain on exertion'
+             ELSE 'Routine follow-up visit ' || i END,
+        NOW(),
+        abs(hashtext('PAT-' || (h % 500))) % 10 = 0,
+        'deterministic_10pct'
+    FROM (
+        SELECT i, abs(hashtext('h' || i)) AS h, abs(hashtext('m' || i)) AS m
+        FROM generate_series(1, :rows) AS i
+    ) AS seed
+"""
+
+
+@pytest.fixture(scope="module")
+def plan_engine(scratch_database):
+    engine = scratch_database(PLAN_TEST_DB_NAME)
+    ensure_table(engine, "gold_encounters")
+    with engine.begin() as conn:
+        conn.execute(text(SEED_GOLD_SQL), {"rows": PLAN_TEST_ROWS})
+        conn.execute(text("ANALYZE gold_encounters"))
+    return engine
+
+
+@pytest.mark.parametrize("query", review_queries(), ids=lambda query: query[0])
+def test_review_query_uses_its_index(plan_engine, query):
+    assert check_query_plans(plan_engine, [query]) == []
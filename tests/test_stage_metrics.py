@@ -0,0 +1,59 @@
+import pandas as pd
+import pytest
+
+from services.metrics import stage_metrics
+from services.metrics.stage_metrics import StepMetrics
+from services.sampling.sampling_encounters import sample_chunks
+
+
+@pytest.fixture
+def emitted(tmp_path, monkeypatch):
+    records = []
+    monkeypatch.setattr(stage_metrics, "METRICS_ENABLED", True)
+    monkeypatch.setattr(stage_metrics, "METRICS_PROFILE", {"cprofile"})
+    monkeypatch.setattr(stage_metrics, "METRICS_PROFILE_STEPS", set())
+    monkeypatch.setattr(stage_metrics, "METRICS_PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(stage_metrics, "emit", records.append)
+    return records
+
+
+def silver_chunks(count):
+    for i in range(count):
+        yield pd.DataFrame({"patient_id": [f"PAT-{i:04d}"]})
+
+
+def profiling_free():
+    if not stage_metrics._profiling.acquire(blocking=False):
+        return False
+    stage_metrics._profiling.release()
+    return True
+
+
+def test_a_step_takes_the_profiling_lock_on_first_activation(emitted):
+    step = StepMetrics("deterministic_sampling")
+    assert profiling_free()
+    with step:
+        assert not profiling_free()
+    step.finish()
+    assert profiling_free()
+
+
+def test_a_consumer_that_stops_early_still_emits(emitted):
+    chunks = sample_chunks(silver_chunks(3), 0.5)
+    next(chunks)
+    assert not profiling_free()
+    chunks.close()
+    [record] = emitted
+    assert (record["step"], record["status"], record["rows_out"]) == ("deterministic_sampling", "ok", 1)
+    assert profiling_free()
+
+
+def test_a_failing_source_emits_an_error(emitted):
+    def failing():
+        yield from silver_chunks(1)
+        raise RuntimeError("silver read failed")
+
+    with pytest.raises(RuntimeError):
+        list(sample_chunks(failing(), 0.5))
+    assert [r["status"] for r in emitted] == ["error"]
+    assert profiling_free()